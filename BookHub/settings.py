@@ -35,7 +35,15 @@ INSTALLED_APPS = [
 ]
 
 CRONJOBS = [
-    ('*/10 * * * *', 'BookManager.management.commands.cleanup_incomplete_users.Command'),
+    ('*/10 * * * *', 'django.core.management.call_command', ['cleanup_incomplete_users']),
+    ('*/10 * * * *', 'django.core.management.call_command', ['purge_expired_otp_tokens']),
+    ('0 * * * *', 'django.core.management.call_command', ['refresh_site_stats']),
+    ('30 3 * * *', 'django.core.management.call_command', ['repair_counters']),
+    ('*/15 * * * *', 'django.core.management.call_command', ['build_book_neighbors']),
+    ('5 * * * *', 'django.core.management.call_command', ['build_content_index']),
+    ('45 3 * * 0', 'django.core.management.call_command', ['build_content_index', '--full']),
+    ('20 * * * *', 'django.core.management.call_command', ['refresh_books']),
+    ('* * * * *', 'django.core.management.call_command', ['send_queued_email']),
 ]
 
 
@@ -85,6 +93,189 @@ EMAIL_PORT = int(os.getenv('EMAIL_PORT'))
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS').lower() == 'true'
+EMAIL_FILE_PATH = os.getenv('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
+# Seconds before a stuck SMTP call fails, so a claimed outbox batch finishes
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '10'))
+
+# Outgoing mail is queued in OutboundEmail and delivered by send_queued_email
+EMAIL_OUTBOX = {
+    'BATCH_SIZE': int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', '50')),
+    'MAX_ATTEMPTS': int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '5')),
+    'BACKOFF_SECONDS': int(os.getenv('EMAIL_OUTBOX_BACKOFF_SECONDS', '30')),
+    # How long a claimed batch is hidden from other workers while it is sent;
+    # keep it well above BATCH_SIZE times the SMTP timeout
+    'CLAIM_SECONDS': int(os.getenv('EMAIL_OUTBOX_CLAIM_SECONDS', '600')),
+    # Deliver every email right after commit from a background thread, not just
+    # OTP codes (which always are); the worker still retries failures
+    'EAGER': os.getenv('EMAIL_OUTBOX_EAGER', 'False') == 'True',
+}
+
+# Shared cache for all web workers and cron jobs: shelf membership, cached
+# pages, version keys and single-use OTP markers must agree across processes.
+# Uses Redis when REDIS_URL is set, otherwise the database cache table
+# (created by ``manage.py createcachetable``).
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'bookhub_cache',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '50000'))},
+        }
+    }
+
+# Google Books API response cache
+GOOGLE_BOOKS_CACHE = {
+    'MAX_ENTRIES': int(os.getenv('GOOGLE_BOOKS_CACHE_MAX_ENTRIES', '256')),
+    'TTL': int(os.getenv('GOOGLE_BOOKS_CACHE_TTL', '600')),
+    'STALE_TTL': int(os.getenv('GOOGLE_BOOKS_CACHE_STALE_TTL', '3600')),
+    # Optional shared tier: alias of an entry in CACHES, e.g. 'default'
+    'SHARED_ALIAS': os.getenv('GOOGLE_BOOKS_CACHE_ALIAS') or None,
+}
+
+# Google Books HTTP client: per-attempt timeout, pooled connections, retries
+# with jittered backoff, and the circuit breaker that skips the API for
+# BREAKER_RESET seconds after BREAKER_THRESHOLD failed calls. Searches made
+# during a request (home, search) share one INTERACTIVE_DEADLINE in seconds
+# across all attempts; the metadata refresh job keeps the full retries.
+# Requests are counted per quota day in the shared default cache and
+# compared with DAILY_QUOTA on the admin dashboard; counting needs the atomic
+# incr of Redis (REDIS_URL) or memcached and is off on the database cache.
+GOOGLE_BOOKS_API = {
+    'TIMEOUT': float(os.getenv('GOOGLE_BOOKS_TIMEOUT', '10')),
+    'POOL_SIZE': int(os.getenv('GOOGLE_BOOKS_POOL_SIZE', '10')),
+    'RETRIES': int(os.getenv('GOOGLE_BOOKS_RETRIES', '2')),
+    'BACKOFF': float(os.getenv('GOOGLE_BOOKS_BACKOFF', '0.5')),
+    'MAX_BACKOFF': float(os.getenv('GOOGLE_BOOKS_MAX_BACKOFF', '4')),
+    'INTERACTIVE_DEADLINE': float(os.getenv('GOOGLE_BOOKS_INTERACTIVE_DEADLINE', '3')),
+    'BREAKER_THRESHOLD': int(os.getenv('GOOGLE_BOOKS_BREAKER_THRESHOLD', '5')),
+    'BREAKER_RESET': float(os.getenv('GOOGLE_BOOKS_BREAKER_RESET', '30')),
+    'DAILY_QUOTA': int(os.getenv('GOOGLE_BOOKS_DAILY_QUOTA', '1000')),
+    'QUOTA_TIMEZONE': os.getenv('GOOGLE_BOOKS_QUOTA_TIMEZONE', 'America/Los_Angeles'),
+}
+
+# Concurrent multi-page fetching for search(); the API caps a page at 40 results
+GOOGLE_BOOKS_SEARCH = {
+    'MAX_RESULTS': int(os.getenv('GOOGLE_BOOKS_SEARCH_MAX_RESULTS', '120')),
+    'PAGE_SIZE': int(os.getenv('GOOGLE_BOOKS_SEARCH_PAGE_SIZE', '40')),
+    'CONCURRENCY': int(os.getenv('GOOGLE_BOOKS_SEARCH_CONCURRENCY', '4')),
+    'DEADLINE': float(os.getenv('GOOGLE_BOOKS_SEARCH_DEADLINE', '8')),
+}
+
+# Local full-text search: minimum local hits before skipping the Google Books API
+LOCAL_SEARCH_MIN_RESULTS = int(os.getenv('LOCAL_SEARCH_MIN_RESULTS', '12'))
+
+# Book views are buffered in memory and written in batches
+VIEW_COUNT_BUFFER = {
+    'FLUSH_THRESHOLD': int(os.getenv('VIEW_COUNT_FLUSH_THRESHOLD', '50')),
+    'FLUSH_INTERVAL': int(os.getenv('VIEW_COUNT_FLUSH_INTERVAL', '30')),
+}
+
+# Cached per-user shelf membership (favorites, reading list, books read)
+SHELF_CACHE_TTL = int(os.getenv('SHELF_CACHE_TTL', '3600'))
+SHELF_BATCH_MAX_OPERATIONS = int(os.getenv('SHELF_BATCH_MAX_OPERATIONS', '500'))
+
+# One-time codes: 'token' stores OtpToken rows, 'totp' derives codes from a
+# per-user secret and the time step. TOTP replay protection uses the default
+# cache, so use a shared cache backend when running several workers.
+OTP = {
+    'MODE': os.getenv('OTP_MODE', 'token'),
+    'STEP': int(os.getenv('OTP_STEP_SECONDS', '120')),
+    'WINDOW': int(os.getenv('OTP_WINDOW_STEPS', '1')),
+    'EXPIRED_LOOKBACK': int(os.getenv('OTP_EXPIRED_LOOKBACK_STEPS', '15')),
+}
+
+# Signup email domain (MX) validation
+EMAIL_MX_CHECK = {
+    'RESOLVER': os.getenv('EMAIL_MX_RESOLVER', 'BookManager.email_domains.DnsMxResolver'),
+    'TIMEOUT': float(os.getenv('EMAIL_MX_TIMEOUT', '2.0')),
+    'POSITIVE_TTL': int(os.getenv('EMAIL_MX_POSITIVE_TTL', '86400')),
+    'NEGATIVE_TTL': int(os.getenv('EMAIL_MX_NEGATIVE_TTL', '3600')),
+    'ALLOWLIST': [d for d in os.getenv('EMAIL_MX_ALLOWLIST', '').split(',') if d],
+}
+
+# Items per page for keyset-paginated lists (profile notes and shelves)
+PROFILE_PAGE_SIZE = int(os.getenv('PROFILE_PAGE_SIZE', '20'))
+
+# Community notes on book pages: page size, server-side cache TTL and the
+# max-age sent to browsers, in seconds
+PUBLIC_NOTES = {
+    'PAGE_SIZE': int(os.getenv('PUBLIC_NOTES_PAGE_SIZE', '10')),
+    'CACHE_TTL': int(os.getenv('PUBLIC_NOTES_CACHE_TTL', '600')),
+    'MAX_AGE': int(os.getenv('PUBLIC_NOTES_MAX_AGE', '60')),
+}
+
+# "Readers also liked": neighbors kept per book, shown per page, minimum cosine
+# score, books per write batch, and how strongly each shelf signals interest
+RECOMMENDER = {
+    'TOP_K': int(os.getenv('RECOMMENDER_TOP_K', '20')),
+    'DISPLAY': int(os.getenv('RECOMMENDER_DISPLAY', '6')),
+    'MIN_SCORE': float(os.getenv('RECOMMENDER_MIN_SCORE', '0.05')),
+    'BATCH_SIZE': int(os.getenv('RECOMMENDER_BATCH_SIZE', '500')),
+    'WEIGHTS': {
+        'favorite_books': 1.0,
+        'books_read': 0.8,
+        'reading_list': 0.5,
+    },
+}
+
+# Content-based similar books: where the memory-mapped index lives, vector
+# size, books shown, minimum cosine score, cache TTL for per-book results and
+# the share of search ranking given to content similarity
+CONTENT_INDEX = {
+    'PATH': os.getenv('CONTENT_INDEX_PATH', os.path.join(BASE_DIR, 'content_index')),
+    'DIM': int(os.getenv('CONTENT_INDEX_DIM', '256')),
+    'DISPLAY': int(os.getenv('CONTENT_INDEX_DISPLAY', '6')),
+    'MIN_SCORE': float(os.getenv('CONTENT_INDEX_MIN_SCORE', '0.1')),
+    'CACHE_TTL': int(os.getenv('CONTENT_INDEX_CACHE_TTL', '86400')),
+    'RERANK_WEIGHT': float(os.getenv('CONTENT_INDEX_RERANK_WEIGHT', '0.3')),
+}
+
+# Cover proxy: resized renditions are kept in a bounded on-disk LRU. Only
+# covers from HOSTS are fetched server-side; pages pick the smallest of SIZES
+# that covers the width they display. Sources larger than MAX_SOURCE_BYTES or
+# MAX_PIXELS are refused before decoding.
+COVER_PROXY = {
+    'PATH': os.getenv('COVER_CACHE_PATH', os.path.join(BASE_DIR, 'cover_cache')),
+    'MAX_BYTES': int(os.getenv('COVER_CACHE_MAX_BYTES', str(512 * 1024 * 1024))),
+    'SIZES': [int(size) for size in os.getenv('COVER_SIZES', '64,128,256,400').split(',')],
+    'QUALITY': int(os.getenv('COVER_QUALITY', '82')),
+    'HOSTS': os.getenv('COVER_HOSTS', 'books.google.com,books.googleusercontent.com').split(','),
+    'TIMEOUT': float(os.getenv('COVER_FETCH_TIMEOUT', '5')),
+    'MAX_SOURCE_BYTES': int(os.getenv('COVER_MAX_SOURCE_BYTES', str(5 * 1024 * 1024))),
+    'MAX_PIXELS': int(os.getenv('COVER_MAX_PIXELS', str(4000 * 4000))),
+    'MAX_AGE': int(os.getenv('COVER_MAX_AGE', '86400')),
+}
+
+# Metadata refresh: books checked per run, days before a book counts as stale,
+# parallel requests and the overall request rate (per second)
+METADATA_REFRESH = {
+    'BATCH_SIZE': int(os.getenv('METADATA_REFRESH_BATCH_SIZE', '200')),
+    'MAX_AGE_DAYS': int(os.getenv('METADATA_REFRESH_MAX_AGE_DAYS', '30')),
+    'CONCURRENCY': int(os.getenv('METADATA_REFRESH_CONCURRENCY', '4')),
+    'RATE': float(os.getenv('METADATA_REFRESH_RATE', '5')),
+}
+
+# Staff exports: rows fetched per database round trip and bytes buffered per
+# streamed block
+EXPORT = {
+    'CHUNK_SIZE': int(os.getenv('EXPORT_CHUNK_SIZE', '2000')),
+    'BLOCK_SIZE': int(os.getenv('EXPORT_BLOCK_SIZE', str(64 * 1024))),
+}
+
+# Rendered theme pages are cached this long; edits invalidate them immediately
+THEME_CACHE_TTL = int(os.getenv('THEME_CACHE_TTL', '86400'))
+
+# Admin dashboard counters are flagged as stale when the last full recount
+# (refresh_site_stats, run hourly from cron) is older than this many seconds
+SITE_STATS_MAX_AGE = int(os.getenv('SITE_STATS_MAX_AGE', '3600'))
 
 # Database
 DATABASE_URL = os.getenv('DATABASE_URL')
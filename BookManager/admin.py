@@ -2,13 +2,41 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import (
     CustomUser, OtpToken, Theme, Book, 
-    BookThemedAssociation, UserProfile, ReadingNote
+    BookThemedAssociation, UserProfile, ReadingNote, OutboundEmail, SiteStats,
+    BookNeighbor, NeighborBuild
 )
+from .pagination import EstimatedCountPaginator
+from .search import search_book_ids
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist defaults for tables expected to grow to millions of rows."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class BookSearchMixin:
+    """
+    Search books through the full-text index instead of ``icontains`` scans.
+
+    ``book_search_field`` names the path from the admin's model to Book.
+    """
+    book_search_field = 'pk'
+    search_limit = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip():
+            book_ids = search_book_ids(search_term, limit=self.search_limit)
+            results |= queryset.filter(**{f'{self.book_search_field}__in': book_ids})
+        return results, may_have_duplicates
 
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
     """Admin interface for CustomUser model."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_display = ('email', 'username', 'is_verified', 'is_active', 'date_joined')
     list_filter = ('is_verified', 'is_active', 'is_staff', 'is_superuser')
     search_fields = ('email', 'username')
@@ -16,11 +44,12 @@ class CustomUserAdmin(UserAdmin):
 
 
 @admin.register(OtpToken)
-class OtpTokenAdmin(admin.ModelAdmin):
+class OtpTokenAdmin(LargeTableAdmin):
     """Admin interface for OtpToken model."""
-    list_display = ('user', 'otp_code', 'created', 'expires', 'is_expired')
-    list_filter = ('created', 'expires')
-    search_fields = ('user__email', 'user__username', 'otp_code')
+    list_display = ('user', 'purpose', 'otp_code', 'created', 'expires', 'is_expired')
+    list_filter = ('purpose', 'created', 'expires')
+    list_select_related = ('user',)
+    search_fields = ('user__username__istartswith', 'user__email__istartswith', 'otp_code__exact')
     readonly_fields = ('otp_code', 'created')
     ordering = ('-created',)
     
@@ -45,12 +74,17 @@ class ThemeAdmin(admin.ModelAdmin):
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(BookSearchMixin, LargeTableAdmin):
     """Admin interface for Book model."""
-    list_display = ('title', 'authors', 'google_books_id', 'is_curated', 'is_featured', 'view_count', 'created')
+    list_display = (
+        'title', 'authors', 'google_books_id', 'is_curated', 'is_featured', 'view_count', 'favorites_count', 'created'
+    )
     list_filter = ('is_curated', 'is_featured', 'created')
-    search_fields = ('title', 'authors', 'google_books_id', 'description')
-    readonly_fields = ('view_count', 'created', 'updated')
+    search_fields = ('google_books_id__exact',)
+    readonly_fields = (
+        'view_count', 'favorites_count', 'reading_list_count', 'read_count', 'public_notes_count',
+        'created', 'updated'
+    )
     ordering = ('-created',)
     fieldsets = (
         ('Basic Information', {
@@ -66,7 +100,10 @@ class BookAdmin(admin.ModelAdmin):
             'fields': ('page_count', 'categories')
         }),
         ('Status & Stats', {
-            'fields': ('is_curated', 'is_featured', 'view_count')
+            'fields': (
+                'is_curated', 'is_featured', 'view_count',
+                'favorites_count', 'reading_list_count', 'read_count', 'public_notes_count'
+            )
         }),
         ('Timestamps', {
             'fields': ('created', 'updated')
@@ -75,49 +112,93 @@ class BookAdmin(admin.ModelAdmin):
 
 
 @admin.register(BookThemedAssociation)
-class BookThemedAssociationAdmin(admin.ModelAdmin):
+class BookThemedAssociationAdmin(BookSearchMixin, admin.ModelAdmin):
     """Admin interface for BookThemedAssociation model."""
     list_display = ('book', 'theme', 'curator_pick', 'order', 'created')
     list_filter = ('curator_pick', 'theme', 'created')
-    search_fields = ('book__title', 'theme__name', 'contextual_note')
+    list_select_related = ('book', 'theme')
+    search_fields = ('theme__name', 'contextual_note')
     ordering = ('theme', 'order', '-created')
+    book_search_field = 'book'
+    raw_id_fields = ('book',)
 
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(LargeTableAdmin):
     """Admin interface for UserProfile model."""
-    list_display = ('user', 'bio_preview', 'favorite_count', 'reading_list_count', 'created')
+    list_display = ('user', 'bio_preview', 'favorite_books_count', 'reading_list_count', 'notes_count', 'created')
     list_filter = ('created', 'updated')
-    search_fields = ('user__email', 'user__username', 'bio')
-    readonly_fields = ('created', 'updated')
-    filter_horizontal = ('favorite_books', 'reading_list', 'books_read', 'favorite_themes')
+    list_select_related = ('user',)
+    search_fields = ('user__username__istartswith', 'user__email__istartswith')
+    readonly_fields = (
+        'favorite_books_count', 'reading_list_count', 'books_read_count', 'notes_count', 'created', 'updated'
+    )
+    raw_id_fields = ('user', 'favorite_books', 'reading_list', 'books_read')
+    filter_horizontal = ('favorite_themes',)
     
     def bio_preview(self, obj):
         """Show truncated bio."""
         return obj.bio[:50] + '...' if len(obj.bio) > 50 else obj.bio
     bio_preview.short_description = 'Bio'
-    
-    def favorite_count(self, obj):
-        """Count favorite books."""
-        return obj.favorite_books.count()
-    favorite_count.short_description = 'Favorites'
-    
-    def reading_list_count(self, obj):
-        """Count reading list items."""
-        return obj.reading_list.count()
-    reading_list_count.short_description = 'Reading List'
 
 
 @admin.register(ReadingNote)
-class ReadingNoteAdmin(admin.ModelAdmin):
+class ReadingNoteAdmin(BookSearchMixin, LargeTableAdmin):
     """Admin interface for ReadingNote model."""
     list_display = ('user', 'book', 'note_preview', 'is_public', 'created')
     list_filter = ('is_public', 'created')
-    search_fields = ('user__email', 'book__title', 'note')
+    list_select_related = ('user', 'book')
+    search_fields = ('user__username__istartswith', 'user__email__istartswith')
+    book_search_field = 'book'
+    raw_id_fields = ('user', 'book')
     readonly_fields = ('created', 'updated')
     ordering = ('-created',)
     
     def note_preview(self, obj):
         """Show truncated note."""
         return obj.note[:50] + '...' if len(obj.note) > 50 else obj.note
-    note_preview.short_description = 'Note'
\ No newline at end of file
+    note_preview.short_description = 'Note'
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(LargeTableAdmin):
+    """Admin interface for OutboundEmail model."""
+    list_display = ('subject', 'recipient_list', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'created')
+    search_fields = ('subject',)
+    readonly_fields = ('created', 'sent_at', 'last_error')
+    ordering = ('-created',)
+
+    def recipient_list(self, obj):
+        """Show recipients as a comma-separated list."""
+        return ', '.join(obj.recipients)
+    recipient_list.short_description = 'Recipients'
+
+
+@admin.register(SiteStats)
+class SiteStatsAdmin(admin.ModelAdmin):
+    """Admin interface for SiteStats model."""
+    list_display = ('total_users', 'total_books', 'total_notes', 'featured_books', 'curated_books', 'refreshed_at')
+    readonly_fields = ('total_users', 'total_books', 'total_notes', 'featured_books', 'curated_books', 'refreshed_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(BookNeighbor)
+class BookNeighborAdmin(LargeTableAdmin):
+    """Admin interface for BookNeighbor model."""
+    list_display = ('book', 'rank', 'neighbor', 'score')
+    list_select_related = ('book', 'neighbor')
+    raw_id_fields = ('book', 'neighbor')
+
+
+@admin.register(NeighborBuild)
+class NeighborBuildAdmin(admin.ModelAdmin):
+    """Admin interface for NeighborBuild model."""
+    list_display = ('started', 'finished', 'full', 'books_updated')
+    list_filter = ('full',)
+    readonly_fields = ('started', 'finished', 'full', 'books_updated')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.db import connections
+
+
+class CacheEntry:
+    """A cached value with a fresh deadline and a stale deadline."""
+    __slots__ = ('value', 'fresh_until', 'stale_until')
+
+    def __init__(self, value, fresh_until, stale_until):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+    def is_fresh(self, now=None):
+        return (now or time.time()) < self.fresh_until
+
+    def is_usable(self, now=None):
+        return (now or time.time()) < self.stale_until
+
+
+class LRUCache:
+    """Bounded, thread-safe in-process LRU of CacheEntry objects."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if not entry.is_usable():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """
+    Two-tier cache with per-entry TTLs and stale-while-revalidate.
+
+    The first tier is an in-process LRU; the optional second tier is a
+    shared Django cache (looked up by alias) so that several workers can
+    reuse each other's responses. Entries are fresh for ``ttl`` seconds and
+    may then be served for a further ``stale_ttl`` seconds while a single
+    background refresh runs.
+    """
+
+    def __init__(self, prefix, max_entries=256, ttl=600, stale_ttl=3600, shared_alias=None):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.shared_alias = shared_alias
+        self.local = LRUCache(max_entries)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        if not self.shared_alias:
+            return None
+        try:
+            return caches[self.shared_alias]
+        except InvalidCacheBackendError:
+            return None
+
+    def _shared_key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def _lookup(self, key):
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry
+        shared = self.shared
+        if shared is None:
+            return None
+        stored = shared.get(self._shared_key(key))
+        if stored is None:
+            return None
+        entry = CacheEntry(*stored)
+        if not entry.is_usable():
+            return None
+        self.local.set(key, entry)
+        return entry
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        entry = CacheEntry(value, now + ttl, now + ttl + self.stale_ttl)
+        self.local.set(key, entry)
+        shared = self.shared
+        if shared is not None:
+            shared.set(
+                self._shared_key(key),
+                (entry.value, entry.fresh_until, entry.stale_until),
+                timeout=ttl + self.stale_ttl,
+            )
+
+    def get_or_fetch(self, key, fetch, ttl=None):
+        """
+        Return the cached value for ``key``, calling ``fetch()`` on a miss.
+
+        Stale entries are returned immediately while ``fetch()`` runs in a
+        background thread, at most one per key at a time. ``None`` results
+        are never cached.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            if entry.is_fresh():
+                self.hits += 1
+                return entry.value
+            self.stale_hits += 1
+            self._refresh_in_background(key, fetch, ttl)
+            return entry.value
+
+        self.misses += 1
+        value = fetch()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+    def _refresh_in_background(self, key, fetch, ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = fetch()
+                if value is not None:
+                    self.set(key, value, ttl)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+                # fetch() may use the ORM; don't leave this thread's connection open
+                connections.close_all()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        """Return hit/miss/eviction counters for monitoring."""
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'evictions': self.local.evictions,
+            'size': len(self.local),
+            'max_entries': self.local.max_entries,
+        }
@@ -0,0 +1,349 @@
+import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Book
+
+
+VECTORS_FILE = 'vectors.npy'
+IDS_FILE = 'ids.npy'
+DF_FILE = 'df.npy'
+META_FILE = 'meta.json'
+# Each build is written to its own directory under BUILDS_DIR; CURRENT_FILE
+# names the live one and is swapped in with a single rename.
+BUILDS_DIR = 'builds'
+CURRENT_FILE = 'CURRENT'
+
+# Document frequencies are kept per hashed token in a table this large.
+DF_BUCKETS = 2 ** 20
+# Categories are short and deliberate, so they count more than prose.
+CATEGORY_WEIGHT = 3.0
+TITLE_WEIGHT = 2.0
+
+_WORD = re.compile(r'[^\W\d_]{3,}')
+
+
+def _features(title, description, categories):
+    """Return ``{token: weight}`` term counts for a book's text fields."""
+    features = {}
+    for word in _WORD.findall(description.lower()):
+        features[word] = features.get(word, 0.0) + 1.0
+    for word in _WORD.findall(title.lower()):
+        features[word] = features.get(word, 0.0) + TITLE_WEIGHT
+    for category in categories.split(','):
+        category = category.strip().lower()
+        if category:
+            key = f'category:{category}'
+            features[key] = features.get(key, 0.0) + CATEGORY_WEIGHT
+    return features
+
+
+def _hash(token):
+    return zlib.crc32(token.encode())
+
+
+def _iter_features(queryset, batch_size):
+    """Yield ``(pks, features)`` batches of books in primary-key order."""
+    pks, features = [], []
+    rows = (
+        queryset.order_by('pk')
+        .values_list('pk', 'title', 'description', 'categories')
+        .iterator(chunk_size=batch_size)
+    )
+    for pk, title, description, categories in rows:
+        pks.append(pk)
+        features.append(_features(title, description, categories))
+        if len(pks) == batch_size:
+            yield pks, features
+            pks, features = [], []
+    if pks:
+        yield pks, features
+
+
+def _flatten(features):
+    """Turn a list of feature dicts into parallel ``(rows, hashes, counts)`` arrays."""
+    import numpy as np
+
+    rows, hashes, counts = [], [], []
+    for row, tokens in enumerate(features):
+        for token, count in tokens.items():
+            rows.append(row)
+            hashes.append(_hash(token))
+            counts.append(count)
+    return (
+        np.array(rows, dtype=np.int64),
+        np.array(hashes, dtype=np.int64),
+        np.array(counts, dtype=np.float32),
+    )
+
+
+def _count_documents(df, features):
+    """Add each document's distinct hashed tokens to the ``df`` table in place."""
+    import numpy as np
+
+    rows, hashes, _ = _flatten(features)
+    pairs = np.unique(rows * DF_BUCKETS + hashes % DF_BUCKETS)
+    np.add.at(df, pairs % DF_BUCKETS, 1)
+
+
+def _embed(features, df, docs, dim):
+    """
+    Project TF-IDF weighted ``features`` into unit ``dim`` vectors, one row per book.
+
+    Uses the signed hashing trick: every token lands in one dimension with a
+    hash-derived sign, so no vocabulary has to be stored.
+    """
+    import numpy as np
+
+    rows, hashes, counts = _flatten(features)
+    idf = np.log((1 + docs) / (1 + df[hashes % DF_BUCKETS])) + 1
+    sign = np.where((hashes >> 31) & 1, 1.0, -1.0)
+    vectors = np.zeros((len(features), dim), dtype=np.float32)
+    np.add.at(vectors, (rows, (hashes >> 1) % dim), sign * (1 + np.log(counts)) * idf)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _contains(sorted_ids, values):
+    """Vectorized membership test of ``values`` in the sorted ``sorted_ids`` array."""
+    import numpy as np
+
+    if not len(sorted_ids):
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+    return sorted_ids[positions] == values
+
+
+def current_build(path):
+    """Return the directory of the live build under ``path``, or None if unbuilt."""
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(path, BUILDS_DIR, name) if name else None
+
+
+def _publish(path, build):
+    """Point CURRENT_FILE at ``build`` with one atomic rename and drop older builds."""
+    previous = current_build(path)
+    tmp = os.path.join(path, f'.{CURRENT_FILE}.tmp')
+    with open(tmp, 'w') as f:
+        f.write(os.path.basename(build))
+    os.replace(tmp, os.path.join(path, CURRENT_FILE))
+    # Keep the build just replaced for readers that resolved it before the swap
+    keep = {os.path.basename(build), os.path.basename(previous or '')}
+    builds = os.path.join(path, BUILDS_DIR)
+    for name in os.listdir(builds):
+        if name not in keep:
+            shutil.rmtree(os.path.join(builds, name), ignore_errors=True)
+
+
+def build_content_index(full=False, batch_size=1000):
+    """
+    Embed books into the memory-mapped index under CONTENT_INDEX['PATH'].
+
+    An incremental build embeds only books updated since the previous build
+    started, replacing their rows and appending new books; when no book
+    changed it returns without writing, so the index version (and every
+    cached similar-books list) stays put. Document frequencies only grow
+    with new books, so run a full build periodically.
+    Books are streamed twice (frequencies, then vectors) and vectors are
+    written straight into a memory-mapped file, so memory stays flat.
+    Every build goes to a fresh directory that replaces the live one in a
+    single rename, so readers never see files from two builds.
+    Returns ``(books_embedded, total_books)``.
+    """
+    import numpy as np
+
+    config = settings.CONTENT_INDEX
+    path, dim = config['PATH'], config['DIM']
+    os.makedirs(os.path.join(path, BUILDS_DIR), exist_ok=True)
+    started = timezone.now()
+
+    live = current_build(path)
+    meta = _read_meta(live) if live else None
+    if full or meta is None or meta['dim'] != dim:
+        old_ids = np.empty(0, dtype=np.int64)
+        old_vectors = None
+        df = np.zeros(DF_BUCKETS, dtype=np.int32)
+        docs = 0
+        queryset = Book.objects.all()
+    else:
+        old_ids = np.load(os.path.join(live, IDS_FILE))
+        old_vectors = np.load(os.path.join(live, VECTORS_FILE), mmap_mode='r')
+        df = np.load(os.path.join(live, DF_FILE))
+        docs = meta['docs']
+        queryset = Book.objects.filter(updated__gte=datetime.datetime.fromisoformat(meta['built_at']))
+
+    # Pass 1: collect ids to embed and count frequencies for new books.
+    changed = []
+    for pks, features in _iter_features(queryset, batch_size):
+        pks = np.array(pks, dtype=np.int64)
+        new = ~_contains(old_ids, pks)
+        _count_documents(df, [tokens for tokens, is_new in zip(features, new) if is_new])
+        docs += int(new.sum())
+        changed.append(pks)
+    changed = np.concatenate(changed) if changed else np.empty(0, dtype=np.int64)
+    if old_vectors is not None and not len(changed):
+        return 0, len(old_ids)
+    ids = np.union1d(old_ids, changed)
+
+    build = tempfile.mkdtemp(prefix=started.strftime('%Y%m%dT%H%M%S-'), dir=os.path.join(path, BUILDS_DIR))
+    vectors = np.lib.format.open_memmap(
+        os.path.join(build, VECTORS_FILE), mode='w+', dtype=np.float32, shape=(len(ids), dim)
+    )
+    for start in range(0, len(old_ids), batch_size * 100):
+        chunk = slice(start, start + batch_size * 100)
+        vectors[np.searchsorted(ids, old_ids[chunk])] = old_vectors[chunk]
+
+    # Pass 2: embed with the final frequencies. Books first seen here were
+    # updated mid-build and wait for the next run.
+    for pks, features in _iter_features(queryset, batch_size):
+        pks = np.array(pks, dtype=np.int64)
+        known = _contains(ids, pks)
+        embedded = _embed([tokens for tokens, ok in zip(features, known) if ok], df, docs, dim)
+        vectors[np.searchsorted(ids, pks[known])] = embedded
+    vectors.flush()
+    del vectors, old_vectors
+
+    np.save(os.path.join(build, IDS_FILE), ids)
+    np.save(os.path.join(build, DF_FILE), df)
+    meta = {'dim': dim, 'docs': docs, 'built_at': started.isoformat(), 'version': os.path.basename(build)}
+    with open(os.path.join(build, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    _publish(path, build)
+    return len(changed), len(ids)
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ContentIndex:
+    """Read-only view of a built index; vectors are memory-mapped, not loaded."""
+
+    def __init__(self, path):
+        import numpy as np
+
+        self.path = path
+        self.meta = _read_meta(path)
+        if self.meta is None:
+            raise FileNotFoundError(os.path.join(path, META_FILE))
+        self.version = self.meta['version']
+        self.ids = np.load(os.path.join(path, IDS_FILE))
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode='r')
+        self.df = np.load(os.path.join(path, DF_FILE), mmap_mode='r')
+
+    def row(self, book_id):
+        import numpy as np
+
+        i = int(np.searchsorted(self.ids, book_id))
+        if i < len(self.ids) and self.ids[i] == book_id:
+            return i
+        return None
+
+    def embed_query(self, query):
+        """Embed free text into the same space as the book vectors."""
+        return _embed([_features('', query, '')], self.df, self.meta['docs'], self.meta['dim'])[0]
+
+    def nearest(self, vector, limit, exclude=()):
+        """Return ``[(book_id, score)]`` for the ``limit`` closest books to ``vector``."""
+        import numpy as np
+
+        scores = self.vectors @ vector
+        count = min(limit + len(exclude), len(scores))
+        if not count:
+            return []
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        excluded = set(exclude)
+        results = [
+            (int(self.ids[i]), float(scores[i])) for i in best if int(self.ids[i]) not in excluded
+        ]
+        return results[:limit]
+
+    def similar(self, book_id, limit):
+        """Return ``[(book_id, score)]`` for books closest in content to ``book_id``."""
+        row = self.row(book_id)
+        if row is None:
+            return []
+        return self.nearest(self.vectors[row], limit, exclude=(book_id,))
+
+    def scores(self, vector, book_ids):
+        """Cosine score of each of ``book_ids`` against ``vector``; 0 when not indexed."""
+        result = {}
+        for book_id in book_ids:
+            row = self.row(book_id)
+            result[book_id] = float(self.vectors[row] @ vector) if row is not None else 0.0
+        return result
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_content_index():
+    """Return the current ContentIndex, reopening it after a rebuild, or None if unbuilt."""
+    global _index
+    build = current_build(settings.CONTENT_INDEX['PATH'])
+    if build is None:
+        return None
+    with _index_lock:
+        if _index is None or _index.path != build:
+            try:
+                _index = ContentIndex(build)
+            except OSError:
+                # Replaced and removed between resolving and opening it
+                return _index
+        return _index
+
+
+def similar_books(book, limit=None):
+    """Books closest in description and categories to ``book``, cached per index version."""
+    limit = limit or settings.CONTENT_INDEX['DISPLAY']
+    index = get_content_index()
+    if index is None:
+        return []
+    key = f"similar-books:{book.pk}:{index.version}:{limit}"
+    ids = cache.get(key)
+    if ids is None:
+        ids = [
+            book_id for book_id, score in index.similar(book.pk, limit)
+            if score >= settings.CONTENT_INDEX['MIN_SCORE']
+        ]
+        cache.set(key, ids, timeout=settings.CONTENT_INDEX['CACHE_TTL'])
+    books = Book.objects.in_bulk(ids)
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+def rerank(query, books):
+    """
+    Re-order search results by blending rank with content similarity to ``query``.
+
+    CONTENT_INDEX['RERANK_WEIGHT'] is the share given to similarity; books
+    missing from the index only keep their rank share.
+    """
+    weight = settings.CONTENT_INDEX['RERANK_WEIGHT']
+    index = get_content_index()
+    if index is None or not weight or len(books) < 2:
+        return books
+    scores = index.scores(index.embed_query(query), [book.pk for book in books])
+    blended = {
+        book.pk: (1 - weight) / (1 + position) + weight * scores[book.pk]
+        for position, book in enumerate(books)
+    }
+    return sorted(books, key=lambda book: -blended[book.pk])
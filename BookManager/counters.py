@@ -0,0 +1,293 @@
+import atexit
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import (
+    Case, CharField, Count, F, IntegerField, Max, Min, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce, Now
+from .models import Book, CustomUser, ReadingNote, UserProfile
+from .stats import adjust_site_stats
+
+
+class ViewCountBuffer:
+    """
+    Coalesce book view increments in memory and write them in batches.
+
+    Each flush applies every pending increment with a single
+    ``UPDATE ... SET view_count = view_count + CASE ... END`` statement, so
+    concurrent views never lose increments and hot rows are locked once per
+    flush instead of once per request.
+
+    Besides flushing on ``record()``, each process runs a daemon thread that
+    flushes every ``flush_interval`` seconds, so an idle worker's views are
+    written at most one interval late. A worker killed without running its
+    exit hooks loses at most that interval's views.
+    """
+
+    def __init__(self, flush_threshold=50, flush_interval=30):
+        self.flush_threshold = flush_threshold
+        self.flush_interval = flush_interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._timer_pid = None
+
+    def record(self, book_id, count=1):
+        """Buffer a view and flush if the threshold or interval is reached."""
+        with self._lock:
+            self._pending[book_id] += count
+            due = (
+                sum(self._pending.values()) >= self.flush_threshold
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+        self._start_timer()
+
+    def _start_timer(self):
+        # Started on first use and per process, so forked workers get their own
+        if not self.flush_interval:
+            return
+        pid = os.getpid()
+        with self._lock:
+            if self._timer_pid == pid:
+                return
+            self._timer_pid = pid
+        threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # Increments stay pending for the next attempt
+                pass
+            finally:
+                connections.close_all()
+
+    def pending(self, book_id):
+        """Return increments for ``book_id`` not yet written to the database."""
+        with self._lock:
+            return self._pending.get(book_id, 0)
+
+    def flush(self):
+        """Write all pending increments in one UPDATE. Returns rows updated."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        increment = Case(
+            *[When(id=book_id, then=Value(count)) for book_id, count in pending.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        try:
+            return Book.objects.filter(id__in=pending.keys()).update(
+                view_count=F('view_count') + increment
+            )
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+            raise
+
+
+view_counts = ViewCountBuffer(
+    flush_threshold=settings.VIEW_COUNT_BUFFER['FLUSH_THRESHOLD'],
+    flush_interval=settings.VIEW_COUNT_BUFFER['FLUSH_INTERVAL'],
+)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        view_counts.flush()
+    except Exception:
+        pass
+
+
+def adjust_counters(queryset, touch=(), **deltas):
+    """
+    Apply counter deltas to every row of ``queryset`` with ``F()`` expressions.
+
+    ``adjust_counters(Book.objects.filter(pk__in=ids), read_count=1)``
+    increments all rows in one UPDATE, so concurrent changes never lose an
+    increment. Fields named in ``touch`` are set to the current time in the
+    same statement.
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if updates:
+        updates.update({field: Now() for field in touch})
+        queryset.update(**updates)
+
+
+_bulk = threading.local()
+
+
+@contextmanager
+def bulk_delete():
+    """
+    Mark deletes made by this thread as bulk deletes.
+
+    Per-row delete signal handlers return early while this is active; the
+    caller settles the counters for the whole batch instead.
+    """
+    _bulk.depth = getattr(_bulk, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _bulk.depth -= 1
+
+
+def in_bulk_delete():
+    return getattr(_bulk, 'depth', 0) > 0
+
+
+def _book_decrements(user_ids):
+    """
+    Return ``({book_id: Counter(field=n)}, shelved_book_ids)`` for removing users.
+
+    The shelf rows and public notes are grouped per book in one UNION ALL
+    of GROUP BY queries.
+    """
+    queries = [
+        getattr(UserProfile, shelf).through.objects
+        .filter(userprofile__user_id__in=user_ids)
+        .annotate(field=Value(field, output_field=CharField()))
+        .values('field', 'book_id')
+        .annotate(n=Count('pk'))
+        .values_list('field', 'book_id', 'n')
+        .order_by()
+        for shelf, field in UserProfile.BOOK_COUNTERS.items()
+    ]
+    queries.append(
+        ReadingNote.objects.filter(user_id__in=user_ids, is_public=True)
+        .annotate(field=Value('public_notes_count', output_field=CharField()))
+        .values('field', 'book_id')
+        .annotate(n=Count('pk'))
+        .values_list('field', 'book_id', 'n')
+        .order_by()
+    )
+    decrements = defaultdict(Counter)
+    shelved = set()
+    for field, book_id, n in queries[0].union(*queries[1:], all=True):
+        decrements[book_id][field] += n
+        if field != 'public_notes_count':
+            shelved.add(book_id)
+    return decrements, shelved
+
+
+def _apply_book_decrements(decrements, shelved):
+    """Subtract per-book counter decrements with one UPDATE."""
+    fields = {field for counts in decrements.values() for field in counts}
+    updates = {
+        field: F(field) - Case(
+            *[
+                When(pk=book_id, then=Value(counts[field]))
+                for book_id, counts in decrements.items() if counts[field]
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        for field in fields
+    }
+    if shelved:
+        updates['shelved_at'] = Case(When(pk__in=shelved, then=Now()), default=F('shelved_at'))
+    if updates:
+        Book.objects.filter(pk__in=decrements.keys()).update(**updates)
+
+
+def delete_users(user_ids):
+    """
+    Delete the users in ``user_ids`` and settle their counters set-based.
+
+    The per-row delete handlers are skipped: Book counters get one UPDATE,
+    SiteStats one UPDATE and the public notes caches one write for the
+    whole batch. Returns the result of ``QuerySet.delete()``.
+    """
+    with transaction.atomic(), bulk_delete():
+        decrements, shelved = _book_decrements(user_ids)
+        deleted, per_model = CustomUser.objects.filter(pk__in=user_ids).delete()
+        _apply_book_decrements(decrements, shelved)
+        adjust_site_stats(
+            total_users=-per_model.get(CustomUser._meta.label, 0),
+            total_notes=-per_model.get(ReadingNote._meta.label, 0),
+        )
+        ReadingNote.bump_public_notes_versions([
+            book_id for book_id, counts in decrements.items() if counts['public_notes_count']
+        ])
+    return deleted, per_model
+
+
+def _count_where(queryset, group_by, condition=None):
+    """Scalar subquery counting ``queryset`` rows per ``group_by`` value, 0 when none."""
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .values(group_by)
+            .annotate(n=Count('pk', filter=condition))
+            .values('n')
+        ),
+        0,
+    )
+
+
+def _recount(queryset, counters, batch_size):
+    """Recompute ``counters`` on ``queryset`` in primary-key ranges of ``batch_size``."""
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    updated = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        updated += queryset.filter(pk__gte=start, pk__lt=start + batch_size).update(**counters)
+    return updated
+
+
+def recount_counters(batch_size=1000, apps=global_apps):
+    """
+    Recompute every denormalized shelf and note counter from the source rows.
+
+    Each batch is a single UPDATE with correlated COUNT subqueries. ``apps``
+    lets migrations pass their historical app registry. Returns the number of
+    ``(books, profiles)`` rows rewritten.
+    """
+    book_model = apps.get_model('BookManager', 'Book')
+    profile_model = apps.get_model('BookManager', 'UserProfile')
+    note_model = apps.get_model('BookManager', 'ReadingNote')
+    through = {
+        shelf: profile_model._meta.get_field(shelf).remote_field.through
+        for shelf in UserProfile.SHELVES
+    }
+
+    book_counters = {
+        UserProfile.BOOK_COUNTERS[shelf]: _count_where(
+            model.objects.filter(book_id=OuterRef('pk')), 'book_id'
+        )
+        for shelf, model in through.items()
+    }
+    book_counters['public_notes_count'] = _count_where(
+        note_model.objects.filter(book_id=OuterRef('pk')), 'book_id', Q(is_public=True)
+    )
+    profile_counters = {
+        f'{shelf}_count': _count_where(
+            model.objects.filter(userprofile_id=OuterRef('pk')), 'userprofile_id'
+        )
+        for shelf, model in through.items()
+    }
+    profile_counters['notes_count'] = _count_where(
+        note_model.objects.filter(user_id=OuterRef('user_id')), 'user_id'
+    )
+
+    return (
+        _recount(book_model.objects.all(), book_counters, batch_size),
+        _recount(profile_model.objects.all(), profile_counters, batch_size),
+    )
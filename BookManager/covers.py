@@ -0,0 +1,201 @@
+import hashlib
+import io
+import os
+import threading
+import uuid
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from django.conf import settings
+
+
+class CoverUnavailable(Exception):
+    """Raised when a cover cannot be fetched or decoded."""
+
+
+class DiskLRU:
+    """
+    Byte-bounded file cache evicting least recently used entries.
+
+    Reads bump a file's mtime, so eviction removes the files with the oldest
+    mtimes until the directory is back under 90% of ``max_bytes``.
+
+    The size is tracked per process: each worker adds its own writes to the
+    size it last measured and re-measures the directory when it evicts.
+    Writes by other workers are not seen in between, so with N workers
+    sharing the directory it can grow to about ``max_bytes * (1 + 0.1 *
+    (N - 1))`` before one of them evicts. Size COVER_PROXY['MAX_BYTES'] for
+    that.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def set(self, key, data):
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self._size = size
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cover_store():
+    """Return the process-wide DiskLRU configured by COVER_PROXY."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = settings.COVER_PROXY
+            _store = DiskLRU(config['PATH'], config['MAX_BYTES'])
+        return _store
+
+
+def cover_bucket(width):
+    """Smallest configured rendition at least ``width`` pixels wide, else the largest."""
+    sizes = sorted(settings.COVER_PROXY['SIZES'])
+    for size in sizes:
+        if size >= width:
+            return size
+    return sizes[-1]
+
+
+def cover_digest(source_url):
+    return hashlib.sha1(source_url.encode()).hexdigest()
+
+
+def can_proxy(source_url):
+    """Only covers from the configured hosts are fetched server-side."""
+    return bool(source_url) and urlsplit(source_url).hostname in settings.COVER_PROXY['HOSTS']
+
+
+def _render(source):
+    """Decode ``source`` once and return ``{size: jpeg_bytes}`` for every bucket."""
+    from PIL import Image, UnidentifiedImageError
+
+    config = settings.COVER_PROXY
+    try:
+        # A small compressed file can declare huge dimensions; open() only
+        # reads the header, so refuse those before any pixel data is decoded.
+        image = Image.open(io.BytesIO(source))
+        if image.width * image.height > config['MAX_PIXELS']:
+            raise CoverUnavailable(f'cover image too large: {image.width}x{image.height}')
+        image.draft('RGB', (max(config['SIZES']), max(config['SIZES']) * 2))
+        image = image.convert('RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        raise CoverUnavailable(str(exc)) from exc
+
+    renditions = {}
+    for size in sorted(config['SIZES'], reverse=True):
+        # Each rendition is reduced from the previous, larger one.
+        image.thumbnail((size, size * 2), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=config['QUALITY'], optimize=True, progressive=True)
+        renditions[size] = buffer.getvalue()
+    return renditions
+
+
+# Redirect hops followed per cover, each checked against COVER_PROXY['HOSTS']
+MAX_REDIRECTS = 3
+
+
+def _fetch(source_url):
+    """
+    Download ``source_url``, refusing redirects off the proxied hosts.
+
+    The URL comes from the database, so redirects are followed by hand and
+    every hop must pass ``can_proxy``.
+    """
+    config = settings.COVER_PROXY
+    url = source_url
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            with requests.get(
+                url, timeout=config['TIMEOUT'], stream=True, allow_redirects=False
+            ) as response:
+                if not response.is_redirect:
+                    response.raise_for_status()
+                    data = response.raw.read(config['MAX_SOURCE_BYTES'] + 1, decode_content=True)
+                    break
+                url = urljoin(url, response.headers['Location'])
+            if not can_proxy(url):
+                raise CoverUnavailable(f'cover redirected off the proxied hosts: {url}')
+        else:
+            raise CoverUnavailable('too many redirects')
+    except requests.RequestException as exc:
+        raise CoverUnavailable(str(exc)) from exc
+    if len(data) > config['MAX_SOURCE_BYTES']:
+        raise CoverUnavailable('cover image too large')
+    return data
+
+
+def get_cover(source_url, width):
+    """
+    Return JPEG bytes of ``source_url`` resized to the bucket for ``width``.
+
+    A miss fetches the original once and stores every bucket, so other
+    sizes of the same cover never go back to the remote host.
+    """
+    bucket = cover_bucket(width)
+    digest = cover_digest(source_url)
+    store = get_cover_store()
+    data = store.get(f'{digest}-{bucket}.jpg')
+    if data is None:
+        renditions = _render(_fetch(source_url))
+        for size, payload in renditions.items():
+            store.set(f'{digest}-{size}.jpg', payload)
+        data = renditions[bucket]
+    return data
@@ -0,0 +1,73 @@
+from functools import lru_cache
+
+import dns.exception
+import dns.resolver
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+
+COMMON_EMAIL_DOMAINS = frozenset({
+    'gmail.com', 'googlemail.com', 'yahoo.com', 'yahoo.co.uk', 'ymail.com',
+    'outlook.com', 'hotmail.com', 'hotmail.co.uk', 'live.com', 'msn.com',
+    'icloud.com', 'me.com', 'mac.com', 'aol.com', 'proton.me', 'protonmail.com',
+    'zoho.com', 'gmx.com', 'gmx.de', 'mail.com', 'yandex.com', 'yandex.ru',
+    'fastmail.com', 'hey.com', 'qq.com', '163.com', 'web.de',
+})
+
+
+class DomainLookupError(Exception):
+    """Raised when a domain's MX records could not be determined in time."""
+
+
+class DnsMxResolver:
+    """MX lookups through dnspython with a strict overall deadline."""
+
+    def __init__(self, timeout=2.0):
+        self.resolver = dns.resolver.Resolver()
+        self.resolver.timeout = timeout
+        self.resolver.lifetime = timeout
+
+    def has_mx(self, domain):
+        """Return True if ``domain`` publishes MX records, False if it does not."""
+        try:
+            self.resolver.resolve(domain, 'MX')
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            return False
+        except dns.exception.DNSException as exc:
+            raise DomainLookupError(str(exc)) from exc
+        return True
+
+
+@lru_cache(maxsize=1)
+def get_resolver():
+    """Instantiate the resolver class named in EMAIL_MX_CHECK['RESOLVER']."""
+    config = settings.EMAIL_MX_CHECK
+    return import_string(config['RESOLVER'])(timeout=config['TIMEOUT'])
+
+
+def is_deliverable_domain(domain):
+    """
+    Check if an email domain can receive mail, using cached verdicts.
+
+    Common providers are accepted without a lookup. Other verdicts are
+    cached with separate positive and negative TTLs. Lookups that time out
+    or fail are treated as valid and not cached, so a DNS outage does not
+    block signups.
+    """
+    domain = domain.lower().rstrip('.')
+    config = settings.EMAIL_MX_CHECK
+    if domain in COMMON_EMAIL_DOMAINS or domain in config['ALLOWLIST']:
+        return True
+
+    key = f"email-mx:{domain}"
+    verdict = cache.get(key)
+    if verdict is not None:
+        return verdict
+
+    try:
+        verdict = get_resolver().has_mx(domain)
+    except DomainLookupError:
+        return True
+    cache.set(key, verdict, timeout=config['POSITIVE_TTL'] if verdict else config['NEGATIVE_TTL'])
+    return verdict
@@ -0,0 +1,148 @@
+import csv
+import datetime
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import CharField, Value
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Book, ReadingNote, UserProfile
+
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _books(since):
+    queryset = Book.objects.all()
+    if since:
+        queryset = queryset.filter(updated__gte=since)
+    return queryset.order_by('pk'), [
+        'id', 'google_books_id', 'title', 'slug', 'authors', 'description',
+        'published_date', 'page_count', 'categories', 'cover_image', 'info_link',
+        'preview_link', 'is_curated', 'is_featured', 'view_count', 'favorites_count',
+        'reading_list_count', 'read_count', 'public_notes_count', 'created', 'updated',
+    ]
+
+
+def _notes(since):
+    queryset = ReadingNote.objects.all()
+    if since:
+        queryset = queryset.filter(updated__gte=since)
+    return queryset.order_by('pk'), [
+        'id', 'user_id', 'user__username', 'book_id', 'book__google_books_id',
+        'is_public', 'note', 'created', 'updated',
+    ]
+
+
+def _shelves(since):
+    # Membership rows carry no timestamp, so an incremental pull returns the
+    # complete shelves of every profile whose shelves changed since ``since``.
+    querysets = []
+    for shelf in UserProfile.SHELVES:
+        queryset = getattr(UserProfile, shelf).through.objects.all()
+        if since:
+            queryset = queryset.filter(userprofile__shelved_at__gte=since)
+        querysets.append(
+            queryset.annotate(shelf=Value(shelf, output_field=CharField())).order_by('pk')
+        )
+    return querysets, [
+        'shelf', 'userprofile_id', 'userprofile__user_id', 'book_id', 'book__google_books_id',
+    ]
+
+
+DATASETS = {
+    'books': _books,
+    'notes': _notes,
+    'shelves': _shelves,
+}
+
+
+def parse_since(value):
+    """Parse an ISO date or datetime filter value; naive values use the current timezone."""
+    since = parse_datetime(value)
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f'invalid date: {value!r}')
+        since = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def export_rows(dataset, since=None, chunk_size=None):
+    """
+    Return ``(columns, rows)`` for ``dataset``; ``rows`` lazily yields value tuples.
+
+    Rows are read through ``iterator()``, a server-side cursor on PostgreSQL,
+    so only ``chunk_size`` rows are held in memory at a time.
+    """
+    chunk_size = chunk_size or settings.EXPORT['CHUNK_SIZE']
+    querysets, columns = DATASETS[dataset](since)
+    if not isinstance(querysets, list):
+        querysets = [querysets]
+
+    def rows():
+        for queryset in querysets:
+            yield from queryset.values_list(*columns).iterator(chunk_size=chunk_size)
+
+    return [column.replace('__', '_') for column in columns], rows()
+
+
+class _Line:
+    """File-like sink so csv.writer returns each row instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def _encode(columns, rows, format):
+    if format == 'csv':
+        writer = csv.writer(_Line())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(
+                [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+            )
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for row in rows:
+            yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def stream_export(dataset, format='csv', since=None, compress=False, chunk_size=None):
+    """
+    Yield the ``dataset`` export as bytes, gzip-compressed on the fly if ``compress``.
+
+    Lines are grouped into blocks of about EXPORT['BLOCK_SIZE'] bytes so a
+    response is not flushed one row at a time.
+    """
+    columns, rows = export_rows(dataset, since, chunk_size)
+    block_size = settings.EXPORT['BLOCK_SIZE']
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    block, size = [], 0
+    for line in _encode(columns, rows, format):
+        data = line.encode()
+        block.append(data)
+        size += len(data)
+        if size >= block_size:
+            data = b''.join(block)
+            block, size = [], 0
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = b''.join(block)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export_filename(dataset, format, compress=False):
+    return f'bookhub-{dataset}.{format}' + ('.gz' if compress else '')
@@ -4,7 +4,7 @@ from django.contrib.auth import get_user_model
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from .models import UserProfile, ReadingNote
-import dns.resolver
+from .email_domains import is_deliverable_domain
 
 
 class SignUpForm(UserCreationForm):
@@ -31,9 +31,7 @@ class SignUpForm(UserCreationForm):
             raise forms.ValidationError("Please enter a valid email address.")
         
         domain = email.split('@')[1]
-        try:
-            dns.resolver.resolve(domain, 'MX')
-        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.Timeout, Exception):
+        if not is_deliverable_domain(domain):
             raise forms.ValidationError(
                 f"The email domain '{domain}' doesn't appear to be valid. "
                 "Please check for typos."
@@ -0,0 +1,245 @@
+import datetime
+import os
+import random
+import threading
+import time
+from urllib.parse import quote
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.memcached import PyLibMCCache, PyMemcacheCache
+from django.core.cache.backends.redis import RedisCache
+
+
+# Cache backends whose incr() is one atomic server-side operation. The
+# database and local-memory caches read and write back, so concurrent
+# workers would lose increments.
+ATOMIC_COUNTER_BACKENDS = (RedisCache, PyMemcacheCache, PyLibMCCache)
+
+
+def quota_cache():
+    """Return the default cache if it counts atomically, else None (tracking off)."""
+    backend = caches['default']
+    return backend if isinstance(backend, ATOMIC_COUNTER_BACKENDS) else None
+
+
+class GoogleBooksError(Exception):
+    """Raised when a Google Books request fails after its retries."""
+
+
+class CircuitOpen(GoogleBooksError):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-process breaker that stops calling a failing API for a while.
+
+    After ``threshold`` consecutive failures the circuit opens for
+    ``reset_timeout`` seconds; then a single trial call is let through,
+    closing it again on success or re-opening it on failure.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def available(self):
+        """Whether a call would currently be allowed, without claiming the trial."""
+        state = self.state
+        return state == 'closed' or (state == 'half-open' and not self._trial)
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class GoogleBooksClient:
+    """
+    Google Books API client over one pooled keep-alive session.
+
+    Connection errors, timeouts, 429s and 5xx responses are retried with
+    jittered exponential backoff; a call that still fails counts against
+    the circuit breaker. Calls made while a user waits pass ``deadline``,
+    an overall time budget in seconds that bounds every attempt's timeout
+    and stops retrying once it runs out. Every request sent is tallied in
+    per-day quota counters in the default cache when that cache counts
+    atomically (see ``quota_cache``); otherwise quota tracking is off.
+    """
+
+    BASE_URL = 'https://www.googleapis.com/books/v1'
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    QUOTA_PREFIX = 'google-books-quota'
+
+    def __init__(self, api_key=None, timeout=10, pool_size=10, retries=2, backoff=0.5,
+                 max_backoff=4, breaker=None, quota_timezone='America/Los_Angeles'):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.quota_timezone = ZoneInfo(quota_timezone)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+    def available(self):
+        """False while the breaker is open, so callers can skip the API outright."""
+        return self.breaker.available()
+
+    def search(self, query, max_results=10, start_index=0, deadline=None):
+        """Return the ``volumes`` response for ``query``."""
+        params = {'q': query, 'maxResults': max_results, 'startIndex': start_index}
+        return self._get('volumes', params, deadline=deadline)
+
+    def volume(self, volume_id, deadline=None):
+        """Return one volume item, or ``{}`` if it no longer exists."""
+        return self._get(f"volumes/{quote(volume_id, safe='')}", missing={}, deadline=deadline)
+
+    def _get(self, path, params=None, missing=None, deadline=None):
+        if deadline is not None and deadline <= 0:
+            raise GoogleBooksError('deadline must be positive')
+        if not self.breaker.allow():
+            raise CircuitOpen('Google Books circuit breaker is open')
+        params = dict(params or {})
+        if self.api_key:
+            params['key'] = self.api_key
+        url = f'{self.BASE_URL}/{path}'
+        expires = None if deadline is None else time.monotonic() + deadline
+
+        for attempt in range(self.retries + 1):
+            timeout = self.timeout
+            if expires is not None:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    # A sleep that overran the deadline; requests rejects a timeout <= 0
+                    break
+                timeout = min(timeout, remaining)
+            self._count('requests')
+            retry_after = None
+            try:
+                response = self.session.get(url, params=params, timeout=timeout)
+            except requests.RequestException as exc:
+                error = exc
+            else:
+                if response.status_code not in self.RETRY_STATUSES:
+                    # Other client errors are the request's fault, not the API's
+                    self.breaker.record_success()
+                    if response.status_code == 404 and missing is not None:
+                        return missing
+                    try:
+                        response.raise_for_status()
+                        return response.json()
+                    except (requests.HTTPError, ValueError) as exc:
+                        self._count('errors')
+                        raise GoogleBooksError(str(exc)) from exc
+                error = GoogleBooksError(f'HTTP {response.status_code} from {path}')
+                if response.status_code == 429:
+                    self._count('throttled')
+                    retry_after = response.headers.get('Retry-After')
+            self._count('errors')
+            if attempt < self.retries:
+                delay = self._delay(attempt, retry_after)
+                if expires is not None and time.monotonic() + delay >= expires:
+                    break
+                time.sleep(delay)
+
+        self.breaker.record_failure()
+        raise GoogleBooksError(str(error)) from error
+
+    def _delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, at least Retry-After when given, capped."""
+        delay = random.uniform(0, self.backoff * 2 ** attempt)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+        return min(delay, self.max_backoff)
+
+    def quota_day(self):
+        # The API's daily quota resets at midnight Pacific time
+        return datetime.datetime.now(self.quota_timezone).date()
+
+    def _quota_key(self, day, counter):
+        return f'{self.QUOTA_PREFIX}:{day.isoformat()}:{counter}'
+
+    def _count(self, counter):
+        cache = quota_cache()
+        if cache is None:
+            return
+        key = self._quota_key(self.quota_day(), counter)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=2 * 86400):
+                cache.incr(key)
+
+    def quota_usage(self, day=None):
+        """
+        Return ``{'requests', 'errors', 'throttled'}`` counts for ``day`` (default today).
+
+        Returns None while quota tracking is off.
+        """
+        cache = quota_cache()
+        if cache is None:
+            return None
+        day = day or self.quota_day()
+        counters = ('requests', 'errors', 'throttled')
+        values = cache.get_many([self._quota_key(day, counter) for counter in counters])
+        return {counter: values.get(self._quota_key(day, counter), 0) for counter in counters}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide GoogleBooksClient configured by GOOGLE_BOOKS_API."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            config = settings.GOOGLE_BOOKS_API
+            _client = GoogleBooksClient(
+                api_key=os.getenv('GOOGLE_BOOKS_API_KEY'),
+                timeout=config['TIMEOUT'],
+                pool_size=config['POOL_SIZE'],
+                retries=config['RETRIES'],
+                backoff=config['BACKOFF'],
+                max_backoff=config['MAX_BACKOFF'],
+                breaker=CircuitBreaker(config['BREAKER_THRESHOLD'], config['BREAKER_RESET']),
+                quota_timezone=config['QUOTA_TIMEZONE'],
+            )
+        return _client
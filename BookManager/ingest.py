@@ -0,0 +1,261 @@
+import codecs
+import gzip
+import json
+import re
+
+from django.db import connections, router
+from django.db.models.constants import OnConflict
+from django.utils.text import slugify
+from .models import Book
+from .stats import adjust_site_stats
+
+
+# Values parse_volume fills in when the API leaves a field out
+UNKNOWN_TITLE = 'Unknown'
+NO_DESCRIPTION = 'No description available'
+
+
+def parse_volume(item):
+    """
+    Map a Google Books volume item to Book field values.
+
+    Returns None for items without a volume id.
+    """
+    book_id = item.get('id', '')
+    if not book_id:
+        return None
+
+    volume_info = item.get('volumeInfo', {})
+    title = volume_info.get('title', UNKNOWN_TITLE)
+
+    image_links = volume_info.get('imageLinks', {})
+    cover_image = (
+        image_links.get('extraLarge', '')
+        or image_links.get('large', '')
+        or image_links.get('medium', '')
+        or image_links.get('small', '')
+        or image_links.get('thumbnail', '')
+        or image_links.get('smallThumbnail', '')
+    )
+    if cover_image and 'zoom=1' in cover_image:
+        cover_image = cover_image.replace('zoom=1', 'zoom=0')
+    if cover_image and cover_image.startswith('http://'):
+        cover_image = cover_image.replace('http://', 'https://', 1)
+
+    return {
+        'google_books_id': book_id,
+        'title': title,
+        'slug': slugify(title)[:200],
+        'authors': ', '.join(volume_info.get('authors', [])),
+        'description': volume_info.get('description', NO_DESCRIPTION),
+        'published_date': volume_info.get('publishedDate', ''),
+        'cover_image': cover_image,
+        'info_link': volume_info.get('infoLink', ''),
+        'preview_link': volume_info.get('previewLink', ''),
+        'page_count': volume_info.get('pageCount'),
+        'categories': ', '.join(volume_info.get('categories', [])),
+    }
+
+
+def needs_cover_update(current, cover_image):
+    """Check if a stored cover should be replaced by a freshly parsed one."""
+    return bool(cover_image) and (not current or 'zoom=1' in current)
+
+
+def _insert_missing(rows):
+    """
+    Insert ``rows``, skipping any a concurrent ingest stored first.
+
+    Returns how many rows were actually inserted, read from ``RETURNING``
+    where the backend supports it; elsewhere the count assumes no other
+    ingest raced this one.
+    """
+    connection = connections[router.db_for_write(Book)]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        Book.objects.bulk_create(rows, ignore_conflicts=True)
+        return len(rows)
+
+    fields = [field for field in Book._meta.concrete_fields if not field.primary_key]
+    batch_size = max(connection.ops.bulk_batch_size(fields, rows), 1)
+    inserted = 0
+    for start in range(0, len(rows), batch_size):
+        inserted += len(Book._base_manager.using(connection.alias)._insert(
+            rows[start:start + batch_size],
+            fields=fields,
+            returning_fields=[Book._meta.pk],
+            on_conflict=OnConflict.IGNORE,
+        ))
+    return inserted
+
+
+def ingest_volumes(items, return_books=True):
+    """
+    Store a list of Google Books volume items in a constant number of queries.
+
+    Only volumes that are not stored yet are inserted. Existing books keep
+    their stored metadata (as with ``get_or_create``); only a missing or
+    low-resolution cover image is replaced. Returns the
+    Book rows in API order, or None when ``return_books`` is False.
+    """
+    parsed = {}
+    order = []
+    for item in items:
+        fields = parse_volume(item)
+        if fields is None:
+            continue
+        google_id = fields['google_books_id']
+        if google_id not in parsed:
+            order.append(google_id)
+            parsed[google_id] = fields
+
+    if not order:
+        return [] if return_books else None
+
+    existing_covers = dict(
+        Book.objects.filter(google_books_id__in=order)
+        .values_list('google_books_id', 'cover_image')
+    )
+
+    missing = []
+    stale = []
+    for google_id in order:
+        fields = parsed[google_id]
+        if google_id not in existing_covers:
+            missing.append(Book(**fields))
+        elif needs_cover_update(existing_covers[google_id], fields['cover_image']):
+            stale.append(google_id)
+
+    # Rows that are already stored and current are left alone, so a page
+    # of hot books is a read rather than a write per row.
+    if missing:
+        # bulk_create skips post_save, so count new rows here
+        adjust_site_stats(total_books=_insert_missing(missing))
+    if stale:
+        books = Book.objects.in_bulk(stale, field_name='google_books_id')
+        for google_id, book in books.items():
+            book.cover_image = parsed[google_id]['cover_image']
+        Book.objects.bulk_update(books.values(), ['cover_image'])
+
+    if not return_books:
+        return None
+
+    books = Book.objects.in_bulk(order, field_name='google_books_id')
+    return [books[google_id] for google_id in order if google_id in books]
+
+
+_ITEMS_ARRAY = re.compile(r'"items"\s*:\s*\[')
+
+
+def _open_dump(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _expand(value, start, end):
+    """
+    Yield ``(item, offset)`` for a dump entry, a volume item or a whole ``volumes`` response.
+
+    Every item of a response but the last carries the entry's ``start``
+    offset, so an import that stops partway through a response resumes at
+    the response instead of past its unsaved items.
+    """
+    if isinstance(value, dict) and 'items' in value and 'volumeInfo' not in value:
+        items = value['items'] or []
+    else:
+        items = [value]
+    for position, item in enumerate(items, 1):
+        yield item, end if position == len(items) else start
+
+
+def _iter_ndjson(f, offset):
+    if offset:
+        f.seek(offset - 1)
+        # Resuming mid-line skips the partial record.
+        if f.read(1) != b'\n':
+            offset += len(f.readline())
+    for line in f:
+        start, offset = offset, offset + len(line)
+        if line.strip():
+            yield from _expand(json.loads(line), start, offset)
+
+
+def _iter_json(f, offset, chunk_size=1 << 20):
+    """
+    Decode the elements of a JSON array one at a time without loading the file.
+
+    The array is either the top-level value or the ``items`` of a volumes
+    response. Offsets point just past an element, so resuming starts at the
+    separator before the next one.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    eof = False
+
+    def fill():
+        nonlocal buffer, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += text.decode(chunk, final=eof)
+
+    if offset:
+        f.seek(offset)
+    else:
+        while True:
+            fill()
+            start = buffer.lstrip()
+            if start.startswith('['):
+                head = len(buffer) - len(start) + 1
+                break
+            match = _ITEMS_ARRAY.search(buffer)
+            if match:
+                head = match.end()
+                break
+            if eof:
+                raise ValueError('no volume array found in the dump')
+        offset = len(buffer[:head].encode())
+        buffer = buffer[head:]
+
+    while True:
+        position = 0
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise ValueError('unterminated volume array')
+            fill()
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        start, offset = offset, offset + len(buffer[:end].encode())
+        buffer = buffer[end:]
+        yield from _expand(value, start, offset)
+
+
+def read_volume_dump(path, offset=0, format=None):
+    """
+    Stream ``(item, offset)`` pairs from a Google Books volumes dump.
+
+    ``format`` is ``'ndjson'`` (one item or response per line) or
+    ``'json'`` (an array, or a response with ``items``); by default it
+    follows the file extension. ``offset`` is the byte position in the
+    uncompressed stream after ``item`` (or before the response holding it,
+    for all but a response's last item), so it can be passed back to
+    resume an interrupted import.
+    """
+    if format is None:
+        name = path[:-3] if path.endswith('.gz') else path
+        format = 'json' if name.endswith('.json') else 'ndjson'
+    with _open_dump(path) as f:
+        if format == 'json':
+            yield from _iter_json(f, offset)
+        else:
+            yield from _iter_ndjson(f, offset)
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from BookManager.recommendations import build_neighbors
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds "readers also liked" neighbors from shelf co-occurrence'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every book, not only changed ones')
+        parser.add_argument('--top-k', type=int, help='Neighbors kept per book')
+        parser.add_argument('--batch-size', type=int, help='Books computed and written per batch')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        build = build_neighbors(
+            full=options['full'], top_k=options['top_k'], batch_size=options['batch_size']
+        )
+        elapsed = time.monotonic() - started
+        kind = 'Full' if build.full else 'Incremental'
+        self.stdout.write(self.style.SUCCESS(
+            f'{kind} build updated neighbors for {build.books_updated} books ({elapsed:.2f}s)'
+        ))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+from BookManager.content_index import build_content_index
+
+
+class Command(BaseCommand):
+    help = 'Embeds book descriptions and categories into the similar-books index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Re-embed every book and recompute term frequencies')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Books embedded per batch')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        embedded, total = build_content_index(full=options['full'], batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Embedded {embedded} books; index holds {total} ({elapsed:.2f}s)'
+        ))
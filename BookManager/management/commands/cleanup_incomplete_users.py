@@ -1,12 +1,75 @@
+import time
+from collections import Counter
+
 from django.core.management.base import BaseCommand
+from django.db import router
+from django.db.models.deletion import Collector
 from django.utils import timezone
+from BookManager.counters import delete_users
 from BookManager.models import CustomUser
 
+
 class Command(BaseCommand):
-    help = 'Deletes incomplete user accounts'
+    help = 'Deletes incomplete user accounts in primary-key ordered batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Users deleted per batch')
+        parser.add_argument('--time-budget', type=float, default=60.0,
+                            help='Stop starting new batches after this many seconds')
+        parser.add_argument('--older-than', type=int, default=3,
+                            help='Only remove unverified accounts older than this many minutes')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        cutoff = timezone.now() - timezone.timedelta(minutes=options['older_than'])
+        incomplete_users = CustomUser.objects.filter(
+            is_verified=False, date_joined__lte=cutoff
+        ).order_by('pk')
+
+        removed = Counter()
+        batches = 0
+        last_pk = None
+        finished = True
+        while True:
+            if time.monotonic() - started >= options['time_budget']:
+                finished = False
+                break
+            page = incomplete_users
+            if last_pk is not None:
+                page = page.filter(pk__gt=last_pk)
+            pks = list(page.values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            if options['dry_run']:
+                removed.update(self.count_cascade(CustomUser.objects.filter(pk__in=pks)))
+            else:
+                _, per_model = delete_users(pks)
+                removed.update(per_model)
+            batches += 1
+
+        elapsed = time.monotonic() - started
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        for label, count in sorted(removed.items()):
+            if count:
+                self.stdout.write(f'{verb} {count} {label}')
+        summary = (
+            f'{verb} {removed.get(CustomUser._meta.label, 0)} incomplete user accounts '
+            f'in {batches} batches ({elapsed:.2f}s)'
+        )
+        if finished:
+            self.stdout.write(self.style.SUCCESS(summary))
+        else:
+            self.stdout.write(self.style.WARNING(f'{summary}; time budget reached, more remain'))
 
-    def handle(self, *args, **kwargs):
-        incomplete_users = CustomUser.objects.filter(is_verified=False, date_joined__lte=timezone.now() - timezone.timedelta(minutes=3))
-        for user in incomplete_users:
-            user.delete()
-        self.stdout.write(self.style.SUCCESS('Incomplete user accounts deleted successfully'))
+    def count_cascade(self, queryset):
+        """Count rows per model that deleting ``queryset`` would remove."""
+        collector = Collector(using=router.db_for_write(queryset.model))
+        collector.collect(queryset)
+        counts = Counter()
+        for model, instances in collector.data.items():
+            counts[model._meta.label] += len(instances)
+        for qs in collector.fast_deletes:
+            counts[qs.model._meta.label] += qs.count()
+        return counts
@@ -0,0 +1,47 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from BookManager.exports import DATASETS, FORMATS, export_filename, parse_since, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Streams books, reading notes or shelf memberships as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--updated-gte', help='Only rows changed since this ISO date or datetime')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per database round trip')
+        parser.add_argument('-o', '--output',
+                            help="File to write, '-' for stdout; defaults to bookhub-<dataset>.<format>")
+
+    def handle(self, *args, **options):
+        dataset, format, compress = options['dataset'], options['format'], options['gzip']
+        since = None
+        if options['updated_gte']:
+            try:
+                since = parse_since(options['updated_gte'])
+            except ValueError as exc:
+                raise CommandError(exc) from exc
+
+        output = options['output'] or export_filename(dataset, format, compress)
+        started = time.monotonic()
+        written = 0
+        stream = stream_export(dataset, format, since, compress, options['chunk_size'])
+        if output == '-':
+            for block in stream:
+                sys.stdout.buffer.write(block)
+                written += len(block)
+            sys.stdout.buffer.flush()
+            return
+        with open(output, 'wb') as f:
+            for block in stream:
+                f.write(block)
+                written += len(block)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} bytes of {dataset} to {output} ({elapsed:.2f}s)'
+        ))
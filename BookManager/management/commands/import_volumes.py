@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from BookManager.ingest import ingest_volumes, read_volume_dump
+
+
+class Command(BaseCommand):
+    help = 'Imports books from a Google Books volumes dump (NDJSON or JSON, optionally gzipped)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Dump file; .gz files are decompressed on the fly')
+        parser.add_argument('--format', choices=['ndjson', 'json'],
+                            help='Defaults to json for .json files, ndjson otherwise')
+        parser.add_argument('--offset', type=int, default=0,
+                            help='Byte offset to resume from, as printed by a previous run')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Volumes upserted per batch')
+        parser.add_argument('--progress', type=float, default=10.0,
+                            help='Seconds between progress reports')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = reported = time.monotonic()
+        volumes = 0
+        offset = options['offset']
+        batch = []
+
+        def flush(end):
+            nonlocal volumes, offset
+            with transaction.atomic():
+                ingest_volumes(batch, return_books=False)
+            volumes += len(batch)
+            offset = end
+            batch.clear()
+
+        try:
+            for item, end in read_volume_dump(options['path'], options['offset'], options['format']):
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    flush(end)
+                    if time.monotonic() - reported >= options['progress']:
+                        reported = time.monotonic()
+                        self.stdout.write(self._report(volumes, started, offset))
+            if batch:
+                flush(end)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'{exc} (resume with --offset {offset})') from exc
+        except KeyboardInterrupt:
+            self.stderr.write(f'Interrupted; resume with --offset {offset}')
+            raise
+
+        self.stdout.write(self.style.SUCCESS(self._report(volumes, started, offset)))
+
+    @staticmethod
+    def _report(volumes, started, offset):
+        elapsed = time.monotonic() - started
+        rate = volumes / elapsed if elapsed else 0
+        return f'Imported {volumes} volumes ({rate:.0f}/s, {elapsed:.2f}s); offset {offset}'
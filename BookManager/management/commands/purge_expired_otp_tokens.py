@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from BookManager.models import OtpToken
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired OTP tokens in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tokens deleted per batch')
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Keep tokens for this long after they expire')
+        parser.add_argument('--max-batches', type=int, default=100, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        cutoff = timezone.now() - timezone.timedelta(minutes=options['grace_minutes'])
+        expired = OtpToken.objects.filter(
+            Q(expires__lt=cutoff) | Q(expires__isnull=True, created__lt=cutoff)
+        ).order_by('pk')
+
+        deleted = 0
+        batches = 0
+        while batches < options['max_batches']:
+            pks = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            count, _ = OtpToken.objects.filter(pk__in=pks).delete()
+            deleted += count
+            batches += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired OTP tokens in {batches} batches '
+            f'({time.monotonic() - started:.2f}s)'
+        ))
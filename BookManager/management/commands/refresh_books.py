@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from BookManager.refresh import refresh_books
+
+
+class Command(BaseCommand):
+    help = 'Re-fetches metadata of the least recently updated books from Google Books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Books checked this run')
+        parser.add_argument('--max-age-days', type=int,
+                            help='Only books not updated for this many days')
+        parser.add_argument('--concurrency', type=int, help='Requests in flight at once')
+        parser.add_argument('--rate', type=float, help='Requests started per second')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        checked, changed, failed = refresh_books(
+            limit=options['limit'],
+            max_age_days=options['max_age_days'],
+            concurrency=options['concurrency'],
+            rate=options['rate'],
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} books, {changed} changed, {failed} failed ({elapsed:.2f}s)'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from BookManager.stats import refresh_site_stats
+
+
+class Command(BaseCommand):
+    help = 'Recounts the admin dashboard site statistics'
+
+    def handle(self, *args, **kwargs):
+        stats = refresh_site_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Site stats refreshed: {stats.total_users} users, {stats.total_books} books, '
+            f'{stats.total_notes} notes, {stats.featured_books} featured, {stats.curated_books} curated'
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from BookManager.counters import recount_counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes denormalized shelf and note counters on books and profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows recounted per UPDATE')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        books, profiles = recount_counters(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {books} books and {profiles} profiles ({elapsed:.2f}s)'
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from BookManager.outbox import deliver_batch
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued outbox emails in batches over a reused connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails per batch')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Failures before an email is dead-lettered')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when the outbox is empty')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait between polls with --loop')
+
+    def handle(self, *args, **options):
+        totals = [0, 0, 0]
+        while True:
+            sent, failed, dead = deliver_batch(options['batch_size'], options['max_attempts'])
+            totals = [totals[0] + sent, totals[1] + failed, totals[2] + dead]
+            if sent or failed or dead:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Outbox drained: {totals[0]} sent, {totals[1]} retrying, {totals[2]} dead-lettered'
+        ))
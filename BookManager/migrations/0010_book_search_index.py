@@ -0,0 +1,26 @@
+# Generated manually to add a full-text search index over Book
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Create the backend-specific full-text index for Book."""
+    from BookManager.search import install_search_index
+    install_search_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    """Drop the backend-specific full-text index for Book."""
+    from BookManager.search import uninstall_search_index
+    uninstall_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookManager', '0009_alter_book_options_remove_book_file_url_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookManager', '0011_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otptoken',
+            index=models.Index(fields=['user', 'created'], name='otp_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otptoken',
+            index=models.Index(fields=['user', 'otp_code'], name='otp_user_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otptoken',
+            index=models.Index(fields=['expires'], name='otp_expires_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookManager', '0012_otptoken_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_users', models.PositiveIntegerField(default=0)),
+                ('total_books', models.PositiveIntegerField(default=0)),
+                ('total_notes', models.PositiveIntegerField(default=0)),
+                ('featured_books', models.PositiveIntegerField(default=0)),
+                ('curated_books', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, help_text='Last full recount; counters are adjusted incrementally in between', null=True)),
+            ],
+            options={
+                'verbose_name': 'Site Stats',
+                'verbose_name_plural': 'Site Stats',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookManager', '0013_sitestats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='readingnote',
+            index=models.Index(fields=['book', 'is_public', 'created'], name='note_book_public_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    """Populate the new counters from existing shelf and note rows."""
+    from BookManager.counters import recount_counters
+    recount_counters(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookManager', '0014_readingnote_public_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='favorites_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='public_notes_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='read_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='reading_list_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='books_read_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='favorite_books_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='notes_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='reading_list_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
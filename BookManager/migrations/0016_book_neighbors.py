@@ -0,0 +1,58 @@
+# Generated by Django 5.0 on 2026-10-18 07:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookManager', '0015_shelf_and_note_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NeighborBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField()),
+                ('finished', models.DateTimeField(auto_now_add=True)),
+                ('full', models.BooleanField(default=False)),
+                ('books_updated', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Neighbor Build',
+                'verbose_name_plural': 'Neighbor Builds',
+                'ordering': ['-started'],
+            },
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='shelved_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, help_text='Last time the book was added to or removed from a shelf', null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='shelved_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, help_text='Last time a book was added to or removed from one of the shelves', null=True),
+        ),
+        migrations.CreateModel(
+            name='BookNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='BookManager.book')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='BookManager.book')),
+            ],
+            options={
+                'verbose_name': 'Book Neighbor',
+                'verbose_name_plural': 'Book Neighbors',
+                'ordering': ['book', 'rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookneighbor',
+            constraint=models.UniqueConstraint(fields=('book', 'rank'), name='neighbor_book_rank_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def create_stats_row(apps, schema_editor):
+    """Create and fill the stats row so incremental adjustments have a target."""
+    from BookManager.stats import refresh_site_stats
+    refresh_site_stats(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookManager', '0016_book_neighbors'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_stats_row, migrations.RunPython.noop),
+    ]
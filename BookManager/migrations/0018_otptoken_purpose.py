@@ -0,0 +1,26 @@
+# Generated by Django 5.0 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BookManager', '0017_sitestats_row'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='otptoken',
+            name='otp_user_code_idx',
+        ),
+        migrations.AddField(
+            model_name='otptoken',
+            name='purpose',
+            field=models.CharField(choices=[('verify_email', 'Verify email'), ('reset_password', 'Reset password')], default='verify_email', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='otptoken',
+            index=models.Index(fields=['user', 'purpose', 'otp_code'], name='otp_user_purpose_code_idx'),
+        ),
+    ]
@@ -1,12 +1,36 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.text import slugify
 from django.utils import timezone
 from cloudinary.models import CloudinaryField
 from .utils import generate_otp
 
 
+def cache_version(key):
+    """Return the version token stored under ``key``, creating one if missing."""
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_cache_version(key):
+    """Replace the version token under ``key``, orphaning everything cached against it."""
+    cache.set(key, uuid.uuid4().hex, timeout=None)
+
+
+def bump_cache_versions(keys):
+    """``bump_cache_version`` for several keys with a single ``set_many``."""
+    if keys:
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+
+
 class CustomUser(AbstractUser):
     """Custom user model with email as username."""
     email = models.EmailField(unique=True)
@@ -20,21 +44,38 @@ class CustomUser(AbstractUser):
 
 class OtpToken(models.Model):
     """OTP token for email verification and password reset."""
+    VERIFY_EMAIL = 'verify_email'
+    RESET_PASSWORD = 'reset_password'
+    PURPOSE_CHOICES = [
+        (VERIFY_EMAIL, 'Verify email'),
+        (RESET_PASSWORD, 'Reset password'),
+    ]
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='otp_tokens'
     )
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES, default=VERIFY_EMAIL)
     otp_code = models.CharField(max_length=6, default=generate_otp, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     expires = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created'], name='otp_user_created_idx'),
+            models.Index(fields=['user', 'purpose', 'otp_code'], name='otp_user_purpose_code_idx'),
+            models.Index(fields=['expires'], name='otp_expires_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.otp_code}"
 
 
 class Theme(models.Model):
     """Represents a curated theme like Climate, AI, etc."""
+    INDEX_VERSION_KEY = 'theme-version:index'
+
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=120, unique=True, db_index=True)
     tagline = models.CharField(
@@ -62,6 +103,21 @@ class Theme(models.Model):
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def page_version_key(slug):
+        return f"theme-version:{slug}"
+
+    @classmethod
+    def bump_page_versions(cls, slugs):
+        """
+        Invalidate cached pages for the themes with ``slugs`` and the theme index.
+
+        The version keys live in the shared default cache, so a bump made by
+        a cron job or another worker reaches every web worker.
+        """
+        keys = [cls.page_version_key(slug) for slug in set(slugs)]
+        bump_cache_versions(keys + [cls.INDEX_VERSION_KEY])
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -116,6 +172,19 @@ class Book(models.Model):
     is_featured = models.BooleanField(default=False, help_text="Show on homepage")
     view_count = models.IntegerField(default=0)
 
+    # Denormalized counters, kept current by signals (see repair_counters)
+    favorites_count = models.IntegerField(default=0, editable=False)
+    reading_list_count = models.IntegerField(default=0, editable=False)
+    read_count = models.IntegerField(default=0, editable=False)
+    public_notes_count = models.IntegerField(default=0, editable=False)
+    shelved_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        db_index=True,
+        editable=False,
+        help_text="Last time the book was added to or removed from a shelf"
+    )
+
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
@@ -168,6 +237,14 @@ class BookThemedAssociation(models.Model):
 
 class UserProfile(models.Model):
     """User profile with preferences and reading lists."""
+    SHELVES = ('favorite_books', 'reading_list', 'books_read')
+    # Counter on Book tracking how many profiles hold it on each shelf
+    BOOK_COUNTERS = {
+        'favorite_books': 'favorites_count',
+        'reading_list': 'reading_list_count',
+        'books_read': 'read_count',
+    }
+
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -195,19 +272,92 @@ class UserProfile(models.Model):
         related_name='favorited_by_users',
         blank=True
     )
+
+    # Denormalized counters, kept current by signals (see repair_counters)
+    favorite_books_count = models.IntegerField(default=0, editable=False)
+    reading_list_count = models.IntegerField(default=0, editable=False)
+    books_read_count = models.IntegerField(default=0, editable=False)
+    notes_count = models.IntegerField(default=0, editable=False)
+    shelved_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        db_index=True,
+        editable=False,
+        help_text="Last time a book was added to or removed from one of the shelves"
+    )
+
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+    @staticmethod
+    def shelf_cache_key(profile_id):
+        return f"profile-shelves:{profile_id}"
+
+    @property
+    def shelf_ids(self):
+        """
+        Book ids on each shelf, as ``{shelf_name: frozenset}``.
+
+        Loaded with one query, then memoized on the instance and in the cache
+        until an ``m2m_changed`` signal invalidates it. For rendering only;
+        decide writes with ``on_shelf`` or ``current_shelf_ids``.
+        """
+        if not hasattr(self, '_shelf_ids'):
+            key = self.shelf_cache_key(self.pk)
+            shelf_ids = cache.get(key)
+            if shelf_ids is None:
+                shelf_ids = self._load_shelf_ids()
+                cache.set(key, shelf_ids, timeout=settings.SHELF_CACHE_TTL)
+            self._shelf_ids = shelf_ids
+        return self._shelf_ids
+
+    def _load_shelf_ids(self, book_ids=None):
+        queries = [
+            getattr(UserProfile, shelf).through.objects
+            .filter(userprofile_id=self.pk, **({} if book_ids is None else {'book_id__in': book_ids}))
+            .annotate(shelf=models.Value(shelf, output_field=models.CharField()))
+            .values_list('shelf', 'book_id')
+            for shelf in self.SHELVES
+        ]
+        members = {shelf: set() for shelf in self.SHELVES}
+        for shelf, book_id in queries[0].union(*queries[1:], all=True):
+            members[shelf].add(book_id)
+        return {shelf: frozenset(ids) for shelf, ids in members.items()}
+
+    def current_shelf_ids(self, book_ids):
+        """
+        Shelf membership of ``book_ids`` read from the database, bypassing the cache.
+
+        Mutating paths use this: the cached ``shelf_ids`` may lag behind a
+        write made by another process and is only safe for rendering.
+        """
+        return self._load_shelf_ids(book_ids)
+
+    def on_shelf(self, shelf, book_id):
+        """Whether ``book_id`` is on ``shelf``, from one indexed lookup."""
+        return getattr(UserProfile, shelf).through.objects.filter(
+            userprofile_id=self.pk, book_id=book_id
+        ).exists()
+
+    def invalidate_shelf_ids(self):
+        """Drop cached shelf membership for this profile."""
+        self.__dict__.pop('_shelf_ids', None)
+        cache.delete(self.shelf_cache_key(self.pk))
+
     def is_book_favorite(self, book):
         """Check if a book is in favorites."""
-        return self.favorite_books.filter(id=book.id).exists()
+        return book.id in self.shelf_ids['favorite_books']
+
+    def is_book_in_reading_list(self, book):
+        """Check if a book is on the reading list."""
+        return book.id in self.shelf_ids['reading_list']
 
     def is_book_read(self, book):
         """Check if a book is marked as read."""
-        return self.books_read.filter(id=book.id).exists()
+        return book.id in self.shelf_ids['books_read']
 
 
 class ReadingNote(models.Model):
@@ -234,6 +384,127 @@ class ReadingNote(models.Model):
         ordering = ['-created']
         verbose_name = 'Reading Note'
         verbose_name_plural = 'Reading Notes'
+        indexes = [
+            models.Index(fields=['book', 'is_public', 'created'], name='note_book_public_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s note on {self.book.title}"
+
+    @staticmethod
+    def public_notes_version_key(book_id):
+        return f"public-notes-version:{book_id}"
+
+    @classmethod
+    def public_notes_version(cls, book_id):
+        """Current cache version of a book's public notes pages."""
+        return cache_version(cls.public_notes_version_key(book_id))
+
+    @classmethod
+    def bump_public_notes_version(cls, book_id):
+        """Invalidate every cached public notes page for a book."""
+        bump_cache_version(cls.public_notes_version_key(book_id))
+
+    @classmethod
+    def bump_public_notes_versions(cls, book_ids):
+        """Invalidate the cached public notes pages of several books in one cache write."""
+        bump_cache_versions([cls.public_notes_version_key(book_id) for book_id in book_ids])
+
+
+class OutboundEmail(models.Model):
+    """Email queued for delivery by the send_queued_email worker."""
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+        verbose_name = 'Outbound Email'
+        verbose_name_plural = 'Outbound Emails'
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)}"
+
+
+class SiteStats(models.Model):
+    """Single-row table of platform counters for the admin dashboard."""
+    total_users = models.PositiveIntegerField(default=0)
+    total_books = models.PositiveIntegerField(default=0)
+    total_notes = models.PositiveIntegerField(default=0)
+    featured_books = models.PositiveIntegerField(default=0)
+    curated_books = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Last full recount; counters are adjusted incrementally in between"
+    )
+
+    class Meta:
+        verbose_name = 'Site Stats'
+        verbose_name_plural = 'Site Stats'
+
+    def __str__(self):
+        return f"Site stats (refreshed {self.refreshed_at})"
+
+
+class BookNeighbor(models.Model):
+    """Precomputed "readers also liked" neighbor of a book, from shelf co-occurrence."""
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='neighbors'
+    )
+    neighbor = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['book', 'rank']
+        verbose_name = 'Book Neighbor'
+        verbose_name_plural = 'Book Neighbors'
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='neighbor_book_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+
+class NeighborBuild(models.Model):
+    """Log of build_book_neighbors runs; the last one is the incremental watermark."""
+    started = models.DateTimeField()
+    finished = models.DateTimeField(auto_now_add=True)
+    full = models.BooleanField(default=False)
+    books_updated = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started']
+        verbose_name = 'Neighbor Build'
+        verbose_name_plural = 'Neighbor Builds'
+
+    def __str__(self):
+        kind = 'full' if self.full else 'incremental'
+        return f"{kind} build at {self.started} ({self.books_updated} books)"
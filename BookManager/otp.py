@@ -0,0 +1,98 @@
+import hashlib
+import hmac
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import OtpToken
+
+
+VERIFY_EMAIL = OtpToken.VERIFY_EMAIL
+RESET_PASSWORD = OtpToken.RESET_PASSWORD
+
+VALID = 'valid'
+EXPIRED = 'expired'
+INVALID = 'invalid'
+
+
+def _totp_secret(user, purpose):
+    """
+    Derive a per-user, per-purpose secret.
+
+    The password hash is mixed in, so reset codes stop working as soon as
+    the password changes.
+    """
+    message = f"{purpose}:{user.pk}:{user.email}:{user.password}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).digest()
+
+
+def _hotp(secret, counter, digits=6):
+    """RFC 4226 HMAC-based one-time password for ``counter``."""
+    digest = hmac.new(secret, counter.to_bytes(8, 'big'), hashlib.sha1).digest()
+    offset = digest[-1] & 0x0F
+    value = int.from_bytes(digest[offset:offset + 4], 'big') & 0x7FFFFFFF
+    return str(value % 10 ** digits).zfill(digits)
+
+
+def _current_step():
+    return int(time.time()) // settings.OTP['STEP']
+
+
+def issue_otp(user, purpose):
+    """
+    Return a one-time code for ``user`` to receive by email.
+
+    In 'totp' mode the code is computed from the current time step and
+    nothing is written; in 'token' mode an OtpToken row is created.
+    """
+    if settings.OTP['MODE'] == 'totp':
+        return _hotp(_totp_secret(user, purpose), _current_step())
+    otp = OtpToken.objects.create(
+        user=user,
+        purpose=purpose,
+        expires=timezone.now() + timezone.timedelta(minutes=2)
+    )
+    return otp.otp_code
+
+
+def verify_otp(user, code, purpose):
+    """Check ``code`` for ``user``; returns VALID, EXPIRED or INVALID."""
+    code = (code or '').strip()
+    if not code:
+        return INVALID
+    if settings.OTP['MODE'] == 'totp':
+        return _verify_totp(user, code, purpose)
+    return _verify_token(user, code, purpose)
+
+
+def _verify_totp(user, code, purpose):
+    config = settings.OTP
+    secret = _totp_secret(user, purpose)
+    step = _current_step()
+    for counter in range(step, step - config['WINDOW'] - 1, -1):
+        if hmac.compare_digest(_hotp(secret, counter), code):
+            # Single use: the first verification claims this time step.
+            used_key = f"otp-used:{purpose}:{user.pk}:{counter}"
+            if not cache.add(used_key, True, timeout=config['STEP'] * (config['WINDOW'] + 1)):
+                return INVALID
+            return VALID
+    oldest = step - config['EXPIRED_LOOKBACK']
+    for counter in range(step - config['WINDOW'] - 1, oldest - 1, -1):
+        if hmac.compare_digest(_hotp(secret, counter), code):
+            return EXPIRED
+    return INVALID
+
+
+def _verify_token(user, code, purpose):
+    otp = (
+        OtpToken.objects.filter(user=user, purpose=purpose, otp_code=code)
+        .order_by('-created').first()
+    )
+    if otp is None:
+        return INVALID
+    if not otp.expires or otp.expires < timezone.now():
+        return EXPIRED
+    # Consume on verify: only the request whose DELETE removes the row wins.
+    deleted, _ = OtpToken.objects.filter(pk=otp.pk).delete()
+    return VALID if deleted else INVALID
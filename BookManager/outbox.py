@@ -0,0 +1,130 @@
+import random
+import threading
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import OutboundEmail
+
+
+def queue_email(subject, message, recipient_list, from_email=None, eager=None):
+    """
+    Queue an email in the outbox instead of sending it inline.
+
+    The row is written inside the caller's transaction, so an email is only
+    ever delivered for data that was committed. With ``eager`` (by default
+    EMAIL_OUTBOX['EAGER']) this email is also delivered from a background
+    thread once the transaction commits; time-sensitive mail such as OTP
+    codes passes ``eager=True`` rather than waiting for the worker.
+    """
+    email = OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.EMAIL_HOST_USER or '',
+        recipients=list(recipient_list),
+    )
+    if settings.EMAIL_OUTBOX['EAGER'] if eager is None else eager:
+        transaction.on_commit(lambda: _deliver_in_background([email.pk]))
+    return email
+
+
+def _deliver_in_background(ids):
+    def deliver():
+        try:
+            deliver_batch(ids=ids)
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=deliver, daemon=True).start()
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, in seconds, after ``attempts`` failures."""
+    base = settings.EMAIL_OUTBOX['BACKOFF_SECONDS']
+    delay = base * 2 ** (attempts - 1)
+    return delay + random.uniform(0, delay / 2)
+
+
+def _claim(batch_size, ids):
+    """
+    Lease up to ``batch_size`` due emails to this worker and commit at once.
+
+    Claimed rows have ``next_attempt_at`` pushed CLAIM_SECONDS ahead, so no
+    other worker picks them up while they are sent outside any transaction.
+    An email whose sender dies mid-batch is retried once the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = OutboundEmail.objects.select_for_update(skip_locked=True).filter(
+            status=OutboundEmail.PENDING, next_attempt_at__lte=now
+        )
+        if ids is not None:
+            due = due.filter(pk__in=ids)
+        batch = list(due.order_by('next_attempt_at', 'id')[:batch_size])
+        if batch:
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt_at=now + timezone.timedelta(
+                    seconds=settings.EMAIL_OUTBOX['CLAIM_SECONDS']
+                )
+            )
+    return batch
+
+
+def deliver_batch(batch_size=None, max_attempts=None, connection=None, ids=None):
+    """
+    Deliver up to ``batch_size`` due emails over one SMTP connection.
+
+    ``ids`` limits the batch to those emails, so an eager send is not
+    queued behind a backlog. Emails already claimed or sent are skipped.
+    The batch is claimed and its results recorded in two short
+    transactions; no transaction is open while SMTP is talked to.
+
+    Failed emails are rescheduled with exponential backoff; emails that
+    reach ``max_attempts`` failures are marked dead. Returns a
+    ``(sent, failed, dead)`` tuple.
+    """
+    config = settings.EMAIL_OUTBOX
+    batch_size = batch_size or config['BATCH_SIZE']
+    max_attempts = max_attempts or config['MAX_ATTEMPTS']
+
+    batch = _claim(batch_size, ids)
+    if not batch:
+        return 0, 0, 0
+
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = dead = 0
+    try:
+        for email in batch:
+            message = EmailMessage(
+                email.subject, email.body, email.from_email, email.recipients,
+                connection=connection,
+            )
+            try:
+                connection.open()
+                message.send()
+            except Exception as exc:
+                email.attempts += 1
+                email.last_error = f"{type(exc).__name__}: {exc}"[:2000]
+                if email.attempts >= max_attempts:
+                    email.status = OutboundEmail.DEAD
+                    dead += 1
+                else:
+                    email.next_attempt_at = timezone.now() + timezone.timedelta(
+                        seconds=retry_delay(email.attempts)
+                    )
+                    failed += 1
+                # The connection may be unusable after an error; reopen lazily.
+                connection.close()
+            else:
+                email.status = OutboundEmail.SENT
+                email.sent_at = timezone.now()
+                sent += 1
+    finally:
+        connection.close()
+
+    with transaction.atomic():
+        OutboundEmail.objects.bulk_update(
+            batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+        )
+    return sent, failed, dead
@@ -0,0 +1,150 @@
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(values):
+    """Encode a tuple of ordering values as an opaque URL-safe cursor."""
+    payload = [
+        {'dt': value.isoformat()} if isinstance(value, datetime.datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by ``encode_cursor``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return tuple(
+            datetime.datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+            for value in payload
+        )
+    except (ValueError, TypeError, KeyError) as exc:
+        raise InvalidCursor(str(exc)) from exc
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the "row comes after ``values``" condition for an ordering.
+
+    For ``['book__title', '-created', 'id']`` this is
+    ``title > t OR (title = t AND created < c) OR (title = t AND created = c AND id > i)``.
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _model_field(model, name):
+    parts = name.split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+    return model._meta.get_field(parts[-1])
+
+
+def clean_cursor_values(model, ordering, values):
+    """
+    Convert decoded cursor ``values`` to the types of ``ordering``'s fields.
+
+    Cursors come from the client, so a value of the wrong type (a string
+    for an id, an out-of-range integer) raises InvalidCursor instead of
+    failing when the query is built or run.
+    """
+    if len(values) != len(ordering):
+        raise InvalidCursor('cursor does not match ordering')
+    cleaned = []
+    for field_name, value in zip(ordering, values):
+        field = _model_field(model, field_name.lstrip('-'))
+        try:
+            if value is None or isinstance(value, (list, dict)):
+                raise ValidationError('unexpected value')
+            value = field.to_python(value)
+            field.run_validators(value)
+        except (ValidationError, ValueError, TypeError) as exc:
+            raise InvalidCursor(f'invalid value for {field_name}') from exc
+        cleaned.append(value)
+    return cleaned
+
+
+def _resolve(obj, field):
+    for part in field.lstrip('-').split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=20):
+    """
+    Return ``(items, next_cursor)`` for the page after ``cursor``.
+
+    ``ordering`` must end in a unique field so that every row has a distinct
+    position. ``next_cursor`` is None on the last page.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = clean_cursor_values(queryset.model, ordering, decode_cursor(cursor))
+        queryset = queryset.filter(keyset_filter(ordering, values))
+    items = list(queryset[:page_size + 1])
+    if len(items) <= page_size:
+        return items, None
+    items = items[:page_size]
+    last = items[-1]
+    return items, encode_cursor([_resolve(last, field) for field in ordering])
+
+
+def estimate_row_count(queryset):
+    """
+    Return the planner's row estimate for an unfiltered ``queryset``.
+
+    Only PostgreSQL keeps a cheap estimate (``pg_class.reltuples``); None is
+    returned for filtered querysets, other backends, or tables that have not
+    been analyzed yet.
+    """
+    if queryset.query.where or queryset.query.distinct:
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that skips ``COUNT(*)`` on large unfiltered tables.
+
+    Tables whose estimate is below ``exact_below`` rows are still counted
+    exactly, since small estimates are the least reliable.
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_row_count(self.object_list)
+        if estimate is not None and estimate >= self.exact_below:
+            return estimate
+        return super().count
@@ -0,0 +1,159 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Book, BookNeighbor, NeighborBuild, UserProfile
+
+
+def readers_also_liked(book, limit=None):
+    """Books most often shelved together with ``book``, from one indexed lookup."""
+    limit = limit or settings.RECOMMENDER['DISPLAY']
+    rows = (
+        BookNeighbor.objects.filter(book_id=book.pk)
+        .select_related('neighbor')
+        .order_by('rank')[:limit]
+    )
+    return [row.neighbor for row in rows]
+
+
+def load_shelf_matrix():
+    """
+    Build the sparse profile x book matrix from every shelf.
+
+    A cell is the sum of RECOMMENDER['WEIGHTS'] for the shelves holding the
+    book. Returns ``(matrix, profile_ids, book_ids)``; row ``i`` and column
+    ``j`` are ``profile_ids[i]`` and ``book_ids[j]``, both sorted.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    weights = settings.RECOMMENDER['WEIGHTS']
+    profiles, books, values = [], [], []
+    for shelf in UserProfile.SHELVES:
+        pairs = np.array(
+            list(
+                getattr(UserProfile, shelf).through.objects
+                .values_list('userprofile_id', 'book_id')
+                .iterator(chunk_size=10000)
+            ),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        profiles.append(pairs[:, 0])
+        books.append(pairs[:, 1])
+        values.append(np.full(len(pairs), weights[shelf], dtype=np.float32))
+
+    profile_ids, rows = np.unique(np.concatenate(profiles), return_inverse=True)
+    book_ids, cols = np.unique(np.concatenate(books), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.concatenate(values), (rows, cols)),
+        shape=(len(profile_ids), len(book_ids)),
+    )
+    return matrix, profile_ids, book_ids
+
+
+def top_neighbors(matrix, columns, top_k, min_score=0.0, chunk_size=500):
+    """
+    Yield ``(column, neighbor_columns, scores)`` for each of ``columns``.
+
+    Scores are cosine similarities between book columns; only the ``top_k``
+    best neighbors scoring at least ``min_score`` are kept. Columns are
+    processed in chunks so only a ``chunk_size`` x books slice of the
+    similarity matrix is ever materialized.
+    """
+    import numpy as np
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    by_column = matrix.tocsc()
+    for start in range(0, len(columns), chunk_size):
+        chunk = columns[start:start + chunk_size]
+        similar = (by_column[:, chunk].T @ matrix).tocsr()
+        for i, column in enumerate(chunk):
+            lo, hi = similar.indptr[i], similar.indptr[i + 1]
+            neighbors = similar.indices[lo:hi]
+            scores = similar.data[lo:hi] / (norms[column] * norms[neighbors])
+            keep = (neighbors != column) & (scores >= min_score)
+            neighbors, scores = neighbors[keep], scores[keep]
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+                neighbors, scores = neighbors[best], scores[best]
+            order = np.argsort(-scores, kind='stable')
+            yield column, neighbors[order], scores[order]
+
+
+def _dirty_columns(matrix, profile_ids, book_ids, since):
+    """Columns whose similarities may have changed since ``since``, plus vanished book ids."""
+    import numpy as np
+
+    changed_books = np.fromiter(
+        Book.objects.filter(shelved_at__gte=since).values_list('id', flat=True), dtype=np.int64
+    )
+    changed_profiles = np.fromiter(
+        UserProfile.objects.filter(shelved_at__gte=since).values_list('id', flat=True), dtype=np.int64
+    )
+    # A changed book's norm moves every score against it, and a changed
+    # profile moves the co-occurrence of everything it shelves, so recompute
+    # every book shelved by a changed profile or by a reader of a changed book.
+    changed_columns = np.flatnonzero(np.isin(book_ids, changed_books))
+    readers = np.unique(matrix.tocsc()[:, changed_columns].indices)
+    rows = np.union1d(np.flatnonzero(np.isin(profile_ids, changed_profiles)), readers)
+    columns = np.union1d(changed_columns, np.unique(matrix[rows].indices))
+    vanished = np.setdiff1d(changed_books, book_ids)
+    return columns.astype(np.int64), vanished
+
+
+def build_neighbors(full=False, top_k=None, batch_size=None):
+    """
+    Recompute "readers also liked" neighbors and store them in BookNeighbor.
+
+    An incremental build only recomputes books shelved, or co-shelved by a
+    profile that changed, since the previous build started. Returns the
+    NeighborBuild row logging the run.
+    """
+    import numpy as np
+
+    config = settings.RECOMMENDER
+    top_k = top_k or config['TOP_K']
+    batch_size = batch_size or config['BATCH_SIZE']
+    started = timezone.now()
+    previous = NeighborBuild.objects.first()
+    full = full or previous is None
+
+    matrix, profile_ids, book_ids = load_shelf_matrix()
+    if full:
+        columns = np.arange(len(book_ids))
+        BookNeighbor.objects.filter(
+            book__favorites_count=0, book__reading_list_count=0, book__read_count=0
+        ).delete()
+    else:
+        columns, vanished = _dirty_columns(matrix, profile_ids, book_ids, previous.started)
+        BookNeighbor.objects.filter(book_id__in=vanished.tolist()).delete()
+
+    updated = 0
+    results = top_neighbors(matrix, columns, top_k, config['MIN_SCORE'], chunk_size=batch_size)
+    while True:
+        batch = list(islice(results, batch_size))
+        if not batch:
+            break
+        rows = [
+            BookNeighbor(book_id=int(book_ids[column]), neighbor_id=int(book_ids[neighbor]),
+                         rank=rank, score=float(score))
+            for column, neighbors, scores in batch
+            for rank, (neighbor, score) in enumerate(zip(neighbors, scores))
+        ]
+        batch_ids = [int(book_ids[column]) for column, _, _ in batch]
+        with transaction.atomic():
+            # Books deleted since the matrix was loaded would violate the FKs.
+            existing = set(
+                Book.objects.filter(
+                    id__in={row.book_id for row in rows} | {row.neighbor_id for row in rows}
+                ).values_list('id', flat=True)
+            )
+            BookNeighbor.objects.filter(book_id__in=batch_ids).delete()
+            BookNeighbor.objects.bulk_create(
+                [row for row in rows if row.book_id in existing and row.neighbor_id in existing]
+            )
+        updated += len(batch)
+
+    return NeighborBuild.objects.create(started=started, full=full, books_updated=updated)
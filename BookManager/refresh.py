@@ -0,0 +1,98 @@
+import asyncio
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .ingest import NO_DESCRIPTION, UNKNOWN_TITLE, parse_volume
+from .models import Book, BookThemedAssociation, Theme
+from .utils import fetch_volumes
+
+
+REFRESH_FIELDS = [
+    'title', 'slug', 'authors', 'description', 'published_date', 'cover_image',
+    'info_link', 'preview_link', 'page_count', 'categories',
+]
+
+
+def stale_books(limit, max_age_days):
+    """The ``limit`` least recently updated books not updated for ``max_age_days``."""
+    return list(
+        Book.objects.filter(updated__lt=timezone.now() - datetime.timedelta(days=max_age_days))
+        .order_by('updated', 'pk')
+        .only('id', 'google_books_id', *REFRESH_FIELDS)[:limit]
+    )
+
+
+def changed_fields(book, item):
+    """
+    Apply a fresh volume ``item`` to ``book`` and return the names of changed fields.
+
+    Fields the API left out, or returned empty, keep their stored value.
+    """
+    fields = parse_volume(item)
+    if fields is None:
+        return []
+    missing = {'', None, NO_DESCRIPTION}
+    if fields['title'] == UNKNOWN_TITLE:
+        missing |= {fields['title'], fields['slug']}
+    changed = []
+    for name in REFRESH_FIELDS:
+        value = fields[name]
+        if value not in missing and value != getattr(book, name):
+            setattr(book, name, value)
+            changed.append(name)
+    return changed
+
+
+def refresh_books(limit=None, max_age_days=None, concurrency=None, rate=None):
+    """
+    Re-fetch the stalest books from the volumes endpoint and store what changed.
+
+    Changed books are written with one ``bulk_update`` per set of changed
+    columns; every book checked has ``updated`` set, so it moves to the back
+    of the queue. Books whose fetch failed are left as they were and are
+    picked again next run. Returns ``(checked, changed, failed)``.
+    """
+    config = settings.METADATA_REFRESH
+    books = stale_books(
+        limit or config['BATCH_SIZE'],
+        config['MAX_AGE_DAYS'] if max_age_days is None else max_age_days,
+    )
+    if not books:
+        return 0, 0, 0
+    items = asyncio.run(fetch_volumes(
+        [book.google_books_id for book in books],
+        concurrency=concurrency or config['CONCURRENCY'],
+        rate=rate or config['RATE'],
+    ))
+
+    now = timezone.now()
+    by_columns = defaultdict(list)
+    checked = []
+    failed = 0
+    for book in books:
+        item = items.get(book.google_books_id)
+        if item is None:
+            failed += 1
+            continue
+        checked.append(book.pk)
+        changed = changed_fields(book, item) if item else []
+        if changed:
+            by_columns[tuple(changed)].append(book)
+
+    with transaction.atomic():
+        for columns, rows in by_columns.items():
+            Book.objects.bulk_update(rows, columns)
+        Book.objects.filter(pk__in=checked).update(updated=now)
+
+    changed_ids = [book.pk for rows in by_columns.values() for book in rows]
+    # bulk_update skips post_save, so drop cached theme pages here
+    slugs = set(
+        BookThemedAssociation.objects.filter(book_id__in=changed_ids)
+        .values_list('theme__slug', flat=True)
+    )
+    if slugs:
+        Theme.bump_page_versions(slugs)
+    return len(checked), len(changed_ids), failed
@@ -0,0 +1,153 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from .models import Book
+
+
+BOOK_TABLE = Book._meta.db_table
+FTS_TABLE = f'{BOOK_TABLE}_fts'
+POSTGRES_INDEX = f'{BOOK_TABLE}_search_idx'
+
+# Must match the indexed expression exactly for Postgres to use the GIN index.
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(authors, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(categories, '')), 'C') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'D')"
+)
+
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_ai" AFTER INSERT ON "{BOOK_TABLE}" BEGIN
+            INSERT INTO "{FTS_TABLE}"(rowid, title, authors, categories, description)
+            VALUES (new.id, new.title, new.authors, new.categories, new.description);
+        END
+    """,
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_ad" AFTER DELETE ON "{BOOK_TABLE}" BEGIN
+            INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, title, authors, categories, description)
+            VALUES ('delete', old.id, old.title, old.authors, old.categories, old.description);
+        END
+    """,
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_au"
+        AFTER UPDATE OF title, authors, categories, description ON "{BOOK_TABLE}" BEGIN
+            INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, title, authors, categories, description)
+            VALUES ('delete', old.id, old.title, old.authors, old.categories, old.description);
+            INSERT INTO "{FTS_TABLE}"(rowid, title, authors, categories, description)
+            VALUES (new.id, new.title, new.authors, new.categories, new.description);
+        END
+    """,
+}
+
+SEARCH_FIELDS = ('title', 'authors', 'categories', 'description')
+
+
+def install_search_index(schema_editor):
+    """
+    Create the backend-specific full-text index for Book.
+
+    SQLite gets an external-content FTS5 table kept in sync by triggers, so
+    rows written through ``save()``, ``bulk_create()`` or ``update()`` are
+    all indexed. Postgres gets a GIN index over a weighted tsvector. The
+    function is idempotent and restores triggers dropped when SQLite
+    migrations rebuild the Book table.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [BOOK_TABLE],
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+        if set(SQLITE_TRIGGERS) <= existing:
+            return
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" USING fts5('
+            f'title, authors, categories, description, '
+            f"content='{BOOK_TABLE}', content_rowid='id')"
+        )
+        for statement in SQLITE_TRIGGERS.values():
+            schema_editor.execute(statement)
+        schema_editor.execute(f'INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}") VALUES (\'rebuild\')')
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{POSTGRES_INDEX}" '
+            f'ON "{BOOK_TABLE}" USING GIN (({POSTGRES_VECTOR}))'
+        )
+
+
+def uninstall_search_index(schema_editor):
+    """Drop the backend-specific full-text index for Book."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for name in SQLITE_TRIGGERS:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS "{name}"')
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{POSTGRES_INDEX}"')
+
+
+def _tokens(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _sqlite_search(query, limit):
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+    # Quote every token so user input can't inject FTS5 syntax; prefix-match the last one.
+    match = ' '.join(f'"{token}"' for token in tokens[:-1])
+    match = f'{match} "{tokens[-1]}"*'.strip()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s '
+            f'ORDER BY bm25("{FTS_TABLE}", 10.0, 5.0, 2.0, 1.0) LIMIT %s',
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _postgres_search(query, limit):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT id FROM "{BOOK_TABLE}", websearch_to_tsquery(\'english\', %s) query '
+            f'WHERE ({POSTGRES_VECTOR}) @@ query '
+            f'ORDER BY ts_rank_cd(({POSTGRES_VECTOR}), query) DESC, id LIMIT %s',
+            [query, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_search(query, limit):
+    condition = Q()
+    for token in _tokens(query):
+        condition &= Q(title__icontains=token) | Q(authors__icontains=token)
+    return list(Book.objects.filter(condition).values_list('id', flat=True)[:limit])
+
+
+def search_book_ids(query, limit=24):
+    """Return ids of locally stored books matching ``query``, best match first."""
+    query = query.strip()
+    if not query:
+        return []
+    if connection.vendor == 'sqlite':
+        return _sqlite_search(query, limit)
+    if connection.vendor == 'postgresql':
+        return _postgres_search(query, limit)
+    return _fallback_search(query, limit)
+
+
+def search_books(query, limit=24):
+    """Return locally stored Book rows matching ``query`` in rank order."""
+    ids = search_book_ids(query, limit)
+    books = Book.objects.in_bulk(ids)
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+def has_enough_results(books):
+    """Check if local results are good enough to skip the remote API."""
+    return len(books) >= settings.LOCAL_SEARCH_MIN_RESULTS
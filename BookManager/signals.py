@@ -1,37 +1,293 @@
-from django.db.models.signals import post_save
+from django.db import connections
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, post_migrate, m2m_changed
 from django.conf import settings
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.utils import timezone
-from .models import OtpToken, UserProfile
-from .utils import generate_otp
+from .models import UserProfile, Book, ReadingNote, Theme, BookThemedAssociation
+from .otp import issue_otp, VERIFY_EMAIL
+from .outbox import queue_email
+from .stats import adjust_site_stats
+from .counters import adjust_counters, in_bulk_delete
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_otp_token(sender, instance, created, **kwargs):
     """Create and send OTP token when a new inactive user is created."""
     if created and not instance.is_active:
-        otp = OtpToken.objects.create(
-            user=instance,
-            otp_code=generate_otp(),
-            expires=timezone.now() + timezone.timedelta(minutes=2)
-        )
+        otp_code = issue_otp(instance, VERIFY_EMAIL)
         
         subject = "Email Verification"
         message = (
             f"Hello {instance.username},\n\n"
-            f"Your OTP is {otp.otp_code}. It expires in 2 minutes. "
+            f"Your OTP is {otp_code}. It expires in 2 minutes. "
             f"Use the URL below to verify your email:\n\n"
             f"http://127.0.0.1:8000/verify_email/{instance.username}"
         )
-        sender_email = settings.EMAIL_HOST_USER
-        receiver_email = [instance.email]
-        
-        send_mail(subject, message, sender_email, receiver_email, fail_silently=False)
+        queue_email(subject, message, [instance.email], eager=True)
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_user_profile(sender, instance, created, **kwargs):
     """Create user profile when a new user is created."""
     if created:
-        UserProfile.objects.get_or_create(user=instance)
\ No newline at end of file
+        UserProfile.objects.get_or_create(user=instance)
+
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using, **kwargs):
+    """Restore the Book full-text index after migrations rebuild the table."""
+    if sender.name != 'BookManager':
+        return
+    from .search import BOOK_TABLE, install_search_index
+    connection = connections[using]
+    if BOOK_TABLE not in connection.introspection.table_names():
+        return
+    with connection.schema_editor() as schema_editor:
+        install_search_index(schema_editor)
+
+
+def invalidate_shelf_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate cached shelf membership when a shelf M2M changes."""
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        if action != 'pre_clear':
+            instance.invalidate_shelf_ids()
+        return
+    # Reverse side: ``instance`` is a Book and ``pk_set`` holds profile ids.
+    if action == 'pre_clear':
+        pk_set = set(sender.objects.filter(book_id=instance.pk).values_list('userprofile_id', flat=True))
+        instance._cleared_profile_ids = pk_set
+    elif action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_profile_ids', set())
+    cache.delete_many([UserProfile.shelf_cache_key(pk) for pk in pk_set or ()])
+
+
+for shelf in UserProfile.SHELVES:
+    m2m_changed.connect(
+        invalidate_shelf_cache,
+        sender=getattr(UserProfile, shelf).through,
+        dispatch_uid=f'invalidate_shelf_cache_{shelf}',
+    )
+
+
+SHELF_THROUGH = {getattr(UserProfile, shelf).through: shelf for shelf in UserProfile.SHELVES}
+
+
+def count_shelf_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep Book and UserProfile shelf counters current as shelf M2Ms change.
+
+    ``post_add`` only reports rows that were actually inserted, but removals
+    report whatever was requested, so the ids that are really on the shelf
+    are captured before the rows go away.
+    """
+    shelf = SHELF_THROUGH[sender]
+    own_column, other_column = ('book_id', 'userprofile_id') if reverse else ('userprofile_id', 'book_id')
+    stash = f'_removed_{shelf}'
+
+    if action in ('pre_remove', 'pre_clear'):
+        rows = sender.objects.filter(**{own_column: instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(**{f'{other_column}__in': pk_set})
+        instance.__dict__[stash] = set(rows.values_list(other_column, flat=True))
+        return
+    if action == 'post_add':
+        ids, delta = pk_set or set(), 1
+    elif action in ('post_remove', 'post_clear'):
+        ids, delta = instance.__dict__.pop(stash, set()), -1
+    else:
+        return
+    if not ids:
+        return
+
+    profile_field = f'{shelf}_count'
+    book_field = UserProfile.BOOK_COUNTERS[shelf]
+    touch = ('shelved_at',)
+    if reverse:
+        adjust_counters(Book.objects.filter(pk=instance.pk), touch, **{book_field: delta * len(ids)})
+        adjust_counters(UserProfile.objects.filter(pk__in=ids), touch, **{profile_field: delta})
+    else:
+        adjust_counters(UserProfile.objects.filter(pk=instance.pk), touch, **{profile_field: delta * len(ids)})
+        adjust_counters(Book.objects.filter(pk__in=ids), touch, **{book_field: delta})
+
+
+for through, shelf in SHELF_THROUGH.items():
+    m2m_changed.connect(
+        count_shelf_change,
+        sender=through,
+        dispatch_uid=f'count_shelf_change_{shelf}',
+    )
+
+
+@receiver(pre_delete, sender=Book)
+def uncount_deleted_book_shelves(sender, instance, **kwargs):
+    """Deleting a book removes its shelf rows without m2m signals; adjust profiles first."""
+    for through, shelf in SHELF_THROUGH.items():
+        profile_ids = through.objects.filter(book_id=instance.pk).values_list('userprofile_id', flat=True)
+        adjust_counters(UserProfile.objects.filter(pk__in=profile_ids), ('shelved_at',), **{f'{shelf}_count': -1})
+
+
+@receiver(pre_delete, sender=UserProfile)
+def uncount_deleted_profile_shelves(sender, instance, **kwargs):
+    """Deleting a profile removes its shelf rows without m2m signals; adjust books first."""
+    if in_bulk_delete():
+        return
+    for through, shelf in SHELF_THROUGH.items():
+        book_ids = through.objects.filter(userprofile_id=instance.pk).values_list('book_id', flat=True)
+        adjust_counters(Book.objects.filter(pk__in=book_ids), ('shelved_at',), **{UserProfile.BOOK_COUNTERS[shelf]: -1})
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def count_created_user(sender, instance, created, **kwargs):
+    """Keep SiteStats.total_users current between full recounts."""
+    if created:
+        adjust_site_stats(total_users=1)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def count_deleted_user(sender, instance, **kwargs):
+    if in_bulk_delete():
+        return
+    adjust_site_stats(total_users=-1)
+
+
+@receiver(post_save, sender=ReadingNote)
+def count_created_note(sender, instance, created, **kwargs):
+    """Keep SiteStats.total_notes current between full recounts."""
+    if created:
+        adjust_site_stats(total_notes=1)
+
+
+@receiver(post_delete, sender=ReadingNote)
+def count_deleted_note(sender, instance, **kwargs):
+    if in_bulk_delete():
+        return
+    adjust_site_stats(total_notes=-1)
+
+
+@receiver(pre_save, sender=ReadingNote)
+def remember_note_visibility(sender, instance, update_fields=None, **kwargs):
+    """Remember the stored is_public flag so post_save can diff it."""
+    instance._stored_is_public = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and 'is_public' not in update_fields:
+        return
+    instance._stored_is_public = (
+        ReadingNote.objects.filter(pk=instance.pk).values_list('is_public', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=ReadingNote)
+def count_saved_note(sender, instance, created, **kwargs):
+    """Keep UserProfile.notes_count and Book.public_notes_count current."""
+    book = Book.objects.filter(pk=instance.book_id)
+    if created:
+        adjust_counters(UserProfile.objects.filter(user_id=instance.user_id), notes_count=1)
+        adjust_counters(book, public_notes_count=int(instance.is_public))
+        return
+    was_public = getattr(instance, '_stored_is_public', None)
+    if was_public is not None:
+        adjust_counters(book, public_notes_count=int(instance.is_public) - int(was_public))
+
+
+@receiver(post_delete, sender=ReadingNote)
+def uncount_deleted_note(sender, instance, **kwargs):
+    if in_bulk_delete():
+        return
+    adjust_counters(UserProfile.objects.filter(user_id=instance.user_id), notes_count=-1)
+    adjust_counters(Book.objects.filter(pk=instance.book_id), public_notes_count=-int(instance.is_public))
+
+
+@receiver(post_save, sender=ReadingNote)
+@receiver(post_delete, sender=ReadingNote)
+def invalidate_public_notes(sender, instance, **kwargs):
+    """Drop cached public notes pages for the note's book."""
+    if kwargs['signal'] is post_delete and in_bulk_delete():
+        return
+    ReadingNote.bump_public_notes_version(instance.book_id)
+
+
+@receiver(pre_save, sender=Book)
+def remember_book_flags(sender, instance, update_fields=None, **kwargs):
+    """Remember stored featured/curated flags so post_save can diff them."""
+    instance._stored_flags = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not {'is_featured', 'is_curated'} & set(update_fields):
+        return
+    instance._stored_flags = (
+        Book.objects.filter(pk=instance.pk).values_list('is_featured', 'is_curated').first()
+    )
+
+
+@receiver(post_save, sender=Book)
+def count_saved_book(sender, instance, created, **kwargs):
+    """Keep SiteStats book counters current between full recounts."""
+    if created:
+        adjust_site_stats(
+            total_books=1,
+            featured_books=int(instance.is_featured),
+            curated_books=int(instance.is_curated),
+        )
+        return
+    stored = getattr(instance, '_stored_flags', None)
+    if stored is not None:
+        was_featured, was_curated = stored
+        adjust_site_stats(
+            featured_books=int(instance.is_featured) - int(was_featured),
+            curated_books=int(instance.is_curated) - int(was_curated),
+        )
+
+
+@receiver(post_delete, sender=Book)
+def count_deleted_book(sender, instance, **kwargs):
+    if in_bulk_delete():
+        return
+    adjust_site_stats(
+        total_books=-1,
+        featured_books=-int(instance.is_featured),
+        curated_books=-int(instance.is_curated),
+    )
+
+
+@receiver(pre_save, sender=Theme)
+def remember_theme_slug(sender, instance, **kwargs):
+    """Remember the stored slug so a renamed theme's old page is invalidated too."""
+    instance._stored_slug = None
+    if instance.pk is not None:
+        instance._stored_slug = Theme.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Theme)
+def invalidate_saved_theme(sender, instance, **kwargs):
+    """Drop cached theme pages after a theme edit."""
+    slugs = [instance.slug]
+    if getattr(instance, '_stored_slug', None):
+        slugs.append(instance._stored_slug)
+    Theme.bump_page_versions(slugs)
+
+
+@receiver(post_delete, sender=Theme)
+def invalidate_deleted_theme(sender, instance, **kwargs):
+    Theme.bump_page_versions([instance.slug])
+
+
+@receiver(post_save, sender=BookThemedAssociation)
+@receiver(post_delete, sender=BookThemedAssociation)
+def invalidate_theme_books(sender, instance, **kwargs):
+    """Drop the cached page of the theme a book was added to, edited in or removed from."""
+    Theme.bump_page_versions(Theme.objects.filter(pk=instance.theme_id).values_list('slug', flat=True))
+
+
+@receiver(post_save, sender=Book)
+def invalidate_book_themes(sender, instance, created, **kwargs):
+    """Drop cached pages of every theme showing an edited book."""
+    if created:
+        return
+    slugs = list(
+        BookThemedAssociation.objects.filter(book_id=instance.pk).values_list('theme__slug', flat=True)
+    )
+    if slugs:
+        Theme.bump_page_versions(slugs)
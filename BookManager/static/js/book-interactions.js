@@ -1,8 +1,8 @@
 import { getCookie } from './utils.js';
 
-export function initializeFavoriteToggles() {
+export function initializeFavoriteToggles(root = document) {
     const csrftoken = getCookie('csrftoken');
-    const favoriteButtons = document.querySelectorAll('.toggle-favorite');
+    const favoriteButtons = root.querySelectorAll('.toggle-favorite');
     
     favoriteButtons.forEach(button => {
         button.addEventListener('click', function() {
@@ -38,9 +38,9 @@ export function initializeFavoriteToggles() {
     });
 }
 
-export function initializeReadingListToggles() {
+export function initializeReadingListToggles(root = document) {
     const csrftoken = getCookie('csrftoken');
-    const readingListButtons = document.querySelectorAll('.toggle-reading-list');
+    const readingListButtons = root.querySelectorAll('.toggle-reading-list');
     
     readingListButtons.forEach(button => {
         button.addEventListener('click', function() {
@@ -70,9 +70,9 @@ export function initializeReadingListToggles() {
     });
 }
 
-export function initializeReadStatusToggles() {
+export function initializeReadStatusToggles(root = document) {
     const csrftoken = getCookie('csrftoken');
-    const readStatusButtons = document.querySelectorAll('.toggle-read-status, .toggle-read');
+    const readStatusButtons = root.querySelectorAll('.toggle-read-status, .toggle-read');
     
     readStatusButtons.forEach(button => {
         button.addEventListener('click', function() {
@@ -102,9 +102,9 @@ export function initializeReadStatusToggles() {
     });
 }
 
-export function initializeFeaturedToggles() {
+export function initializeFeaturedToggles(root = document) {
     const csrftoken = getCookie('csrftoken');
-    const featuredButtons = document.querySelectorAll('.toggle-featured-detail');
+    const featuredButtons = root.querySelectorAll('.toggle-featured-detail');
     
     featuredButtons.forEach(button => {
         button.addEventListener('click', function() {
@@ -131,11 +131,79 @@ export function initializeFeaturedToggles() {
     });
 }
 
-export function initializeAllBookInteractions() {
-    initializeFavoriteToggles();
-    initializeReadingListToggles();
-    initializeReadStatusToggles();
-    initializeFeaturedToggles();
+export function applyShelfOperations(operations) {
+    const csrftoken = getCookie('csrftoken');
+    return fetch('/shelves/batch/', {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrftoken,
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ operations }),
+    })
+    .then(response => response.json().catch(() => ({})).then(data => {
+        if (!response.ok) {
+            throw new Error(data.error || `Batch update failed: ${response.status}`);
+        }
+        return data;
+    }));
+}
+
+function showBulkError(button, message) {
+    let alert = button.parentElement.querySelector('.bulk-shelf-error');
+    if (!alert) {
+        alert = document.createElement('div');
+        alert.className = 'alert alert-danger py-1 px-2 mb-0 small bulk-shelf-error';
+        alert.setAttribute('role', 'alert');
+        button.insertAdjacentElement('afterend', alert);
+    }
+    alert.textContent = message;
+}
+
+export function initializeBulkShelfActions(root = document) {
+    const bulkButtons = root.querySelectorAll('.bulk-shelf-action');
+    
+    bulkButtons.forEach(button => {
+        button.addEventListener('click', function() {
+            let operations;
+            if (this.dataset.fromShelf) {
+                // Whole-shelf action: one operation however many books it holds
+                operations = [{
+                    from_shelf: this.dataset.fromShelf,
+                    shelf: this.dataset.shelf,
+                    op: this.dataset.op,
+                }];
+            } else {
+                const bookIds = this.dataset.bookIds.split(',').filter(Boolean);
+                operations = bookIds.map(bookId => ({
+                    book_id: bookId,
+                    shelf: this.dataset.shelf,
+                    op: this.dataset.op,
+                }));
+            }
+            if (!operations.length) {
+                return;
+            }
+            this.disabled = true;
+            applyShelfOperations(operations)
+            .then(() => {
+                location.reload();
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                showBulkError(this, `Could not update your shelves: ${error.message}`);
+                this.disabled = false;
+            });
+        });
+    });
+}
+
+export function initializeAllBookInteractions(root = document) {
+    initializeFavoriteToggles(root);
+    initializeReadingListToggles(root);
+    initializeReadStatusToggles(root);
+    initializeFeaturedToggles(root);
+    initializeBulkShelfActions(root);
 }
 
-document.addEventListener('DOMContentLoaded', initializeAllBookInteractions);
+document.addEventListener('DOMContentLoaded', () => initializeAllBookInteractions());
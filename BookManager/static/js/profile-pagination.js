@@ -0,0 +1,72 @@
+import { initializeAllBookInteractions } from './book-interactions.js';
+
+function mergeGroup(container, fragment) {
+    const first = fragment.firstElementChild;
+    const last = container.lastElementChild;
+    if (!first || !last || !first.dataset.group || first.dataset.group !== last.dataset.group) {
+        return;
+    }
+    const target = last.querySelector('.group-items');
+    first.querySelectorAll('.group-items > *').forEach(item => target.appendChild(item));
+    const count = last.querySelector('.group-count');
+    if (count) {
+        count.textContent = target.children.length;
+    }
+    first.remove();
+}
+
+function loadNextPage(container, observer, sentinel) {
+    const cursor = container.dataset.nextCursor;
+    if (!cursor || container.dataset.loading) {
+        return;
+    }
+    container.dataset.loading = 'true';
+
+    fetch(`${container.dataset.url}?cursor=${encodeURIComponent(cursor)}`, {
+        headers: { 'Accept': 'application/json' },
+    })
+    .then(response => response.json())
+    .then(data => {
+        const template = document.createElement('template');
+        template.innerHTML = data.html;
+        const fragment = template.content;
+        initializeAllBookInteractions(fragment);
+        if (container.dataset.groupBy) {
+            mergeGroup(container, fragment);
+        }
+        container.appendChild(fragment);
+        container.dataset.nextCursor = data.next_cursor || '';
+        if (!data.next_cursor) {
+            observer.unobserve(sentinel);
+            sentinel.remove();
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+    })
+    .finally(() => {
+        delete container.dataset.loading;
+    });
+}
+
+export function initializeInfiniteScroll() {
+    document.querySelectorAll('[data-paginated]').forEach(container => {
+        if (!container.dataset.nextCursor) {
+            return;
+        }
+        const sentinel = document.createElement('div');
+        sentinel.className = 'pagination-sentinel';
+        container.after(sentinel);
+
+        const observer = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    loadNextPage(container, observer, sentinel);
+                }
+            });
+        }, { rootMargin: '200px' });
+        observer.observe(sentinel);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', initializeInfiniteScroll);
@@ -0,0 +1,67 @@
+function formatDate(value) {
+    return new Date(value).toLocaleDateString('en-US', {
+        month: 'long', day: '2-digit', year: 'numeric',
+    });
+}
+
+function renderNote(note) {
+    const item = document.createElement('div');
+    item.className = 'border-bottom pb-3 mb-3';
+
+    const header = document.createElement('div');
+    header.className = 'd-flex justify-content-between align-items-start mb-2';
+    const author = document.createElement('div');
+    const name = document.createElement('strong');
+    name.textContent = note.user;
+    const date = document.createElement('small');
+    date.className = 'text-muted';
+    date.textContent = ` - ${formatDate(note.created)}`;
+    author.append(name, date);
+    const badge = document.createElement('span');
+    badge.className = 'badge bg-info';
+    badge.innerHTML = '<i class="fas fa-globe"></i> Public';
+    header.append(author, badge);
+
+    const body = document.createElement('p');
+    body.style.whiteSpace = 'pre-line';
+    body.textContent = note.note;
+
+    item.append(header, body);
+    return item;
+}
+
+export function initializePublicNotes() {
+    const container = document.getElementById('public-notes');
+    const button = document.getElementById('load-more-notes');
+    if (!container || !button) {
+        return;
+    }
+
+    button.addEventListener('click', () => {
+        const cursor = container.dataset.nextCursor;
+        if (!cursor) {
+            return;
+        }
+        button.disabled = true;
+
+        fetch(`${container.dataset.url}?cursor=${encodeURIComponent(cursor)}`, {
+            headers: { 'Accept': 'application/json' },
+        })
+        .then(response => response.json())
+        .then(data => {
+            data.notes.forEach(note => container.appendChild(renderNote(note)));
+            container.dataset.nextCursor = data.next_cursor || '';
+            if (!data.next_cursor) {
+                button.remove();
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+        })
+        .finally(() => {
+            button.disabled = false;
+        });
+    });
+}
+
+document.addEventListener('DOMContentLoaded', initializePublicNotes);
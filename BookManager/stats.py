@@ -0,0 +1,75 @@
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Q, Subquery, Value
+from django.db.models.functions import Greatest, Now
+from django.utils import timezone
+from .models import SiteStats
+
+
+SITE_STATS_PK = 1
+
+
+def _count(queryset, condition=None):
+    """Scalar subquery returning the (optionally conditional) row count of ``queryset``."""
+    return Subquery(
+        queryset.order_by()
+        .annotate(_all=Value(1, output_field=IntegerField()))
+        .values('_all')
+        .annotate(n=Count('pk', filter=condition))
+        .values('n')
+    )
+
+
+def refresh_site_stats(apps=global_apps):
+    """
+    Recount every counter with a single UPDATE statement.
+
+    ``apps`` lets the initial data migration pass its historical models.
+    """
+    stats_model = apps.get_model('BookManager', 'SiteStats')
+    book_model = apps.get_model('BookManager', 'Book')
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    stats_model.objects.get_or_create(pk=SITE_STATS_PK)
+    stats_model.objects.filter(pk=SITE_STATS_PK).update(
+        total_users=_count(user_model.objects.all()),
+        total_books=_count(book_model.objects.all()),
+        total_notes=_count(apps.get_model('BookManager', 'ReadingNote').objects.all()),
+        featured_books=_count(book_model.objects.all(), Q(is_featured=True)),
+        curated_books=_count(book_model.objects.all(), Q(is_curated=True)),
+        refreshed_at=Now(),
+    )
+    return stats_model.objects.get(pk=SITE_STATS_PK)
+
+
+def get_site_stats():
+    """
+    Return the stats row with one primary-key lookup; never recounts.
+
+    Counters are kept current by signals and repaired by the hourly
+    refresh_site_stats job. Before the first recount an unsaved row of
+    zeros is returned.
+    """
+    return SiteStats.objects.filter(pk=SITE_STATS_PK).first() or SiteStats(pk=SITE_STATS_PK)
+
+
+def stats_are_stale(stats):
+    """Whether the last full recount is missing or older than SITE_STATS_MAX_AGE."""
+    max_age = timezone.timedelta(seconds=settings.SITE_STATS_MAX_AGE)
+    return stats.refreshed_at is None or stats.refreshed_at < timezone.now() - max_age
+
+
+def adjust_site_stats(**deltas):
+    """
+    Apply counter deltas, e.g. ``adjust_site_stats(total_books=3)``.
+
+    The UPDATE runs once the caller's transaction commits, so the single
+    stats row is locked for that statement alone instead of for the rest of
+    every write transaction. Counters stop at zero rather than violating
+    the column's CHECK; refresh_site_stats repairs any drift.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        transaction.on_commit(lambda: SiteStats.objects.filter(pk=SITE_STATS_PK).update(
+            **{field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()}
+        ))
@@ -0,0 +1,19 @@
+from django import template
+from django.urls import reverse
+from BookManager.covers import can_proxy, cover_bucket, cover_digest
+
+register = template.Library()
+
+
+@register.simple_tag
+def cover_url(book, width):
+    """
+    URL of ``book``'s cover resized for display at ``width`` CSS pixels.
+
+    The URL carries a digest of the source, so browsers can cache it forever
+    and a new cover simply gets a new URL.
+    """
+    if not can_proxy(book.cover_image):
+        return book.cover_image
+    url = reverse('BookManager:book_cover', args=[book.pk, cover_bucket(width)])
+    return f'{url}?v={cover_digest(book.cover_image)[:12]}'
@@ -1,3 +1,1394 @@
-from django.test import TestCase
+import io
+import asyncio
+import csv
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from . import content_index, covers, email_domains, exports, google_books, otp, outbox, utils
+from .cache import ResponseCache
+from .google_books import CircuitBreaker, GoogleBooksClient, GoogleBooksError
+from .counters import ViewCountBuffer, bulk_delete, recount_counters
+from .forms import SignUpForm
+from .recommendations import build_neighbors, readers_also_liked
+from .refresh import refresh_books
+from .ingest import ingest_volumes
+from .search import search_books
+from .models import (
+    Book, BookThemedAssociation, OtpToken, OutboundEmail, ReadingNote, SiteStats, Theme, UserProfile,
+)
+from .pagination import EstimatedCountPaginator, encode_cursor, estimate_row_count
+from .stats import SITE_STATS_PK, get_site_stats, refresh_site_stats
+
+
+def make_book(n, **fields):
+    fields.setdefault('title', f'Book {n}')
+    fields.setdefault('google_books_id', f'vol{n}')
+    return Book.objects.create(**fields)
+
+
+def make_user(name='reader', **fields):
+    fields.setdefault('is_verified', True)
+    return get_user_model().objects.create_user(
+        username=name, email=f'{name}@example.com', password='pw', **fields
+    )
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BookHubTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post_json(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+
+class CursorPaginationTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.client.force_login(self.user)
+        self.books = [make_book(n) for n in range(3)]
+        for book in self.books:
+            ReadingNote.objects.create(user=self.user, book=book, note='n', is_public=True)
+            self.user.profile.reading_list.add(book)
+
+    def urls(self):
+        return {
+            'public_notes': reverse('BookManager:public_notes', args=[self.books[0].pk]),
+            'profile_notes': reverse('BookManager:profile_notes_page'),
+            'profile_shelf': reverse('BookManager:profile_shelf_page', args=['reading_list']),
+        }
+
+    def test_pages_follow_the_cursor(self):
+        with self.settings(PROFILE_PAGE_SIZE=2):
+            first = self.client.get(self.urls()['profile_shelf']).json()
+            self.assertTrue(first['next_cursor'])
+            second = self.client.get(
+                self.urls()['profile_shelf'], {'cursor': first['next_cursor']}
+            ).json()
+        self.assertIsNone(second['next_cursor'])
+        self.assertIn(self.books[0].title, second['html'])
+
+    def test_profile_notes_are_paged_by_book(self):
+        extra = make_book(9, title='A First Book')
+        for text in ('one', 'two', 'three'):
+            ReadingNote.objects.create(user=self.user, book=extra, note=text)
+        ReadingNote.objects.create(user=make_user('other'), book=extra, note='not mine')
+
+        with self.settings(PROFILE_PAGE_SIZE=2):
+            response = self.client.get(reverse('BookManager:profile'))
+            groups = [item['book'].pk for item in response.context['notes_by_book']]
+            notes = sum(len(item['notes']) for item in response.context['notes_by_book'])
+            cursor = response.context['notes_cursor']
+            while cursor:
+                page = self.client.get(self.urls()['profile_notes'], {'cursor': cursor}).json()
+                groups += [int(book_id) for book_id in re.findall(r'data-group="(\d+)"', page['html'])]
+                notes += page['html'].count('class="card mb-3"')
+                cursor = page['next_cursor']
+        self.assertEqual(notes, 6)
+        # Ordered by book title; a book split across pages appears once per page
+        self.assertEqual(groups, [extra.pk, extra.pk] + [book.pk for book in self.books])
+
+    def test_tampered_cursors_are_rejected(self):
+        tampered = {
+            'public_notes': [['abc', 5], [timezone.now(), 'abc'], [None, 1], [{'x': 1}, 1]],
+            'profile_notes': [['Book 0', 'abc', 1], ['Book 0', timezone.now(), [1]]],
+            'profile_shelf': [['abc'], [2 ** 70], [-2 ** 70], [1, 2]],
+        }
+        for name, url in self.urls().items():
+            cursors = [encode_cursor(values) for values in tampered[name]] + ['not-a-cursor', 'e30']
+            for cursor in cursors:
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 400, (name, cursor))
+
+
+    def test_viewer_notes_are_left_out_before_paging(self):
+        book = self.books[0]
+        other = make_user('other')
+        ReadingNote.objects.create(user=other, book=book, note='theirs', is_public=True)
+        for n in range(3):
+            ReadingNote.objects.create(user=self.user, book=book, note=f'mine {n}', is_public=True)
+        with self.settings(PUBLIC_NOTES=dict(settings.PUBLIC_NOTES, PAGE_SIZE=2)):
+            response = self.client.get(reverse('BookManager:book_detail', args=[book.pk]))
+            self.assertEqual([note['note'] for note in response.context['public_notes']], ['theirs'])
+            self.assertIsNone(response.context['public_notes_cursor'])
+            # Other readers still get the shared page with every note
+            self.client.force_login(other)
+            page = self.client.get(self.urls()['public_notes']).json()
+        self.assertEqual(len(page['notes']), 2)
+        self.assertTrue(page['next_cursor'])
+
+    def test_public_note_pages_are_cached_by_cursor_values(self):
+        self.client.force_login(make_user('other'))
+        note = ReadingNote.objects.get(book=self.books[0])
+        cursor = encode_cursor([note.created, note.id])
+        padded = encode_cursor([note.created.isoformat(), str(note.id)])
+        with mock.patch('BookManager.views.cache') as views_cache:
+            views_cache.get.return_value = None
+            for value in (cursor, padded):
+                self.client.get(self.urls()['public_notes'], {'cursor': value})
+        keys = [call.args[0] for call in views_cache.set.call_args_list]
+        self.assertEqual(len(set(keys)), 1)
+        self.assertNotIn(padded, keys[0])
+
+class ShelfWriteTests(BookHubTestCase):
+    """Shelf writes decide from the database, never from the cached membership."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.profile = self.user.profile
+        self.book = make_book(1)
+        self.client.force_login(self.user)
+
+    def poison_cache(self, **shelves):
+        members = {shelf: frozenset() for shelf in UserProfile.SHELVES}
+        members.update({shelf: frozenset(ids) for shelf, ids in shelves.items()})
+        cache.set(UserProfile.shelf_cache_key(self.profile.pk), members)
+
+    def test_toggle_ignores_stale_cache(self):
+        # Another worker's stale copy claims the book is already a favorite
+        self.poison_cache(favorite_books={self.book.pk})
+        response = self.client.post(reverse('BookManager:toggle_favorite', args=[self.book.pk]))
+        self.assertEqual(response.json(), {'is_favorite': True})
+        self.assertTrue(self.profile.favorite_books.filter(pk=self.book.pk).exists())
+
+    def test_toggle_removes_when_stored(self):
+        self.profile.reading_list.add(self.book)
+        self.poison_cache()
+        response = self.client.post(reverse('BookManager:toggle_reading_list', args=[self.book.pk]))
+        self.assertEqual(response.json(), {'in_reading_list': False})
+        self.assertFalse(self.profile.reading_list.exists())
+
+    def test_batch_ignores_stale_cache(self):
+        self.poison_cache(books_read={self.book.pk})
+        response = self.post_json(reverse('BookManager:batch_shelf_update'), {
+            'operations': [{'book_id': self.book.pk, 'shelf': 'read', 'op': 'add'}],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['books'][str(self.book.pk)]['is_read'])
+        self.assertTrue(self.profile.books_read.filter(pk=self.book.pk).exists())
+
+    def test_rendering_cache_is_invalidated_by_writes(self):
+        self.assertFalse(self.profile.is_book_favorite(self.book))
+        self.client.post(reverse('BookManager:toggle_favorite', args=[self.book.pk]))
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        self.assertTrue(profile.is_book_favorite(self.book))
+
+
+class BatchShelfUpdateTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.profile = self.user.profile
+        self.books = [make_book(n) for n in range(5)]
+        self.client.force_login(self.user)
+        self.url = reverse('BookManager:batch_shelf_update')
+
+    def test_book_operations_apply_in_order(self):
+        first, second = self.books[:2]
+        self.profile.favorite_books.add(second)
+        response = self.post_json(self.url, {'operations': [
+            {'book_id': first.pk, 'shelf': 'favorites', 'op': 'add'},
+            {'book_id': first.pk, 'shelf': 'reading_list', 'op': 'toggle'},
+            {'book_id': second.pk, 'shelf': 'favorites', 'op': 'toggle'},
+            {'book_id': first.pk, 'shelf': 'favorites', 'op': 'remove'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['books'][str(first.pk)], {
+            'is_favorite': False, 'in_reading_list': True, 'is_read': False,
+        })
+        self.assertFalse(self.profile.favorite_books.exists())
+        self.assertEqual(list(self.profile.reading_list.all()), [first])
+
+    def test_shelf_copy_is_one_operation(self):
+        books = [make_book(n) for n in range(10, 30)]
+        self.profile.reading_list.add(*books)
+        with self.settings(SHELF_BATCH_MAX_OPERATIONS=5):
+            response = self.post_json(self.url, {'operations': [
+                {'from_shelf': 'reading_list', 'shelf': 'read', 'op': 'copy'},
+            ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['books']), len(books))
+        self.assertEqual(self.profile.books_read.count(), len(books))
+        self.assertEqual(self.profile.reading_list.count(), len(books))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.books_read_count, len(books))
+
+    def test_shelf_move_empties_the_source(self):
+        self.profile.reading_list.add(*self.books[:3])
+        self.profile.books_read.add(self.books[4])
+        response = self.post_json(self.url, {'operations': [
+            {'from_shelf': 'reading_list', 'shelf': 'read', 'op': 'move'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.profile.reading_list.exists())
+        self.assertEqual(
+            set(self.profile.books_read.values_list('pk', flat=True)),
+            {book.pk for book in self.books[:3]} | {self.books[4].pk},
+        )
+
+    def test_repeated_book_loads_only_its_membership(self):
+        self.profile.favorite_books.add(*self.books)
+        with mock.patch.object(
+            UserProfile, 'current_shelf_ids', autospec=True, side_effect=UserProfile._load_shelf_ids,
+        ) as current:
+            response = self.post_json(self.url, {'operations': [
+                {'book_id': self.books[0].pk, 'shelf': 'read', 'op': 'add'},
+                {'book_id': self.books[0].pk, 'shelf': 'favorites', 'op': 'toggle'},
+            ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(current.call_args.args[1], {self.books[0].pk})
+        self.assertEqual(self.profile.favorite_books.count(), len(self.books) - 1)
+
+    def test_rejects_invalid_operations(self):
+        for operation in (
+            {'book_id': self.books[0].pk, 'shelf': 'favorites', 'op': 'copy'},
+            {'from_shelf': 'reading_list', 'shelf': 'read', 'op': 'add'},
+            {'book_id': 'x', 'shelf': 'favorites', 'op': 'add'},
+            {'book_id': 2 ** 70, 'shelf': 'favorites', 'op': 'add'},
+            {'book_id': 0, 'shelf': 'favorites', 'op': 'add'},
+            {'book_id': self.books[0].pk, 'shelf': 'wishlist', 'op': 'add'},
+        ):
+            response = self.post_json(self.url, {'operations': [operation]})
+            self.assertEqual(response.status_code, 400, operation)
+
+    def test_limits_operation_count(self):
+        operations = [{'book_id': book.pk, 'shelf': 'read', 'op': 'add'} for book in self.books]
+        with self.settings(SHELF_BATCH_MAX_OPERATIONS=4):
+            response = self.post_json(self.url, {'operations': operations})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.profile.books_read.exists())
+
+    def test_missing_book_changes_nothing(self):
+        response = self.post_json(self.url, {'operations': [
+            {'book_id': self.books[0].pk, 'shelf': 'read', 'op': 'add'},
+            {'book_id': 999999, 'shelf': 'read', 'op': 'add'},
+        ]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['book_ids'], [999999])
+        self.assertFalse(self.profile.books_read.exists())
+
+    def test_profile_button_sends_a_shelf_operation(self):
+        self.profile.reading_list.add(self.books[0])
+        response = self.client.get(reverse('BookManager:profile'))
+        self.assertContains(response, 'data-from-shelf="reading_list"')
+        self.assertNotContains(response, 'data-book-ids')
+
+
+class FailingConnection:
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        raise OSError('smtp down')
+
+
+class OutboxTests(BookHubTestCase):
+    def test_otp_mail_is_delivered_on_commit(self):
+        with mock.patch.object(outbox, '_deliver_in_background') as deliver:
+            with self.captureOnCommitCallbacks(execute=True):
+                make_user('newcomer', is_active=False)
+        email = OutboundEmail.objects.get()
+        self.assertIn('Your OTP is', email.body)
+        deliver.assert_called_once_with([email.pk])
+
+    def test_queue_respects_eager_setting(self):
+        with mock.patch.object(outbox, '_deliver_in_background') as deliver:
+            with self.captureOnCommitCallbacks(execute=True):
+                outbox.queue_email('Hi', 'Body', ['a@example.com'])
+        deliver.assert_not_called()
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.PENDING)
+
+    def test_deliver_batch_can_target_emails(self):
+        first = outbox.queue_email('First', 'Body', ['a@example.com'])
+        second = outbox.queue_email('Second', 'Body', ['b@example.com'])
+        self.assertEqual(outbox.deliver_batch(ids=[second.pk]), (1, 0, 0))
+        self.assertEqual([message.subject for message in mail.outbox], ['Second'])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, OutboundEmail.PENDING)
+        self.assertEqual(second.status, OutboundEmail.SENT)
+        self.assertEqual(outbox.deliver_batch(ids=[second.pk]), (0, 0, 0))
+
+    def test_sends_outside_a_transaction_with_the_batch_claimed(self):
+        email = outbox.queue_email('Hi', 'Body', ['a@example.com'])
+        savepoints = len(connection.savepoint_ids)
+        seen = {}
+
+        class Recording(FailingConnection):
+            def send_messages(self, messages):
+                seen['savepoints'] = len(connection.savepoint_ids)
+                seen['rerun'] = outbox.deliver_batch(ids=[email.pk])
+                return len(messages)
+
+        self.assertEqual(outbox.deliver_batch(connection=Recording()), (1, 0, 0))
+        self.assertEqual(seen, {'savepoints': savepoints, 'rerun': (0, 0, 0)})
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.SENT)
+
+    def test_failures_back_off_then_dead_letter(self):
+        email = outbox.queue_email('Hi', 'Body', ['a@example.com'])
+        self.assertEqual(outbox.deliver_batch(max_attempts=2, connection=FailingConnection()), (0, 1, 0))
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertIn('smtp down', email.last_error)
+        # Not due yet, so the next run leaves it alone
+        self.assertEqual(outbox.deliver_batch(max_attempts=2, connection=FailingConnection()), (0, 0, 0))
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.deliver_batch(max_attempts=2, connection=FailingConnection()), (0, 0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.DEAD)
+
+
+class SiteStatsTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = make_user('staff', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_migration_creates_the_row(self):
+        self.assertTrue(SiteStats.objects.filter(pk=SITE_STATS_PK).exists())
+
+    def test_counters_follow_writes(self):
+        before = get_site_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            book = make_book(1, is_featured=True)
+            ReadingNote.objects.create(user=self.staff, book=book, note='n')
+            make_user('other')
+        stats = get_site_stats()
+        self.assertEqual(stats.total_books, before.total_books + 1)
+        self.assertEqual(stats.featured_books, before.featured_books + 1)
+        self.assertEqual(stats.total_notes, before.total_notes + 1)
+        self.assertEqual(stats.total_users, before.total_users + 1)
+
+    def test_dashboard_never_recounts(self):
+        SiteStats.objects.filter(pk=SITE_STATS_PK).update(
+            total_books=999, refreshed_at=timezone.now() - timezone.timedelta(days=2)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('BookManager:admin_dashboard'))
+        stats_table = SiteStats._meta.db_table
+        self.assertFalse([
+            query for query in queries
+            if stats_table in query['sql'] and not query['sql'].startswith('SELECT')
+        ])
+        self.assertEqual(response.context['total_books'], 999)
+        self.assertTrue(response.context['stats_stale'])
+        self.assertContains(response, 'run refresh_site_stats')
+
+        refresh_site_stats()
+        response = self.client.get(reverse('BookManager:admin_dashboard'))
+        self.assertEqual(response.context['total_books'], 0)
+        self.assertFalse(response.context['stats_stale'])
+
+    def test_counters_stop_at_zero_and_wait_for_commit(self):
+        # The book's creation is never committed, so its delete drifts below zero
+        book = make_book(1, is_featured=True)
+        with self.captureOnCommitCallbacks() as callbacks:
+            book.delete()
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        stats = get_site_stats()
+        self.assertEqual((stats.total_books, stats.featured_books), (0, 0))
+
+    def test_bulk_book_deletes_leave_counters_to_the_caller(self):
+        book = make_book(1)
+        with self.captureOnCommitCallbacks() as callbacks, bulk_delete():
+            book.delete()
+        self.assertEqual(callbacks, [])
+
+    def test_missing_row_reads_as_zero(self):
+        SiteStats.objects.all().delete()
+        stats = get_site_stats()
+        self.assertEqual(stats.total_users, 0)
+        self.assertIsNone(stats.refreshed_at)
+        self.assertEqual(self.client.get(reverse('BookManager:admin_dashboard')).status_code, 200)
+        self.assertFalse(SiteStats.objects.exists())
+
+
+class CleanupIncompleteUsersTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = [make_book(n) for n in range(4)]
+        self.keeper = make_user('keeper')
+        self.keeper.profile.favorite_books.add(*self.books)
+        ReadingNote.objects.create(user=self.keeper, book=self.books[0], note='kept', is_public=True)
+        for n in range(6):
+            user = make_user(f'pending{n}', is_verified=False)
+            user.profile.favorite_books.add(*self.books[:2])
+            user.profile.reading_list.add(self.books[n % 4])
+            user.profile.books_read.add(self.books[3])
+            ReadingNote.objects.create(user=user, book=self.books[0], note='public', is_public=True)
+            ReadingNote.objects.create(user=user, book=self.books[1], note='private')
+        get_user_model().objects.filter(is_verified=False).update(
+            date_joined=timezone.now() - timezone.timedelta(hours=1)
+        )
+        refresh_site_stats()
+
+    def counters(self):
+        return list(Book.objects.order_by('pk').values_list(
+            'favorites_count', 'reading_list_count', 'read_count', 'public_notes_count'
+        ))
+
+    def test_counters_settled_once_per_batch(self):
+        public_notes_version = ReadingNote.public_notes_version(self.books[0].pk)
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command('cleanup_incomplete_users', batch_size=4, stdout=StringIO())
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+        writes = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        book_writes = [sql for sql in writes if Book._meta.db_table in sql.split(' SET ')[0]]
+        stats_writes = [sql for sql in writes if SiteStats._meta.db_table in sql.split(' SET ')[0]]
+        self.assertEqual((len(book_writes), len(stats_writes)), (2, 2))
+        self.assertNotEqual(ReadingNote.public_notes_version(self.books[0].pk), public_notes_version)
+
+        settled = self.counters()
+        recount_counters()
+        self.assertEqual(settled, self.counters())
+        self.assertEqual(settled[0], (1, 0, 0, 1))
+        stats = get_site_stats()
+        self.assertEqual((stats.total_users, stats.total_notes), (1, 1))
+
+    def test_dry_run_reports_without_deleting(self):
+        out = StringIO()
+        call_command('cleanup_incomplete_users', dry_run=True, stdout=out)
+        self.assertEqual(get_user_model().objects.count(), 7)
+        self.assertIn('Would delete 6 incomplete user accounts', out.getvalue())
+        self.assertIn(f'Would delete 12 {ReadingNote._meta.label}', out.getvalue())
+
+    def test_keeps_recent_and_verified_accounts(self):
+        make_user('fresh', is_verified=False)
+        out = StringIO()
+        call_command('cleanup_incomplete_users', batch_size=4, stdout=out)
+        self.assertEqual(
+            sorted(get_user_model().objects.values_list('username', flat=True)), ['fresh', 'keeper']
+        )
+        self.assertIn('Deleted 6 incomplete user accounts in 2 batches', out.getvalue())
+
+    def test_time_budget_stops_between_batches(self):
+        out = StringIO()
+        call_command('cleanup_incomplete_users', batch_size=4, time_budget=0, stdout=out)
+        self.assertEqual(get_user_model().objects.count(), 7)
+        self.assertIn('time budget reached', out.getvalue())
+
+    def test_single_deletes_still_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_user_model().objects.get(username='pending0').delete()
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).favorites_count, 6)
+        self.assertEqual(get_site_stats().total_notes, 11)
+
+
+class ContentIndexBuildTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = tmp.name
+        config = dict(settings.CONTENT_INDEX, PATH=self.path, DIM=32, MIN_SCORE=0)
+        override = self.settings(CONTENT_INDEX=config)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.books = [
+            make_book(n, description=f'dragons and wizards in tale {n}', categories='Fantasy')
+            for n in range(3)
+        ]
+
+    def builds(self):
+        return sorted(os.listdir(os.path.join(self.path, content_index.BUILDS_DIR)))
+
+    def test_unchanged_incremental_build_keeps_the_version(self):
+        self.assertEqual(content_index.build_content_index(), (3, 3))
+        index = content_index.get_content_index()
+        live = content_index.current_build(self.path)
+        self.assertEqual(index.path, live)
+        self.assertEqual(len(content_index.similar_books(self.books[0])), 2)
+
+        self.assertEqual(content_index.build_content_index(), (0, 3))
+        self.assertEqual(content_index.current_build(self.path), live)
+        self.assertIs(content_index.get_content_index(), index)
+        self.assertEqual(len(self.builds()), 1)
+
+    def test_changes_publish_a_new_build(self):
+        content_index.build_content_index()
+        first = content_index.current_build(self.path)
+        self.books[0].save()
+        self.assertEqual(content_index.build_content_index(), (1, 3))
+        second = content_index.current_build(self.path)
+        self.assertNotEqual(second, first)
+        self.assertEqual(content_index.get_content_index().path, second)
+        # The replaced build stays for readers that already resolved it
+        self.assertEqual(self.builds(), sorted(os.path.basename(p) for p in (first, second)))
+
+        make_book(9, description='space ships')
+        self.assertEqual(content_index.build_content_index(), (1, 4))
+        self.assertNotIn(os.path.basename(first), self.builds())
+        self.assertEqual(len(self.builds()), 2)
+
+
+class ThemeCacheTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.theme = Theme.objects.create(name='Climate', tagline='t', why_now='w')
+        self.book = make_book(1, title='Old Title')
+        Book.objects.filter(pk=self.book.pk).update(updated=timezone.now() - timezone.timedelta(days=60))
+        BookThemedAssociation.objects.create(theme=self.theme, book=self.book)
+        self.url = reverse('BookManager:theme_detail', args=[self.theme.slug])
+
+    def test_version_keys_live_in_a_shared_cache(self):
+        self.assertNotIsInstance(cache, LocMemCache)
+
+    def test_refresh_job_invalidates_theme_pages(self):
+        self.assertContains(self.client.get(self.url), 'Old Title')
+        index_version = cache.get(Theme.INDEX_VERSION_KEY)
+
+        async def fetch_volumes(volume_ids, **kwargs):
+            return {'vol1': {'id': 'vol1', 'volumeInfo': {'title': 'New Title'}}}
+
+        with mock.patch('BookManager.refresh.fetch_volumes', fetch_volumes):
+            call_command('refresh_books', stdout=StringIO())
+        self.assertContains(self.client.get(self.url), 'New Title')
+        self.assertNotEqual(cache.get(Theme.INDEX_VERSION_KEY), index_version)
+
+
+class CoverRenderTests(BookHubTestCase):
+    def image(self, width, height, mode='RGB'):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new(mode, (width, height)).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_renders_every_size(self):
+        with self.settings(COVER_PROXY=dict(settings.COVER_PROXY, SIZES=[32, 64])):
+            renditions = covers._render(self.image(128, 192))
+        self.assertEqual(sorted(renditions), [32, 64])
+
+    def test_refuses_oversized_images_before_decoding(self):
+        config = dict(settings.COVER_PROXY, MAX_PIXELS=100 * 100)
+        with self.settings(COVER_PROXY=config):
+            # Over the limit, and far over it where Pillow itself raises
+            for width in (120, 1000):
+                with self.assertRaises(covers.CoverUnavailable):
+                    covers._render(self.image(width, width, mode='1'))
+            self.assertEqual(len(covers._render(self.image(100, 100))), len(config['SIZES']))
+
+
+    def test_leaves_the_pillow_limit_alone(self):
+        from PIL import Image
+
+        limit = Image.MAX_IMAGE_PIXELS
+        with self.settings(COVER_PROXY=dict(settings.COVER_PROXY, MAX_PIXELS=100 * 100)):
+            covers._render(self.image(50, 50))
+        self.assertEqual(Image.MAX_IMAGE_PIXELS, limit)
+
+
+class FakeRawBody(io.BytesIO):
+    def read(self, size=-1, decode_content=False):
+        return super().read(size)
+
+
+class FakeCoverResponse:
+    def __init__(self, body=b'', location=None):
+        self.is_redirect = location is not None
+        self.headers = {'Location': location} if location else {}
+        self.raw = FakeRawBody(body)
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+    def raise_for_status(self):
+        pass
+
+
+class CoverFetchTests(BookHubTestCase):
+    source = 'https://books.google.com/books/content?id=1'
+
+    def fetch(self, *responses, **config):
+        with self.settings(COVER_PROXY=dict(settings.COVER_PROXY, **config)), \
+                mock.patch('BookManager.covers.requests.get', side_effect=responses) as get:
+            try:
+                return covers._fetch(self.source)
+            finally:
+                self.requested = [call.args[0] for call in get.call_args_list]
+                self.assertTrue(all(call.kwargs['allow_redirects'] is False for call in get.call_args_list))
+
+    def test_follows_redirects_between_proxied_hosts(self):
+        hop = FakeCoverResponse(location='https://books.googleusercontent.com/c/1')
+        final = FakeCoverResponse(b'image')
+        self.assertEqual(self.fetch(hop, final), b'image')
+        self.assertEqual(self.requested, [self.source, 'https://books.googleusercontent.com/c/1'])
+        self.assertTrue(hop.closed and final.closed)
+
+    def test_refuses_redirects_off_the_proxied_hosts(self):
+        for location in ('http://169.254.169.254/latest/meta-data', '//internal.example/c'):
+            hop = FakeCoverResponse(location=location)
+            with self.assertRaises(covers.CoverUnavailable):
+                self.fetch(hop)
+            self.assertEqual(self.requested, [self.source])
+
+    def test_closes_oversized_responses(self):
+        response = FakeCoverResponse(b'x' * 20)
+        with self.assertRaises(covers.CoverUnavailable):
+            self.fetch(response, MAX_SOURCE_BYTES=10)
+        self.assertTrue(response.closed)
+
+class ImportVolumesResumeTests(BookHubTestCase):
+    def write_dump(self, name, responses):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, name)
+        with open(path, 'w') as f:
+            if name.endswith('.json'):
+                json.dump(responses, f, indent=1)
+            else:
+                f.writelines(json.dumps(response) + '\n' for response in responses)
+        return path
+
+    def responses(self):
+        return [
+            {'kind': 'books#volumes', 'items': [
+                {'id': f'v{n}', 'volumeInfo': {'title': f'Volume {n}'}}
+                for n in range(start, start + 3)
+            ]}
+            for start in (0, 3)
+        ]
+
+    def test_resumes_inside_a_response(self):
+        for name in ('dump.ndjson', 'dump.json'):
+            Book.objects.all().delete()
+            path = self.write_dump(name, self.responses())
+            calls = []
+
+            def failing_ingest(batch, **kwargs):
+                calls.append(len(batch))
+                if len(calls) == 3:
+                    raise OSError('database went away')
+                return ingest_volumes(batch, **kwargs)
+
+            with mock.patch(
+                'BookManager.management.commands.import_volumes.ingest_volumes', failing_ingest
+            ), self.assertRaisesMessage(CommandError, 'resume with --offset') as raised:
+                call_command('import_volumes', path, batch_size=2, stdout=StringIO())
+            # The second batch ended on the first item of the second response
+            self.assertEqual(Book.objects.count(), 4)
+
+            offset = str(raised.exception).rsplit(' ', 1)[-1].rstrip(')')
+            call_command('import_volumes', path, offset=int(offset), stdout=StringIO())
+            self.assertEqual(
+                sorted(Book.objects.values_list('google_books_id', flat=True)),
+                [f'v{n}' for n in range(6)],
+                name,
+            )
+
+
+class SlowSession:
+    """Session whose every request times out after the timeout it was given."""
+
+    def __init__(self):
+        self.timeouts = []
+
+    def get(self, url, params=None, timeout=None):
+        import requests
+
+        self.timeouts.append(timeout)
+        time.sleep(timeout)
+        raise requests.Timeout('read timed out')
+
+
+class GoogleBooksDeadlineTests(BookHubTestCase):
+    def client_with(self, session):
+        client = GoogleBooksClient(
+            timeout=0.2, retries=5, backoff=0.01, max_backoff=0.01,
+            breaker=CircuitBreaker(threshold=100),
+        )
+        client.session = session
+        return client
+
+    def test_deadline_bounds_all_attempts(self):
+        session = SlowSession()
+        client = self.client_with(session)
+        started = time.monotonic()
+        with self.assertRaises(GoogleBooksError):
+            client.search('dune', deadline=0.3)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(len(session.timeouts), 2)
+        self.assertLess(session.timeouts[1], 0.2)
+
+    def test_overrun_sleep_stops_before_another_attempt(self):
+        session = SlowSession()
+        client = self.client_with(session)
+        clock = iter([0, 0, 0, 0.5])
+        with mock.patch('BookManager.google_books.time.monotonic', lambda: next(clock)), \
+                mock.patch('BookManager.google_books.time.sleep'):
+            with self.assertRaises(GoogleBooksError):
+                client.search('dune', deadline=0.3)
+        self.assertEqual(session.timeouts, [0.2])
+
+    def test_background_calls_keep_full_retries(self):
+        session = SlowSession()
+        client = self.client_with(session)
+        client.timeout = 0.01
+        with self.assertRaises(GoogleBooksError):
+            client.volume('vol1')
+        self.assertEqual(session.timeouts, [0.01] * 6)
+
+    def test_searches_pass_the_interactive_deadline(self):
+        client = mock.Mock()
+        with mock.patch.object(utils, 'get_client', return_value=client):
+            utils._request_books('dune', 10)
+        client.search.assert_called_once_with(
+            'dune', max_results=10, start_index=0,
+            deadline=settings.GOOGLE_BOOKS_API['INTERACTIVE_DEADLINE'],
+        )
+
+
+
+class QuotaCountingTests(BookHubTestCase):
+    def test_database_cache_does_not_count(self):
+        client = GoogleBooksClient()
+        with CaptureQueriesContext(connection) as queries:
+            client._count('requests')
+        self.assertEqual(len(queries), 0)
+        self.assertIsNone(client.quota_usage())
+        self.client.force_login(make_user('staff', is_staff=True))
+        self.assertContains(
+            self.client.get(reverse('BookManager:admin_dashboard')), 'quota tracking needs'
+        )
+
+    def test_atomic_backends_count(self):
+        locmem = LocMemCache('quota', {})
+        client = GoogleBooksClient()
+        with mock.patch.object(google_books, 'quota_cache', return_value=locmem):
+            for counter in ('requests', 'requests', 'errors'):
+                client._count(counter)
+            usage = client.quota_usage()
+        self.assertEqual(usage, {'requests': 2, 'errors': 1, 'throttled': 0})
+
+class ResponseCacheTests(BookHubTestCase):
+    def test_misses_fetch_once_and_skip_none(self):
+        responses = ResponseCache('test', max_entries=2)
+        fetch = mock.Mock(return_value={'items': []})
+        self.assertEqual(responses.get_or_fetch('a', fetch), {'items': []})
+        self.assertEqual(responses.get_or_fetch('a', fetch), {'items': []})
+        self.assertEqual(fetch.call_count, 1)
+        self.assertIsNone(responses.get_or_fetch('down', lambda: None))
+        self.assertIsNone(responses.get_or_fetch('down', lambda: None))
+        self.assertEqual(responses.stats()['misses'], 3)
+        self.assertEqual(responses.stats()['hits'], 1)
+
+    def test_evicts_least_recently_used(self):
+        responses = ResponseCache('test', max_entries=2)
+        responses.set('a', 1)
+        responses.set('b', 2)
+        responses.get_or_fetch('a', mock.Mock())
+        responses.set('c', 3)
+        self.assertEqual(responses.get_or_fetch('a', mock.Mock()), 1)
+        self.assertEqual(responses.get_or_fetch('b', lambda: 'refetched'), 'refetched')
+        self.assertEqual(responses.stats()['evictions'], 2)
+
+    def test_serves_stale_while_refreshing(self):
+        responses = ResponseCache('test', ttl=0, stale_ttl=60)
+        responses.set('a', 'old')
+        refreshed = threading.Event()
+
+        def fetch():
+            refreshed.set()
+            return 'new'
+
+        self.assertEqual(responses.get_or_fetch('a', fetch), 'old')
+        self.assertTrue(refreshed.wait(5))
+        self.assertEqual(responses.stats()['stale_hits'], 1)
+        for _ in range(50):
+            if responses.local.get('a').value == 'new':
+                break
+            time.sleep(0.01)
+        self.assertEqual(responses.local.get('a').value, 'new')
+
+    def test_one_refresh_thread_per_stale_key(self):
+        responses = ResponseCache('test', ttl=0, stale_ttl=60)
+        responses.set('a', 'old')
+        with mock.patch('BookManager.cache.threading.Thread') as thread:
+            for _ in range(3):
+                self.assertEqual(responses.get_or_fetch('a', mock.Mock()), 'old')
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+    def test_refresh_closes_its_connections(self):
+        responses = ResponseCache('test', ttl=0, stale_ttl=60)
+        responses.set('a', 'old')
+        with mock.patch('BookManager.cache.threading.Thread') as thread, \
+                mock.patch('BookManager.cache.connections') as conns:
+            responses.get_or_fetch('a', lambda: 'new')
+            thread.call_args.kwargs['target']()
+        conns.close_all.assert_called_once()
+        self.assertEqual(responses.local.get('a').value, 'new')
+
+    def test_shared_tier_is_reused_by_other_workers(self):
+        ResponseCache('test', shared_alias='default').set('a', 'value')
+        other = ResponseCache('test', shared_alias='default')
+        self.assertEqual(other.get_or_fetch('a', mock.Mock()), 'value')
+
+    def test_query_keys_are_normalized(self):
+        self.assertEqual(
+            utils.books_cache_key('  Science   FICTION ', 10),
+            utils.books_cache_key('science fiction', 10),
+        )
+
+
+def volume(n, **info):
+    info.setdefault('title', f'Volume {n}')
+    return {'id': f'vol{n}', 'volumeInfo': info}
+
+
+class IngestVolumesTests(BookHubTestCase):
+    def count_queries(self, items):
+        with CaptureQueriesContext(connection) as queries:
+            ingest_volumes(items)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_items(self):
+        few = self.count_queries([volume(n) for n in range(2)])
+        many = self.count_queries([volume(n) for n in range(10, 40)])
+        self.assertEqual(few, many)
+
+    def test_upserts_in_api_order(self):
+        cover = {'imageLinks': {'thumbnail': 'http://books.google.com/c?id=2&zoom=1'}}
+        with self.captureOnCommitCallbacks(execute=True):
+            make_book(2, title='Stored Title', cover_image='https://books.google.com/c?id=2&zoom=1')
+            books = ingest_volumes([
+                volume(3), volume(2, title='Changed', **cover), volume(3), {'volumeInfo': {}},
+            ])
+        self.assertEqual([book.google_books_id for book in books], ['vol3', 'vol2'])
+        stored = Book.objects.get(google_books_id='vol2')
+        self.assertEqual(stored.title, 'Stored Title')
+        self.assertEqual(stored.cover_image, 'https://books.google.com/c?id=2&zoom=0')
+        self.assertEqual(get_site_stats().total_books, 2)
+
+    def test_stored_volumes_are_not_rewritten(self):
+        ingest_volumes([volume(1), volume(2)])
+        with CaptureQueriesContext(connection) as queries:
+            ingest_volumes([volume(1), volume(2, title='Changed')])
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual([sql for sql in writes if 'bookmanager_book' in sql], [])
+
+    def test_counts_only_rows_it_inserted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_volumes([volume(1)])
+            # Another ingest stored vol1 between this one's read and its insert.
+            with mock.patch.object(Book.objects, 'filter', return_value=Book.objects.none()):
+                ingest_volumes([volume(1), volume(2)])
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(get_site_stats().total_books, 2)
+
+    def test_home_ingests_the_api_response(self):
+        with mock.patch('BookManager.views.fetch_books', return_value={'items': [volume(1), volume(2)]}):
+            response = self.client.get(reverse('BookManager:home'))
+        self.assertEqual([book.google_books_id for book in response.context['books']], ['vol1', 'vol2'])
+        self.assertEqual(Book.objects.count(), 2)
+
+
+class LocalSearchTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dune = make_book(1, title='Dune', authors='Frank Herbert')
+        self.about = make_book(2, title='Deserts', description='A study of dune ecosystems')
+        make_book(3, title='Foundation', authors='Isaac Asimov')
+
+    def titles(self, query):
+        return [book.title for book in search_books(query)]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.titles('dune'), ['Dune', 'Deserts'])
+        self.assertEqual(self.titles('Isaac Asim'), ['Foundation'])
+
+    def test_index_follows_writes(self):
+        Book.objects.filter(pk=self.dune.pk).update(title='Children of Dune')
+        self.about.delete()
+        self.assertEqual(self.titles('children'), ['Children of Dune'])
+        self.assertEqual(self.titles('ecosystems'), [])
+
+    def test_query_syntax_is_escaped(self):
+        for query in ('dune AND', '"dune', 'NEAR(dune', '*', '-dune'):
+            self.assertIsInstance(search_books(query), list, query)
+
+
+class SearchViewTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        for n in range(3):
+            make_book(n, title=f'Dune part {n}')
+        override = self.settings(
+            LOCAL_SEARCH_MIN_RESULTS=3, CONTENT_INDEX=dict(settings.CONTENT_INDEX, RERANK_WEIGHT=0)
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def search(self, query, items=()):
+        pages = mock.AsyncMock(return_value={'items': list(items)})
+        with mock.patch('BookManager.views.fetch_books_pages', pages):
+            response = self.client.get(reverse('BookManager:search'), {'q': query})
+        return response, pages
+
+    def test_enough_local_results_skip_the_api(self):
+        response, pages = self.search('dune')
+        pages.assert_not_called()
+        self.assertEqual(len(response.context['books']), 3)
+
+    def test_few_local_results_fall_back_to_the_api(self):
+        response, pages = self.search('foundation', [volume(10, title='Foundation')])
+        pages.assert_awaited_once()
+        self.assertEqual([book.google_books_id for book in response.context['books']], ['vol10'])
+
+
+    def test_api_results_are_merged_with_local_hits(self):
+        make_book(5, title='Foundation and Empire')
+        items = [volume(10, title='Foundation'), volume(5, title='Foundation and Empire')]
+        with mock.patch('BookManager.views.rerank', side_effect=lambda q, books: books[::-1]) as rerank:
+            response, pages = self.search('foundation', items)
+        self.assertEqual([book.google_books_id for book in rerank.call_args.args[1]], ['vol5', 'vol10'])
+        self.assertEqual([book.google_books_id for book in response.context['books']], ['vol10', 'vol5'])
+
+class FetchBooksPagesTests(BookHubTestCase):
+    def fetch(self, fake, **options):
+        async def timed():
+            started = time.monotonic()
+            data = await utils.fetch_books_pages('dune', **options)
+            self.elapsed = time.monotonic() - started
+            return data
+
+        with mock.patch.object(utils, 'fetch_books', fake):
+            return asyncio.run(timed())
+
+    def test_worker_threads_close_their_connections(self):
+        with mock.patch.object(utils, 'connections') as conns:
+            self.fetch(lambda query, size, start_index: {'items': []}, max_results=80, page_size=40)
+        self.assertEqual(conns.close_all.call_count, 2)
+
+    def test_merges_pages_in_order_without_duplicates(self):
+        requested = []
+
+        def fake(query, size, start_index):
+            requested.append((start_index, size))
+            # Later pages answer first; overlapping results are dropped
+            time.sleep(0.05 if start_index == 0 else 0)
+            return {'items': [volume(n) for n in range(max(start_index - 1, 0), start_index + size)]}
+
+        data = self.fetch(fake, max_results=100, page_size=40)
+        self.assertEqual(sorted(requested), [(0, 40), (40, 40), (80, 20)])
+        self.assertEqual([item['id'] for item in data['items']], [f'vol{n}' for n in range(100)])
+
+    def test_limits_concurrency(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake(query, size, start_index):
+            with lock:
+                running.append(start_index)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(start_index)
+            return {'items': []}
+
+        self.fetch(fake, max_results=200, page_size=20, concurrency=3)
+        self.assertEqual(len(peak), 10)
+        self.assertLessEqual(max(peak), 3)
+
+    def test_slow_and_failed_pages_are_skipped(self):
+        def fake(query, size, start_index):
+            if start_index == 10:
+                time.sleep(0.5)
+            if start_index == 20:
+                raise OSError('boom')
+            if start_index == 30:
+                return None
+            return {'items': [volume(start_index)]}
+
+        data = self.fetch(fake, max_results=40, page_size=10, deadline=0.2)
+        self.assertLess(self.elapsed, 0.45)
+        self.assertEqual([item['id'] for item in data['items']], ['vol0'])
+
+
+class ViewCountBufferTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = [make_book(n) for n in range(3)]
+        self.buffer = ViewCountBuffer(flush_threshold=5, flush_interval=3600)
+
+    def view_counts(self):
+        return list(Book.objects.order_by('pk').values_list('view_count', flat=True))
+
+    def test_flushes_at_threshold_in_one_update(self):
+        for book in (self.books[0], self.books[0], self.books[1], self.books[2]):
+            self.buffer.record(book.pk)
+        self.assertEqual(self.view_counts(), [0, 0, 0])
+        self.assertEqual(self.buffer.pending(self.books[0].pk), 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.buffer.record(self.books[0].pk)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.view_counts(), [3, 1, 1])
+        self.assertEqual(self.buffer.pending(self.books[0].pk), 0)
+
+    def test_failed_flush_keeps_increments(self):
+        self.buffer.record(self.books[0].pk, 3)
+        with mock.patch.object(Book.objects, 'filter', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.pending(self.books[0].pk), 3)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.view_counts()[0], 3)
+
+    def test_idle_buffer_flushes_on_a_timer(self):
+        buffer = ViewCountBuffer(flush_threshold=100, flush_interval=0.05)
+        flushed = threading.Event()
+        with mock.patch.object(buffer, 'flush', side_effect=lambda: flushed.set()), \
+                mock.patch('BookManager.counters.connections'):
+            buffer.record(self.books[0].pk)
+            self.assertTrue(flushed.wait(5))
+            # Park the timer thread before the real flush is restored
+            buffer.flush_interval = 3600
+            time.sleep(0.1)
+
+    def test_detail_page_shows_buffered_views(self):
+        Book.objects.filter(pk=self.books[0].pk).update(view_count=10)
+        url = reverse('BookManager:book_detail', args=[self.books[0].pk])
+        with mock.patch('BookManager.views.view_counts', self.buffer):
+            self.client.get(url)
+            response = self.client.get(url)
+        self.assertEqual(response.context['book'].view_count, 12)
+        self.assertEqual(self.view_counts()[0], 10)
+
+
+class FakeMxResolver:
+    def __init__(self, answers):
+        self.answers = answers
+        self.lookups = []
+
+    def has_mx(self, domain):
+        self.lookups.append(domain)
+        answer = self.answers[domain]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+class EmailDomainTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.resolver = FakeMxResolver({
+            'example.org': True,
+            'typo.invalid': False,
+            'slow.example': email_domains.DomainLookupError('timed out'),
+        })
+        patcher = mock.patch.object(email_domains, 'get_resolver', return_value=self.resolver)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_common_domains_skip_the_lookup(self):
+        self.assertTrue(email_domains.is_deliverable_domain('Gmail.com.'))
+        self.assertEqual(self.resolver.lookups, [])
+
+    def test_verdicts_are_cached(self):
+        for _ in range(2):
+            self.assertTrue(email_domains.is_deliverable_domain('example.org'))
+            self.assertFalse(email_domains.is_deliverable_domain('typo.invalid'))
+        self.assertEqual(self.resolver.lookups, ['example.org', 'typo.invalid'])
+
+    def test_failed_lookups_accept_and_are_retried(self):
+        self.assertTrue(email_domains.is_deliverable_domain('slow.example'))
+        self.assertTrue(email_domains.is_deliverable_domain('slow.example'))
+        self.assertEqual(self.resolver.lookups, ['slow.example'] * 2)
+
+    def test_signup_rejects_domains_without_mx(self):
+        password = 'a-long-password-1'
+        data = {'username': 'newcomer', 'password1': password, 'password2': password}
+        self.assertTrue(SignUpForm(dict(data, email='reader@example.org')).is_valid())
+        form = SignUpForm(dict(data, email='reader@typo.invalid'))
+        self.assertFalse(form.is_valid())
+        self.assertIn('typo.invalid', form.errors['email'][0])
+
+
+@override_settings(OTP=dict(settings.OTP, MODE='totp', WINDOW=1, EXPIRED_LOOKBACK=5))
+class TotpTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        patcher = mock.patch.object(otp, '_current_step', return_value=1000)
+        self.step = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_codes_are_single_use_and_write_no_rows(self):
+        code = otp.issue_otp(self.user, otp.VERIFY_EMAIL)
+        self.assertEqual(len(code), 6)
+        self.assertEqual(otp.verify_otp(self.user, code, otp.VERIFY_EMAIL), otp.VALID)
+        self.assertEqual(otp.verify_otp(self.user, code, otp.VERIFY_EMAIL), otp.INVALID)
+        self.assertFalse(OtpToken.objects.exists())
+
+    def test_window_then_expiry(self):
+        code = otp.issue_otp(self.user, otp.VERIFY_EMAIL)
+        self.step.return_value = 1003
+        self.assertEqual(otp.verify_otp(self.user, code, otp.VERIFY_EMAIL), otp.EXPIRED)
+        self.step.return_value = 1001
+        self.assertEqual(otp.verify_otp(self.user, code, otp.VERIFY_EMAIL), otp.VALID)
+
+    def test_codes_are_bound_to_purpose_and_password(self):
+        code = otp.issue_otp(self.user, otp.RESET_PASSWORD)
+        self.assertEqual(otp.verify_otp(self.user, code, otp.VERIFY_EMAIL), otp.INVALID)
+        self.user.set_password('changed')
+        self.assertEqual(otp.verify_otp(self.user, code, otp.RESET_PASSWORD), otp.INVALID)
+        self.assertEqual(otp.verify_otp(self.user, '', otp.RESET_PASSWORD), otp.INVALID)
+
+
+@override_settings(OTP=dict(settings.OTP, MODE='token'))
+class OtpTokenTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+
+    def test_tokens_are_consumed_on_verify(self):
+        code = otp.issue_otp(self.user, otp.VERIFY_EMAIL)
+        self.assertEqual(otp.verify_otp(self.user, code, otp.VERIFY_EMAIL), otp.VALID)
+        self.assertFalse(OtpToken.objects.exists())
+        self.assertEqual(otp.verify_otp(self.user, code, otp.VERIFY_EMAIL), otp.INVALID)
+
+    def test_tokens_are_bound_to_purpose(self):
+        reset = otp.issue_otp(self.user, otp.RESET_PASSWORD)
+        self.assertEqual(otp.verify_otp(self.user, reset, otp.VERIFY_EMAIL), otp.INVALID)
+        verify = otp.issue_otp(self.user, otp.VERIFY_EMAIL)
+        self.assertEqual(otp.verify_otp(self.user, verify, otp.RESET_PASSWORD), otp.INVALID)
+        self.assertEqual(otp.verify_otp(self.user, reset, otp.RESET_PASSWORD), otp.VALID)
+        self.assertEqual(otp.verify_otp(self.user, verify, otp.VERIFY_EMAIL), otp.VALID)
+
+    def test_expired_tokens_are_reported_and_kept(self):
+        code = otp.issue_otp(self.user, otp.VERIFY_EMAIL)
+        OtpToken.objects.update(expires=timezone.now() - timezone.timedelta(seconds=1))
+        self.assertEqual(otp.verify_otp(self.user, code, otp.VERIFY_EMAIL), otp.EXPIRED)
+        self.assertTrue(OtpToken.objects.exists())
+
+    def test_purge_deletes_expired_tokens_in_batches(self):
+        now = timezone.now()
+        for minutes in (-300, -200, -120, -30, 5):
+            OtpToken.objects.create(user=self.user, expires=now + timezone.timedelta(minutes=minutes))
+        legacy = OtpToken.objects.create(user=self.user)
+        OtpToken.objects.filter(pk=legacy.pk).update(created=now - timezone.timedelta(days=1))
+        out = StringIO()
+        call_command('purge_expired_otp_tokens', batch_size=2, stdout=out)
+        self.assertIn('Deleted 4 expired OTP tokens in 2 batches', out.getvalue())
+        self.assertEqual(OtpToken.objects.count(), 2)
+        self.assertFalse(OtpToken.objects.filter(expires__lt=now - timezone.timedelta(hours=1)).exists())
+
+
+class AdminChangelistTests(BookHubTestCase):
+    CHANGELISTS = ('userprofile', 'readingnote', 'otptoken', 'bookthemedassociation')
+
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin)
+        self.theme = Theme.objects.create(name='Climate', tagline='t', why_now='w')
+        self.rows = 0
+
+    def add_rows(self, count):
+        for n in range(self.rows, self.rows + count):
+            user = make_user(f'user{n}')
+            book = make_book(n, title=f'Volume {n}')
+            ReadingNote.objects.create(user=user, book=book, note='n')
+            OtpToken.objects.create(user=user, expires=timezone.now())
+            BookThemedAssociation.objects.create(theme=self.theme, book=book)
+        self.rows += count
+
+    def changelist_queries(self, model):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:BookManager_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_rows(2)
+        few = {model: self.changelist_queries(model) for model in self.CHANGELISTS}
+        self.add_rows(8)
+        many = {model: self.changelist_queries(model) for model in self.CHANGELISTS}
+        self.assertEqual(few, many)
+
+    def test_search_uses_the_full_text_index(self):
+        self.add_rows(3)
+        response = self.client.get(reverse('admin:BookManager_readingnote_changelist'), {'q': 'volume 1'})
+        self.assertEqual([note.book.title for note in response.context['cl'].result_list], ['Volume 1'])
+
+    def test_user_search_matches_prefixes(self):
+        self.add_rows(3)
+        for model in ('readingnote', 'userprofile', 'otptoken'):
+            response = self.client.get(reverse(f'admin:BookManager_{model}_changelist'), {'q': 'USER1'})
+            self.assertEqual([row.user.username for row in response.context['cl'].result_list], ['user1'])
+
+    def test_paginator_counts_exactly_without_an_estimate(self):
+        self.add_rows(3)
+        queryset = ReadingNote.objects.all()
+        self.assertIsNone(estimate_row_count(queryset))
+        self.assertEqual(EstimatedCountPaginator(queryset.order_by('pk'), 2).count, 3)
+
+
+class ReadersAlsoLikedTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = [make_book(n) for n in range(5)]
+        a, b, c, d, _ = self.books
+        self.readers = [make_user(f'reader{n}').profile for n in range(3)]
+        self.readers[0].favorite_books.add(a, b)
+        self.readers[1].favorite_books.add(a, b)
+        self.readers[1].reading_list.add(c)
+        self.readers[2].books_read.add(c, d)
+
+    def titles(self, book):
+        return [neighbor.title for neighbor in readers_also_liked(book)]
+
+    def test_ranks_books_shelved_together(self):
+        build = build_neighbors()
+        self.assertTrue(build.full)
+        self.assertEqual(build.books_updated, 4)
+        self.assertEqual(self.titles(self.books[0]), ['Book 1', 'Book 2'])
+        self.assertEqual(self.titles(self.books[3]), ['Book 2'])
+        self.assertEqual(self.titles(self.books[4]), [])
+
+    def test_incremental_build_recomputes_changed_books_only(self):
+        build_neighbors()
+        self.readers[2].favorite_books.add(self.books[4])
+        build = build_neighbors()
+        self.assertFalse(build.full)
+        # The changed reader's books are recomputed; Book 0 and Book 1 are not
+        self.assertEqual(build.books_updated, 3)
+        self.assertEqual(self.titles(self.books[4]), ['Book 3', 'Book 2'])
+        self.assertIn('Book 4', self.titles(self.books[3]))
+
+    def test_detail_page_reads_precomputed_neighbors(self):
+        build_neighbors()
+        response = self.client.get(reverse('BookManager:book_detail', args=[self.books[0].pk]))
+        self.assertEqual([book.title for book in response.context['also_liked']], ['Book 1', 'Book 2'])
+
+
+class ExportTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = make_user('staff', is_staff=True)
+        self.client.force_login(self.staff)
+        self.books = [make_book(n, title=f'Book, "{n}"') for n in range(3)]
+        self.staff.profile.reading_list.add(self.books[0])
+        self.staff.profile.books_read.add(*self.books[1:])
+        ReadingNote.objects.create(user=self.staff, book=self.books[0], note='line one\nline two')
+
+    def export(self, dataset, **params):
+        response = self.client.get(reverse('BookManager:export_data', args=[dataset]), params)
+        if not response.streaming:
+            return response, response.content
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_round_trips(self):
+        response, body = self.export('books')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([row['title'] for row in rows], [book.title for book in self.books])
+
+    def test_gzip_ndjson_shelves(self):
+        response, body = self.export('shelves', format='ndjson', gzip='1')
+        self.assertIn('bookhub-shelves.ndjson.gz', response['Content-Disposition'])
+        rows = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+        self.assertEqual(
+            sorted((row['shelf'], row['book_google_books_id']) for row in rows),
+            [('books_read', 'vol1'), ('books_read', 'vol2'), ('reading_list', 'vol0')],
+        )
+
+    def test_incremental_filter(self):
+        old = timezone.now() - timezone.timedelta(days=3)
+        Book.objects.filter(pk=self.books[0].pk).update(updated=old)
+        since = (timezone.now() - timezone.timedelta(days=1)).date().isoformat()
+        _, body = self.export('books', format='ndjson', updated__gte=since)
+        ids = [json.loads(line)['google_books_id'] for line in body.splitlines()]
+        self.assertEqual(ids, ['vol1', 'vol2'])
+        response, _ = self.export('books', updated__gte='yesterday')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rows_are_streamed_in_blocks(self):
+        with self.settings(EXPORT=dict(settings.EXPORT, BLOCK_SIZE=64)):
+            blocks = list(exports.stream_export('notes', chunk_size=1))
+        self.assertGreater(len(blocks), 1)
+        rows = list(csv.reader(io.StringIO(b''.join(blocks).decode())))
+        self.assertEqual(rows[1][rows[0].index('note')], 'line one\nline two')
+
+    def test_staff_only(self):
+        self.client.force_login(make_user('reader'))
+        response = self.client.get(reverse('BookManager:export_data', args=['books']))
+        self.assertEqual(response.status_code, 403)
+
+
+class RefreshBooksTests(BookHubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = [
+            make_book(n, authors='Old Author', description=f'Old description {n}') for n in range(4)
+        ]
+        self.fresh = make_book(9)
+        self.ages = {book.pk: 40 + book.pk for book in self.books}
+        for pk, days in self.ages.items():
+            Book.objects.filter(pk=pk).update(updated=timezone.now() - timezone.timedelta(days=days))
+        self.requested = []
+
+    def refresh(self, items, **options):
+        async def fetch_volumes(volume_ids, **kwargs):
+            self.requested.extend(volume_ids)
+            return {volume_id: items.get(volume_id) for volume_id in volume_ids}
+
+        with mock.patch('BookManager.refresh.fetch_volumes', fetch_volumes):
+            return refresh_books(**options)
+
+    def test_applies_changes_and_keeps_missing_fields(self):
+        result = self.refresh({
+            'vol0': volume(0, title='Book 0', authors=['New Author']),
+            'vol1': volume(1, title='Renamed', description=''),
+            'vol2': {},
+            'vol3': None,
+        })
+        self.assertEqual(result, (3, 2, 1))
+        self.assertNotIn(self.fresh.google_books_id, self.requested)
+        first, second, gone, failed = Book.objects.filter(pk__in=self.ages).order_by('pk')
+        self.assertEqual((first.authors, first.description), ('New Author', 'Old description 0'))
+        self.assertEqual(
+            (second.title, second.slug, second.description), ('Renamed', 'renamed', 'Old description 1')
+        )
+        self.assertEqual(gone.title, 'Book 2')
+        # Checked books move to the back of the queue; the failed one is retried next run
+        self.assertGreater(gone.updated, timezone.now() - timezone.timedelta(minutes=1))
+        self.assertLess(failed.updated, timezone.now() - timezone.timedelta(days=30))
+
+    def test_picks_the_stalest_books_first(self):
+        self.refresh({}, limit=2)
+        self.assertEqual(self.requested, ['vol3', 'vol2'])
@@ -9,11 +9,18 @@ urlpatterns = [
     
     # Book views
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
+    path('cover/<int:book_id>/<int:width>/', views.book_cover, name='book_cover'),
     path('toggle-favorite/<int:book_id>/', views.toggle_favorite, name='toggle_favorite'),
     path('toggle-reading-list/<int:book_id>/', views.toggle_reading_list, name='toggle_reading_list'),
     path('toggle-read-status/<int:book_id>/', views.toggle_read_status, name='toggle_read_status'),
+    path('shelves/batch/', views.batch_shelf_update, name='batch_shelf_update'),
+    
+    # Themes
+    path('themes/', views.theme_list, name='theme_list'),
+    path('themes/<slug:slug>/', views.theme_detail, name='theme_detail'),
     
     # Reading notes
+    path('book/<int:book_id>/notes/', views.public_notes, name='public_notes'),
     path('book/<int:book_id>/add-note/', views.add_reading_note, name='add_reading_note'),
     path('note/<int:note_id>/edit/', views.edit_reading_note, name='edit_reading_note'),
     path('note/<int:note_id>/delete/', views.delete_reading_note, name='delete_reading_note'),
@@ -29,9 +36,12 @@ urlpatterns = [
     
     # Profile
     path('profile/', views.profile, name='profile'),
+    path('profile/notes/', views.profile_notes_page, name='profile_notes_page'),
+    path('profile/shelf/<str:shelf>/', views.profile_shelf_page, name='profile_shelf_page'),
     path('profile_edit/', views.profile_edit, name='profile_edit'),
     
     # Admin
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('toggle-featured/\u003cint:book_id\u003e/', views.toggle_featured, name='toggle_featured'),
+    path('admin-dashboard/export/<str:dataset>/', views.export_data, name='export_data'),
 ]
@@ -1,7 +1,11 @@
+import asyncio
 import secrets
-import requests
-import os
 from django.conf import settings
+from django.db import connections
+from .cache import ResponseCache
+from .google_books import GoogleBooksError, get_client
+
+_books_cache = None
 
 
 def generate_otp():
@@ -9,26 +13,148 @@ def generate_otp():
     return str(secrets.randbelow(10**6)).zfill(6)
 
 
-def fetch_books(query='science fiction', max_results=10):
+def get_books_cache():
+    """Return the shared Google Books response cache, creating it on first use."""
+    global _books_cache
+    if _books_cache is None:
+        config = settings.GOOGLE_BOOKS_CACHE
+        _books_cache = ResponseCache(
+            'google-books',
+            max_entries=config['MAX_ENTRIES'],
+            ttl=config['TTL'],
+            stale_ttl=config['STALE_TTL'],
+            shared_alias=config['SHARED_ALIAS'],
+        )
+    return _books_cache
+
+
+def _in_worker(func, *args):
+    """
+    Call ``func`` from a worker thread, then close the thread's DB connections.
+
+    Executor threads outlive the call, so connections opened by quota
+    counting or ingest would otherwise stay open for the thread's lifetime.
     """
-    Fetch books from Google Books API.
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+def books_cache_key(query, max_results, start_index=0):
+    """Build a cache key from the normalized query, result count and offset."""
+    normalized = ' '.join(query.lower().split())
+    return f"{normalized}|{max_results}|{start_index}"
+
+
+def fetch_books(query='science fiction', max_results=10, start_index=0):
+    """
+    Fetch books from Google Books API, served through the response cache.
     
     Args:
         query: Search query string (default: 'science fiction')
         max_results: Maximum number of results to return (default: 10)
+        start_index: Offset of the first result (default: 0)
     
     Returns:
         dict: JSON response from API or None if request fails
     """
-    api_key = os.getenv('GOOGLE_BOOKS_API_KEY')
-    url = (
-        f"https://www.googleapis.com/books/v1/volumes"
-        f"?q={query}&maxResults={max_results}&key={api_key}"
+    return get_books_cache().get_or_fetch(
+        books_cache_key(query, max_results, start_index),
+        lambda: _request_books(query, max_results, start_index),
     )
+
+
+async def fetch_books_pages(query, max_results, page_size=40, concurrency=4, deadline=8):
+    """
+    Fetch several result pages concurrently and merge them.
+    
+    Pages are requested through ``fetch_books`` in worker threads, at most
+    ``concurrency`` at a time. Pages still outstanding after ``deadline``
+    seconds are abandoned and the results gathered so far are returned.
+    
+    Returns:
+        dict: ``{'items': [...]}`` in page order, deduplicated by volume id
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def fetch_page(start_index):
+        async with semaphore:
+            size = min(page_size, max_results - start_index)
+            return await asyncio.to_thread(_in_worker, fetch_books, query, size, start_index)
     
+    tasks = [
+        asyncio.create_task(fetch_page(start_index))
+        for start_index in range(0, max_results, page_size)
+    ]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    
+    items = []
+    seen = set()
+    for task in tasks:
+        if task not in done or task.exception() is not None:
+            continue
+        data = task.result() or {}
+        for item in data.get('items', []):
+            volume_id = item.get('id')
+            if volume_id and volume_id not in seen:
+                seen.add(volume_id)
+                items.append(item)
+    return {'items': items}
+
+
+async def fetch_volumes(volume_ids, concurrency=4, rate=5.0):
+    """
+    Fetch single volumes concurrently, starting at most ``rate`` requests a second.
+    
+    The rate is shared by all workers, so it bounds the whole run no matter
+    how many requests are in flight.
+    
+    Returns:
+        dict: volume id -> item, ``{}`` for volumes that no longer exist,
+        or None when the request failed
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    interval = 1 / rate if rate else 0
+    next_slot = loop.time()
+    
+    async def fetch(volume_id):
+        nonlocal next_slot
+        async with semaphore:
+            now = loop.time()
+            delay = next_slot - now
+            next_slot = max(next_slot, now) + interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return volume_id, await asyncio.to_thread(_in_worker, _request_volume, volume_id)
+    
+    return dict(await asyncio.gather(*(fetch(volume_id) for volume_id in volume_ids)))
+
+
+def _request_volume(volume_id):
+    """Fetch one volume by id; ``{}`` if it is gone, None on any other failure."""
+    try:
+        return get_client().volume(volume_id)
+    except GoogleBooksError:
+        return None
+
+
+def _request_books(query, max_results, start_index=0):
+    """
+    Call the Google Books API directly, bypassing the cache.
+
+    Searches run while a user waits, so retries stop at the client's
+    INTERACTIVE_DEADLINE instead of using the full retry schedule.
+    """
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException:
+        return get_client().search(
+            query,
+            max_results=max_results,
+            start_index=start_index,
+            deadline=settings.GOOGLE_BOOKS_API['INTERACTIVE_DEADLINE'],
+        )
+    except GoogleBooksError:
         return None
\ No newline at end of file
@@ -1,17 +1,35 @@
+import hashlib
+import json
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth import get_user_model
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
-from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.db.models import Q
+from django.http import JsonResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.db import transaction
+from django.db.models import Q, Count
 from .forms import SignUpForm, UserProfileForm, ReadingNoteForm
-from .models import OtpToken, UserProfile, Book, ReadingNote
-from .utils import fetch_books
+from .models import UserProfile, Book, ReadingNote, Theme, cache_version
+from .utils import fetch_books, fetch_books_pages, get_books_cache
+from .google_books import get_client
+from .ingest import ingest_volumes
+from .search import search_books, has_enough_results
+from .counters import view_counts
+from .outbox import queue_email
+from . import otp
+from .otp import issue_otp, verify_otp
+from .stats import get_site_stats, stats_are_stale
+from .pagination import InvalidCursor, clean_cursor_values, decode_cursor, encode_cursor, keyset_page
+from .recommendations import readers_also_liked
+from .content_index import rerank, similar_books
+from .covers import CoverUnavailable, can_proxy, cover_digest, get_cover
+from .exports import DATASETS, FORMATS, export_filename, parse_since, stream_export
 
 
 def home(request):
@@ -36,149 +54,67 @@ def home(request):
             user=request.user
         ).select_related('book').order_by('-created')[:4]
         
-        # Reading list count for quick actions
-        reading_list_count = profile.reading_list.count()
-        
         context.update({
             'continue_reading_book': continue_reading_book,
             'recent_notes': recent_notes,
-            'reading_list_count': reading_list_count,
+            'reading_list_count': profile.reading_list_count,
         })
         
-        data = fetch_books()
+        limit = 10
     else:
-        data = fetch_books(max_results=9)
+        limit = 9
     
+    data = fetch_books(max_results=limit)
     books = []
-    
     if data and 'items' in data:
-        for item in data.get('items', []):
-            volume_info = item.get('volumeInfo', {})
-            book_id = item.get('id', '')
-            
-            if not book_id:
-                continue
-            
-            title = volume_info.get('title', 'Unknown')
-            authors = ', '.join(volume_info.get('authors', []))
-            description = volume_info.get('description', 'No description available')
-            published_date = volume_info.get('publishedDate', '')
-            page_count = volume_info.get('pageCount')
-            categories = ', '.join(volume_info.get('categories', []))
-            
-            image_links = volume_info.get('imageLinks', {})
-            cover_image = (
-                image_links.get('extraLarge', '')
-                or image_links.get('large', '')
-                or image_links.get('medium', '')
-                or image_links.get('small', '')
-                or image_links.get('thumbnail', '')
-                or image_links.get('smallThumbnail', '')
-            )
-            if cover_image and 'zoom=1' in cover_image:
-                cover_image = cover_image.replace('zoom=1', 'zoom=0')
-            if cover_image and cover_image.startswith('http://'):
-                cover_image = cover_image.replace('http://', 'https://', 1)
-            
-            # Extract links
-            info_link = volume_info.get('infoLink', '')
-            preview_link = volume_info.get('previewLink', '')
-            
-            # Create or get book
-            book, created = Book.objects.get_or_create(
-                google_books_id=book_id,
-                defaults={
-                    'title': title,
-                    'authors': authors,
-                    'description': description,
-                    'published_date': published_date,
-                    'cover_image': cover_image,
-                    'info_link': info_link,
-                    'preview_link': preview_link,
-                    'page_count': page_count,
-                    'categories': categories,
-                }
-            )
-            if cover_image and (not book.cover_image or 'zoom=1' in (book.cover_image or '')):
-                book.cover_image = cover_image
-                book.save(update_fields=['cover_image'])
-            books.append(book)
+        books = ingest_volumes(data['items'])
+    if not books:
+        # Google Books is down or the circuit breaker is open: show local picks
+        books = list(Book.objects.order_by('-is_featured', '-view_count', '-id')[:limit])
     
     context['books'] = books
     return render(request, 'home.html', context)
 
-def search(request):
-    """Search books from Google Books API and display results."""
+async def search(request):
+    """Search the local catalog, falling back to Google Books when recall is low."""
     q = request.GET.get('q', '').strip()
     books = []
 
     if q:
-        data = fetch_books(query=q, max_results=24)
-
-        if data and 'items' in data:
-            for item in data.get('items', []):
-                volume_info = item.get('volumeInfo', {})
-                book_id = item.get('id', '')
-
-                if not book_id:
-                    continue
-
-                title = volume_info.get('title', 'Unknown')
-                authors = ', '.join(volume_info.get('authors', []))
-                description = volume_info.get('description', 'No description available')
-                published_date = volume_info.get('publishedDate', '')
-                page_count = volume_info.get('pageCount')
-                categories = ', '.join(volume_info.get('categories', []))
-
-                image_links = volume_info.get('imageLinks', {})
-                cover_image = (
-                    image_links.get('extraLarge', '')
-                    or image_links.get('large', '')
-                    or image_links.get('medium', '')
-                    or image_links.get('small', '')
-                    or image_links.get('thumbnail', '')
-                    or image_links.get('smallThumbnail', '')
-                )
-                if cover_image and 'zoom=1' in cover_image:
-                    cover_image = cover_image.replace('zoom=1', 'zoom=0')
-                if cover_image and cover_image.startswith('http://'):
-                    cover_image = cover_image.replace('http://', 'https://', 1)
-
-                info_link = volume_info.get('infoLink', '')
-                preview_link = volume_info.get('previewLink', '')
-
-                book, _created = Book.objects.get_or_create(
-                    google_books_id=book_id,
-                    defaults={
-                        'title': title,
-                        'authors': authors,
-                        'description': description,
-                        'published_date': published_date,
-                        'cover_image': cover_image,
-                        'info_link': info_link,
-                        'preview_link': preview_link,
-                        'page_count': page_count,
-                        'categories': categories,
-                    }
-                )
-                if cover_image and (not book.cover_image or 'zoom=1' in (book.cover_image or '')):
-                    book.cover_image = cover_image
-                    book.save(update_fields=['cover_image'])
-                books.append(book)
+        config = settings.GOOGLE_BOOKS_SEARCH
+        books = await sync_to_async(search_books)(q, limit=config['MAX_RESULTS'])
+
+        # Skip the API outright while the circuit breaker is open
+        if not has_enough_results(books) and get_client().available():
+            data = await fetch_books_pages(
+                q,
+                max_results=config['MAX_RESULTS'],
+                page_size=config['PAGE_SIZE'],
+                concurrency=config['CONCURRENCY'],
+                deadline=config['DEADLINE'],
+            )
+
+            if data['items']:
+                # Local hits keep their place ahead of the API's results
+                fetched = await sync_to_async(ingest_volumes)(data['items'])
+                seen = {book.pk for book in books}
+                books = books + [book for book in fetched if book.pk not in seen]
+
+        books = (await sync_to_async(rerank)(q, books))[:config['MAX_RESULTS']]
 
     context = {
         'q': q,
         'books': books,
     }
-    return render(request, 'search_results.html', context)
+    return await sync_to_async(render)(request, 'search_results.html', context)
 
 
 def book_detail(request, book_id):
     """Display detailed information about a book."""
     book = get_object_or_404(Book, id=book_id)
     
-    book.view_count += 1
-    book.save(update_fields=['view_count'])
+    view_counts.record(book.id)
+    book.view_count += view_counts.pending(book.id)
     
     preview_embed_url = None
     if book.google_books_id and book.preview_link:
@@ -195,19 +131,25 @@ def book_detail(request, book_id):
     is_read = False
     user_notes = []
     public_notes = []
+    public_notes_cursor = None
     
     if request.user.is_authenticated:
         profile = request.user.profile
         is_favorite = profile.is_book_favorite(book)
-        in_reading_list = profile.reading_list.filter(id=book.id).exists()
+        in_reading_list = profile.is_book_in_reading_list(book)
         is_read = profile.is_book_read(book)
         
-        user_notes = ReadingNote.objects.filter(user=request.user, book=book).order_by('-created')
+        user_notes = list(
+            ReadingNote.objects.filter(user=request.user, book=book).order_by('-created')
+        )
         
-        public_notes = ReadingNote.objects.filter(
-            book=book,
-            is_public=True
-        ).exclude(user=request.user).order_by('-created')[:10]
+        # The viewer's own notes are listed above, so leave them out of the feed
+        owns_public = any(note.is_public for note in user_notes)
+        page = _public_notes_page(book.id, exclude_user=request.user if owns_public else None)
+        public_notes = page['notes']
+        public_notes_cursor = page['next_cursor']
+    
+    also_liked = readers_also_liked(book)
     
     context = {
         'book': book,
@@ -216,12 +158,140 @@ def book_detail(request, book_id):
         'is_read': is_read,
         'user_notes': user_notes,
         'public_notes': public_notes,
+        'public_notes_cursor': public_notes_cursor,
+        'also_liked': also_liked,
+        'similar': [other for other in similar_books(book) if other not in also_liked],
         'preview_embed_url': preview_embed_url,
     }
     
     return render(request, 'book_detail.html', context)
 
 
+PUBLIC_NOTE_ORDERING = ['-created', '-id']
+
+
+def _public_notes_page(book_id, cursor=None, exclude_user=None):
+    """
+    Return one keyset page of a book's public notes as a JSON-ready dict.
+
+    Pages are cached under the book's public notes version, which the
+    ReadingNote signals bump on every save or delete, and keyed by the
+    validated cursor values rather than the raw cursor string. Pages that
+    leave out ``exclude_user``'s notes are built per request instead; only
+    viewers with public notes of their own on the book need them.
+    """
+    config = settings.PUBLIC_NOTES
+    if cursor:
+        cursor = encode_cursor(
+            clean_cursor_values(ReadingNote, PUBLIC_NOTE_ORDERING, decode_cursor(cursor))
+        )
+    key = None
+    if exclude_user is None:
+        version = ReadingNote.public_notes_version(book_id)
+        key = f"public-notes:{book_id}:{version}:{cursor or ''}"
+        page = cache.get(key)
+        if page is not None:
+            return page
+
+    notes = ReadingNote.objects.filter(book_id=book_id, is_public=True).select_related('user')
+    if exclude_user is not None:
+        notes = notes.exclude(user=exclude_user)
+    notes, next_cursor = keyset_page(notes, PUBLIC_NOTE_ORDERING, cursor, config['PAGE_SIZE'])
+    page = {
+        'notes': [
+            {
+                'id': note.id,
+                'user': note.user.username,
+                'note': note.note,
+                'created': note.created,
+            }
+            for note in notes
+        ],
+        'next_cursor': next_cursor,
+    }
+    if key is not None:
+        cache.set(key, page, timeout=config['CACHE_TTL'])
+    return page
+
+
+@login_required
+def public_notes(request, book_id):
+    """Return a page of a book's public notes as JSON."""
+    try:
+        owns_public = ReadingNote.objects.filter(
+            user=request.user, book_id=book_id, is_public=True
+        ).exists()
+        page = _public_notes_page(
+            book_id, request.GET.get('cursor'), exclude_user=request.user if owns_public else None
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    response = JsonResponse(page)
+    patch_cache_control(response, private=True, max_age=settings.PUBLIC_NOTES['MAX_AGE'])
+    return response
+
+
+def _cached_fragment(key, version_key, build):
+    """Return ``build()`` cached under ``key`` for the current value of ``version_key``."""
+    key = f"{key}:{cache_version(version_key)}"
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = build()
+        if fragment is not None:
+            cache.set(key, fragment, timeout=settings.THEME_CACHE_TTL)
+    return fragment
+
+
+def theme_list(request):
+    """Display active curated themes."""
+    def build():
+        themes = Theme.objects.filter(is_active=True).annotate(book_count=Count('book_associations'))
+        return render_to_string('theme_list_content.html', {'themes': themes})
+    
+    content = _cached_fragment('theme-page:index', Theme.INDEX_VERSION_KEY, build)
+    return render(request, 'theme_list.html', {'content': content})
+
+
+def theme_detail(request, slug):
+    """Display a curated theme with its books in curator order."""
+    def build():
+        theme = Theme.objects.filter(slug=slug, is_active=True).first()
+        if theme is None:
+            return None
+        associations = theme.book_associations.select_related('book').order_by('order', '-created')
+        html = render_to_string('theme_detail_content.html', {'theme': theme, 'associations': associations})
+        return {'name': theme.name, 'html': html}
+    
+    page = _cached_fragment(f'theme-page:{slug}', Theme.page_version_key(slug), build)
+    if page is None:
+        raise Http404('Theme not found')
+    return render(request, 'theme_detail.html', {'name': page['name'], 'content': page['html']})
+
+
+def book_cover(request, book_id, width):
+    """Serve a book's cover resized to the requested width bucket."""
+    book = get_object_or_404(Book.objects.only('id', 'cover_image'), id=book_id)
+    if not can_proxy(book.cover_image):
+        if book.cover_image:
+            return redirect(book.cover_image)
+        raise Http404('No cover')
+    try:
+        data = get_cover(book.cover_image, width)
+    except CoverUnavailable:
+        return redirect(book.cover_image)
+    
+    etag = f'"{hashlib.sha1(data).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(data, content_type='image/jpeg')
+    response['ETag'] = etag
+    if request.GET.get('v') == cover_digest(book.cover_image)[:12]:
+        patch_cache_control(response, public=True, max_age=365 * 24 * 3600, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.COVER_PROXY['MAX_AGE'])
+    return response
+
+
 @login_required
 def toggle_favorite(request, book_id):
     """Toggle favorite status for a book."""
@@ -229,7 +299,7 @@ def toggle_favorite(request, book_id):
         book = get_object_or_404(Book, id=book_id)
         profile = request.user.profile
         
-        if profile.is_book_favorite(book):
+        if profile.on_shelf('favorite_books', book.id):
             profile.favorite_books.remove(book)
             is_favorite = False
         else:
@@ -247,7 +317,7 @@ def toggle_reading_list(request, book_id):
         book = get_object_or_404(Book, id=book_id)
         profile = request.user.profile
         
-        if profile.reading_list.filter(id=book.id).exists():
+        if profile.on_shelf('reading_list', book.id):
             profile.reading_list.remove(book)
             in_list = False
         else:
@@ -265,7 +335,7 @@ def toggle_read_status(request, book_id):
         book = get_object_or_404(Book, id=book_id)
         profile = request.user.profile
         
-        if profile.is_book_read(book):
+        if profile.on_shelf('books_read', book.id):
             profile.books_read.remove(book)
             is_read = False
         else:
@@ -276,6 +346,103 @@ def toggle_read_status(request, book_id):
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+# Largest primary key a BigAutoField can hold
+MAX_BOOK_ID = 2 ** 63 - 1
+
+SHELF_ALIASES = {
+    'favorites': 'favorite_books',
+    'reading_list': 'reading_list',
+    'read': 'books_read',
+}
+
+
+def _shelf_state(shelf_ids, book_id):
+    return {
+        'is_favorite': book_id in shelf_ids['favorite_books'],
+        'in_reading_list': book_id in shelf_ids['reading_list'],
+        'is_read': book_id in shelf_ids['books_read'],
+    }
+
+
+@login_required
+def batch_shelf_update(request):
+    """
+    Apply many shelf add/remove/toggle operations in one transaction.
+
+    Expects a JSON body ``{"operations": [...]}``. A book operation is
+    ``{"book_id", "shelf", "op"}`` where ``shelf`` is favorites,
+    reading_list or read and ``op`` is add, remove or toggle. A shelf
+    operation ``{"from_shelf", "shelf", "op"}`` with ``op`` copy or move
+    applies to every book on ``from_shelf``, so whole-shelf actions stay a
+    single operation however long the shelf is. Operations apply in order;
+    each shelf is then written with one bulk add and one bulk remove.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    
+    try:
+        operations = []
+        for op in json.loads(request.body)['operations']:
+            if 'from_shelf' in op:
+                target, actions = SHELF_ALIASES[op['from_shelf']], ('copy', 'move')
+            else:
+                target, actions = int(op['book_id']), ('add', 'remove', 'toggle')
+                if not 0 < target <= MAX_BOOK_ID:
+                    raise ValueError(target)
+            if op['op'] not in actions:
+                raise ValueError(op['op'])
+            operations.append((target, SHELF_ALIASES[op['shelf']], op['op']))
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if len(operations) > settings.SHELF_BATCH_MAX_OPERATIONS:
+        return JsonResponse({'error': 'Too many operations'}, status=400)
+    
+    book_ids = {target for target, _, _ in operations if isinstance(target, int)}
+    existing = set(Book.objects.filter(id__in=book_ids).values_list('id', flat=True))
+    missing = book_ids - existing
+    if missing:
+        return JsonResponse({'error': 'Book not found', 'book_ids': sorted(missing)}, status=404)
+    
+    profile = request.user.profile
+    # Shelf operations reach every book on their source shelves
+    loaded = set(book_ids)
+    for source in {target for target, _, action in operations if action in ('copy', 'move')}:
+        loaded.update(getattr(profile, source).values_list('id', flat=True))
+    current = profile.current_shelf_ids(loaded)
+    current = {shelf: set(ids) for shelf, ids in current.items()}
+    desired = {shelf: set(ids) for shelf, ids in current.items()}
+    touched = set(book_ids)
+    for target, shelf, action in operations:
+        if action in ('copy', 'move'):
+            moved = set(desired[target])
+            desired[shelf] |= moved
+            if action == 'move' and target != shelf:
+                desired[target] -= moved
+            touched |= moved
+        elif action == 'add' or (action == 'toggle' and target not in desired[shelf]):
+            desired[shelf].add(target)
+        else:
+            desired[shelf].discard(target)
+    
+    with transaction.atomic():
+        for shelf in UserProfile.SHELVES:
+            manager = getattr(profile, shelf)
+            to_add = desired[shelf] - current[shelf]
+            to_remove = current[shelf] - desired[shelf]
+            if to_add:
+                manager.add(*to_add)
+            if to_remove:
+                manager.remove(*to_remove)
+    
+    shelf_ids = {shelf: frozenset(ids) for shelf, ids in desired.items()}
+    return JsonResponse({
+        'books': {
+            str(book_id): _shelf_state(shelf_ids, book_id)
+            for book_id in sorted(touched)
+        }
+    })
+
+
 @login_required
 def add_reading_note(request, book_id):
     """Add a reading note to a book."""
@@ -327,35 +494,83 @@ def delete_reading_note(request, note_id):
     return render(request, 'delete_note.html', {'note': note, 'book': note.book})
 
 
+NOTE_ORDERING = ['book__title', '-created', 'id']
+SHELF_ORDERING = ['-id']
+
+
+def _notes_page(user, cursor=None):
+    """Return one keyset page of a user's notes, grouped by book."""
+    from itertools import groupby
+    notes, next_cursor = keyset_page(
+        ReadingNote.objects.filter(user=user).select_related('book'),
+        NOTE_ORDERING,
+        cursor,
+        settings.PROFILE_PAGE_SIZE,
+    )
+    notes_by_book = [
+        {'book': book, 'notes': list(book_notes)}
+        for book, book_notes in groupby(notes, key=lambda x: x.book)
+    ]
+    return notes_by_book, next_cursor
+
+
+def _shelf_page(profile, shelf, cursor=None):
+    """Return one keyset page of books on a shelf, most recently added first."""
+    rows, next_cursor = keyset_page(
+        getattr(UserProfile, shelf).through.objects
+        .filter(userprofile=profile)
+        .select_related('book'),
+        SHELF_ORDERING,
+        cursor,
+        settings.PROFILE_PAGE_SIZE,
+    )
+    return [row.book for row in rows], next_cursor
+
+
 @login_required
 def profile(request):
-    """Display user profile page."""
+    """Display user profile page with the first page of notes and shelves."""
     user_profile = request.user.profile
     
-    notes_count = ReadingNote.objects.filter(user=request.user).count()
-    
-    from itertools import groupby
-    all_notes = ReadingNote.objects.filter(
-        user=request.user
-    ).select_related('book').order_by('book__title', '-created')
-    
-    notes_by_book = []
-    for book, notes in groupby(all_notes, key=lambda x: x.book):
-        notes_by_book.append({
-            'book': book,
-            'notes': list(notes)
-        })
+    notes_by_book, notes_cursor = _notes_page(request.user)
     
     context = {
         'profile': user_profile,
-        'favorite_books': user_profile.favorite_books.all(),
-        'books_read': user_profile.books_read.all(),
-        'reading_list': user_profile.reading_list.all(),
-        'notes_count': notes_count,
+        'notes_count': user_profile.notes_count,
         'notes_by_book': notes_by_book,
+        'notes_cursor': notes_cursor,
     }
+    for shelf in UserProfile.SHELVES:
+        books, cursor = _shelf_page(user_profile, shelf)
+        context[shelf] = books
+        context[f'{shelf}_cursor'] = cursor
+        context[f'{shelf}_count'] = getattr(user_profile, f'{shelf}_count')
     return render(request, 'profile.html', context)
 
+
+@login_required
+def profile_notes_page(request):
+    """Return the next page of the user's notes as an HTML fragment."""
+    try:
+        notes_by_book, next_cursor = _notes_page(request.user, request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    html = render_to_string('profile_notes_page.html', {'notes_by_book': notes_by_book}, request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+
+@login_required
+def profile_shelf_page(request, shelf):
+    """Return the next page of books on one of the user's shelves as an HTML fragment."""
+    if shelf not in UserProfile.SHELVES:
+        return JsonResponse({'error': 'Unknown shelf'}, status=404)
+    try:
+        books, next_cursor = _shelf_page(request.user.profile, shelf, request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    html = render_to_string('profile_shelf_page.html', {'books': books, 'shelf': shelf}, request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
 @login_required
 @login_required
 def profile_edit(request):
@@ -400,25 +615,19 @@ def verify_email(request, username):
     """Handle email verification with OTP."""
     try:
         user = get_user_model().objects.get(username=username)
-        user_otp = OtpToken.objects.filter(user=user).last()
-        
-        if not user_otp:
-            messages.error(request, "No OTP found. Please request a new one.")
-            return redirect('BookManager:resend_otp')
         
         if request.method == "POST":
-            otp_code = request.POST.get('otp_code', '').strip()
+            result = verify_otp(user, request.POST.get('otp_code', ''), otp.VERIFY_EMAIL)
             
-            if user_otp.otp_code == otp_code:
-                if user_otp.expires and user_otp.expires > timezone.now():
-                    user.is_active = True
-                    user.is_verified = True
-                    user.save()
-                    messages.success(request, "Email verified successfully! You can now login.")
-                    return redirect('BookManager:signin')
-                else:
-                    messages.warning(request, "OTP has expired. Please request a new OTP.")
-                    return redirect('BookManager:resend_otp')
+            if result == otp.VALID:
+                user.is_active = True
+                user.is_verified = True
+                user.save()
+                messages.success(request, "Email verified successfully! You can now login.")
+                return redirect('BookManager:signin')
+            elif result == otp.EXPIRED:
+                messages.warning(request, "OTP has expired. Please request a new OTP.")
+                return redirect('BookManager:resend_otp')
             else:
                 messages.warning(request, "Invalid OTP. Please try again.")
         
@@ -434,22 +643,16 @@ def resend_otp(request):
         
         try:
             user = get_user_model().objects.get(email=user_email)
-            otp = OtpToken.objects.create(
-                user=user,
-                expires=timezone.now() + timezone.timedelta(minutes=2)
-            )
+            otp_code = issue_otp(user, otp.VERIFY_EMAIL)
             
             subject = "Email Verification"
             message = (
                 f"Hello {user.username},\n\n"
-                f"Your OTP is {otp.otp_code}\n"
+                f"Your OTP is {otp_code}\n"
                 f"It expires in 2 minutes. Use the URL below to verify your email:\n\n"
                 f"http://127.0.0.1:8000/verify_email/{user.username}"
             )
-            sender = settings.EMAIL_HOST_USER
-            receiver = [user.email]
-            
-            send_mail(subject, message, sender, receiver, fail_silently=False)
+            queue_email(subject, message, [user.email], eager=True)
             messages.success(request, "A new OTP has been sent to your email.")
             return redirect('BookManager:verify_email', username=user.username)
         except get_user_model().DoesNotExist:
@@ -491,22 +694,16 @@ def forgot_password(request):
             
             try:
                 user = get_user_model().objects.get(email=user_email)
-                otp = OtpToken.objects.create(
-                    user=user,
-                    expires=timezone.now() + timezone.timedelta(minutes=2)
-                )
+                otp_code = issue_otp(user, otp.RESET_PASSWORD)
                 
                 subject = "Password Reset"
                 message = (
                     f"Hello {user.username},\n\n"
-                    f"Your OTP is {otp.otp_code}\n"
+                    f"Your OTP is {otp_code}\n"
                     f"It expires in 2 minutes. Use the URL below to reset your password:\n\n"
                     f"http://127.0.0.1:8000/reset_password/{user.username}"
                 )
-                sender = settings.EMAIL_HOST_USER
-                receiver = [user.email]
-                
-                send_mail(subject, message, sender, receiver, fail_silently=False)
+                queue_email(subject, message, [user.email], eager=True)
                 messages.success(request, "Password reset email sent successfully.")
                 return redirect('BookManager:reset_password', username=user.username)
             except get_user_model().DoesNotExist:
@@ -538,19 +735,20 @@ def reset_password(request, username):
                 messages.error(request, "Passwords do not match.")
                 return render(request, 'reset_password.html', {'username': username})
             
-            otp = OtpToken.objects.get(user=user, otp_code=otp_code)
+            result = verify_otp(user, otp_code, otp.RESET_PASSWORD)
             
-            if not otp.expires or otp.expires < timezone.now():
+            if result == otp.EXPIRED:
                 messages.error(request, "OTP has expired. Please request a new one.")
                 return redirect('BookManager:forgot_password')
+            if result != otp.VALID:
+                messages.error(request, "Invalid OTP code.")
+                return render(request, 'reset_password.html', {'username': username})
             
             user.set_password(new_password)
             user.save()
             messages.success(request, "Password has been reset successfully. Please login.")
             return redirect('BookManager:signin')
             
-        except OtpToken.DoesNotExist:
-            messages.error(request, "Invalid OTP code.")
         except Exception as e:
             messages.error(request, "An unexpected error occurred. Please try again.")
     
@@ -575,13 +773,10 @@ def admin_dashboard(request):
         messages.error(request, "You don't have permission to access this page.")
         return redirect('BookManager:home')
     
-    from django.db.models import Count
+    stats = get_site_stats()
     
-    total_users = get_user_model().objects.count()
-    total_books = Book.objects.count()
-    total_notes = ReadingNote.objects.count()
-    featured_books = Book.objects.filter(is_featured=True).count()
-    curated_books = Book.objects.filter(is_curated=True).count()
+    # Apply this worker's buffered views now; other workers flush on their timers
+    view_counts.flush()
     
     recent_users = get_user_model().objects.order_by('-date_joined')[:5]
     recent_notes = ReadingNote.objects.select_related('user', 'book').order_by('-created')[:10]
@@ -592,15 +787,21 @@ def admin_dashboard(request):
     ).order_by('-view_count')[:10]
     
     context = {
-        'total_users': total_users,
-        'total_books': total_books,
-        'total_notes': total_notes,
-        'featured_books': featured_books,
-        'curated_books': curated_books,
+        'total_users': stats.total_users,
+        'total_books': stats.total_books,
+        'total_notes': stats.total_notes,
+        'featured_books': stats.featured_books,
+        'curated_books': stats.curated_books,
+        'stats_refreshed_at': stats.refreshed_at,
+        'stats_stale': stats_are_stale(stats),
         'recent_users': recent_users,
         'recent_notes': recent_notes,
         'popular_books': popular_books,
         'suggested_books': suggested_books,
+        'books_cache_stats': get_books_cache().stats(),
+        'books_api_quota': get_client().quota_usage(),
+        'books_api_daily_quota': settings.GOOGLE_BOOKS_API['DAILY_QUOTA'],
+        'books_api_circuit': get_client().breaker.state,
     }
     
     return render(request, 'admin_dashboard.html', context)
@@ -615,7 +816,35 @@ def toggle_featured(request, book_id):
     if request.method == 'POST':
         book = get_object_or_404(Book, id=book_id)
         book.is_featured = not book.is_featured
-        book.save()
+        book.save(update_fields=['is_featured', 'updated'])
         return JsonResponse({'is_featured': book.is_featured})
     
-    return JsonResponse({'error': 'Invalid request'}, status=400)
\ No newline at end of file
+    return JsonResponse({'error': 'Invalid request'}, status=400)
+
+
+@login_required
+def export_data(request, dataset):
+    """Stream books, notes or shelves as CSV or NDJSON (admin only)."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    format = request.GET.get('format', 'csv')
+    if dataset not in DATASETS or format not in FORMATS:
+        raise Http404
+    since = request.GET.get('updated__gte')
+    if since:
+        try:
+            since = parse_since(since)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+    compress = request.GET.get('gzip') == '1'
+
+    response = StreamingHttpResponse(
+        stream_export(dataset, format, since, compress),
+        content_type='application/gzip' if compress else FORMATS[format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export_filename(dataset, format, compress)}"'
+    )
+    patch_cache_control(response, private=True, no_store=True)
+    return response
\ No newline at end of file
@@ -9,3 +9,6 @@ python manage.py collectstatic --no-input
 
 # Run migrations
 python manage.py migrate
+
+# Create the database cache table (unused when REDIS_URL is set)
+python manage.py createcachetable